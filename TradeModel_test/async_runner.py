@@ -0,0 +1,131 @@
+import asyncio
+import logging
+
+from ib_insync import IB
+
+logger = logging.getLogger()
+
+
+class AsyncStrategyRunner:
+    """异步策略运行器 - 用 asyncio 驱动 AllDayTradingStrategy，等待期间事件循环不停顿"""
+
+    def __init__(self, strategy, concurrency=20, scan_interval=10, order_timeout=30):
+        self.strategy = strategy
+        self.ib = strategy.ib
+        self.clock = strategy.clock  # 回放时为 VirtualClock，用 clock.run(runner.run()) 驱动（回放结束时取消 run）
+        self.semaphore = asyncio.Semaphore(concurrency)  # 同时进行的请求/订单数量上限
+        self.scan_interval = scan_interval  # 扫描间隔（秒）
+        self.order_timeout = order_timeout  # 退出时等待在途订单结束的最长时间（秒）
+
+    async def limited(self, coro):
+        """在并发上限内执行协程"""
+        async with self.semaphore:
+            return await coro
+
+    async def setup_contracts(self):
+        """批量验证合约（优先使用合约缓存）"""
+        strategy = self.strategy
+        logger.info("设置合约...")
+        try:
+            strategy.contracts = await strategy.contract_cache.qualify_async(self.ib, strategy.watchlist)
+        except Exception as e:
+            logger.error(f"批量验证合约失败: {e}")
+            return
+
+        for symbol in strategy.watchlist:
+            if symbol not in strategy.contracts:
+                logger.warning(f"合约验证失败: {symbol}")
+        logger.info(f"合约验证成功: {len(strategy.contracts)}/{len(strategy.watchlist)}")
+        strategy.update_calendar()
+
+    async def start_market_data(self):
+        """订阅行情，并发回填多周期K线"""
+        strategy = self.strategy
+        strategy.quote_board.subscribe(strategy.contracts)
+        await asyncio.gather(*[
+            self.limited(strategy.bar_manager.subscribe_async(symbol, contract, timeframe))
+            for symbol, contract in strategy.contracts.items()
+            for timeframe in strategy.timeframes
+        ])
+        strategy.build_bar_matrices()
+
+    async def close_all(self, reason):
+        """全部持仓提交平仓单，并等待在途订单结束"""
+        self.strategy.close_all_positions(reason)
+        await self.strategy.order_manager.wait_all_async(timeout=self.order_timeout)
+
+    async def run(self):
+        """运行主策略（异步）"""
+        strategy = self.strategy
+        logger.info("启动全时段交易策略（异步）...")
+        await self.setup_contracts()
+        await self.start_market_data()
+        if strategy.metrics_port is not None:
+            try:
+                await strategy.metrics.start(strategy.metrics_port)
+            except Exception as e:
+                logger.error(f"启动指标导出失败: {e}")
+
+        status_counter = 0
+
+        try:
+            while True:
+                current_session = strategy.get_current_session()
+
+                if not strategy.is_trading_hours():
+                    if strategy.positions:
+                        logger.info("非交易时间，平仓所有头寸")
+                        strategy.close_all_positions("非交易时间平仓")
+                    # 休市（含周末/假日）直接等到下一次开盘
+                    wait = strategy.session_engine.seconds_until_change()
+                    logger.info(f"市场关闭，当前时段: {current_session}，等待 {wait / 3600:.1f} 小时至下一次开盘...")
+                    await self.clock.sleep_async(wait)
+                    continue
+
+                status_counter += 1
+                if status_counter >= 3:
+                    strategy.print_status()
+                    status_counter = 0
+
+                # 检查出场条件并寻找新交易机会（订单提交后不等待，成交由订单管理器回调处理）
+                strategy.scan_once()
+
+                await self.clock.sleep_async(self.scan_interval)
+
+        except asyncio.CancelledError:
+            logger.info("策略被取消")
+        except Exception as e:
+            logger.error(f"策略运行出错: {e}")
+        finally:
+            if strategy.positions:
+                logger.info("平仓所有头寸...")
+            await self.close_all("策略结束")
+
+            strategy.shutdown()
+
+            logger.info("策略停止")
+
+
+async def main():
+    from 早盘动量策略 import AllDayTradingStrategy
+
+    ib = IB()
+    try:
+        await ib.connectAsync('127.0.0.1', 7496, clientId=1)
+        logger.info("连接盈透TWS成功")
+
+        strategy = AllDayTradingStrategy(ib)
+        await AsyncStrategyRunner(strategy).run()
+
+    except Exception as e:
+        logger.error(f"程序启动失败: {e}")
+    finally:
+        ib.disconnect()
+        logger.info("断开连接")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("策略被用户中断")
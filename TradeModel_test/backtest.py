@@ -0,0 +1,313 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from bar_store import bar_seconds
+from exchange_calendar import ExchangeCalendar
+from indicators import rolling_max, rolling_min
+from ledger import TradeLedger, TradeStats
+
+logger = logging.getLogger()
+
+NY_TZ = pytz.timezone('America/New_York')
+
+
+class BacktestParams:
+    """回测参数（默认值与 AllDayTradingStrategy 一致）"""
+
+    def __init__(self, account_value=10000, risk_per_trade=0.01, max_positions=3,
+                 timeframes=('5 mins', '15 mins', '1 hour'), trading_sessions=None,
+                 breakout_window=20, rsi_window=14, rsi_low=30, rsi_high=70,
+                 trailing_trigger=0.01, trailing_keep=0.005, slippage=0.0):
+        self.account_value = account_value
+        self.risk_per_trade = risk_per_trade
+        self.max_positions = max_positions
+        self.timeframes = list(timeframes)
+        self.trading_sessions = trading_sessions or {
+            'pre_market': {'profit_target': 0.02, 'stop_loss_pct': 0.015},
+            'regular': {'profit_target': 0.015, 'stop_loss_pct': 0.01},
+            'after_hours': {'profit_target': 0.025, 'stop_loss_pct': 0.02},
+            'night': {'profit_target': 0.03, 'stop_loss_pct': 0.025}
+        }
+        self.breakout_window = breakout_window
+        self.rsi_window = rsi_window
+        self.rsi_low = rsi_low
+        self.rsi_high = rsi_high
+        self.trailing_trigger = trailing_trigger  # 盈利超过该比例后启动移动止损
+        self.trailing_keep = trailing_keep  # 移动止损保留的利润比例
+        self.slippage = slippage  # 单边滑点比例
+
+    @classmethod
+    def from_strategy(cls, strategy, **overrides):
+        """取实盘策略的参数"""
+        params = dict(account_value=strategy.account_value, risk_per_trade=strategy.risk_per_trade,
+                      max_positions=strategy.max_positions, timeframes=strategy.timeframes,
+                      trading_sessions=strategy.trading_sessions)
+        params.update(overrides)
+        return cls(**params)
+
+    def session_params(self, session):
+        return self.trading_sessions.get(session, {'profit_target': 0.02, 'stop_loss_pct': 0.015})
+
+
+def load_bars(bar_store, symbols, start=None, end=None, bar_size='5 mins', what_to_show='TRADES'):
+    """从本地K线库读取 {symbol: 列数据}，跳过无数据的标的"""
+    bars = {}
+    for symbol in symbols:
+        columns = bar_store.read(symbol, bar_size, what_to_show, start, end)
+        if len(columns['ts']):
+            bars[symbol] = columns
+    return bars
+
+
+def sample_bars(symbols=20, start=None, end=None, trading_days_only=True, seed=0):
+    """随机游走 5 分钟K线（固定种子，自检/测试用），格式与 BarStore.read 相同：{symbol: 列数据}
+
+    symbols 为数量（代码 S000、S001...）或代码列表；[start, end) 默认 2025-01-02 起一年；trading_days_only 去掉周末
+    """
+    if isinstance(symbols, int):
+        symbols = [f'S{n:03d}' for n in range(symbols)]
+    if start is None:
+        start = int(NY_TZ.localize(datetime(2025, 1, 2)).timestamp())
+    if end is None:
+        end = start + 365 * 86400
+    ts = np.arange(start, end, 300, dtype=np.int64)
+    if trading_days_only:
+        ts = ts[pd.to_datetime(ts, unit='s', utc=True).tz_convert(NY_TZ).weekday < 5]
+
+    rng = np.random.default_rng(seed)
+    bars = {}
+    for symbol in symbols:
+        sigma = rng.uniform(0.002, 0.004)
+        closes = rng.uniform(50, 300) * np.exp(np.cumsum(rng.normal(0, sigma, len(ts))))
+        opens = np.concatenate([closes[:1], closes[:-1]])
+        wick = rng.uniform(0, sigma, len(ts)) * closes
+        bars[symbol] = {'ts': ts, 'open': opens.astype(np.float32), 'close': closes.astype(np.float32),
+                        'high': (np.maximum(opens, closes) + wick).astype(np.float32),
+                        'low': (np.minimum(opens, closes) - wick).astype(np.float32),
+                        'volume': rng.integers(1, 500, len(ts)) * 100}
+    return bars
+
+
+def timeframe_votes(ts, highs, lows, closes, timeframe_seconds, params):
+    """单个标的单个周期：每根基础K线收盘时的 (多票, 空票, 强度, 有效)
+
+    当前K线 = 包含该基础K线的高周期K线（未收盘，收盘价即当前价），之前的为已收盘K线，与实盘 keepUpToDate 一致
+    """
+    window = params.breakout_window
+    bucket = ts // timeframe_seconds
+    starts = np.flatnonzero(np.append(True, bucket[1:] != bucket[:-1]))
+    ends = np.append(starts[1:], len(ts))
+    index = np.repeat(np.arange(len(starts)), ends - starts)  # 每根基础K线所属的高周期K线序号
+
+    # 已收盘高周期K线（每组最后一根基础K线收盘后）
+    bucket_high = np.maximum.reduceat(highs, starts)
+    bucket_low = np.minimum.reduceat(lows, starts)
+    bucket_close = closes[ends - 1]
+
+    # 阻力/支撑：当前K线之前 window-1 根已收盘K线
+    resistance = np.append(np.nan, rolling_max(bucket_high, window - 1))[index]
+    support = np.append(np.nan, rolling_min(bucket_low, window - 1))[index]
+    prices = closes
+    breakout = np.where(prices > resistance, 1, np.where(prices < support, -1, 0))
+
+    # RSI：前 rsi_window-1 个已收盘差值 + (当前价 - 上一根收盘)
+    n = params.rsi_window - 1
+    delta = np.diff(bucket_close)
+    gains = np.concatenate([[0.0], np.cumsum(np.where(delta > 0, delta, 0.0))])
+    losses = np.concatenate([[0.0], np.cumsum(np.where(delta < 0, -delta, 0.0))])
+    b = index
+    enough = b > n
+    lo = np.where(enough, b - 1 - n, 0)
+    hi = np.where(enough, b - 1, 0)
+    previous_close = np.where(b > 0, bucket_close[np.maximum(b - 1, 0)], np.nan)
+    last = prices - previous_close
+    gain = (gains[hi] - gains[lo] + np.where(last > 0, last, 0.0)) / params.rsi_window
+    loss = (losses[hi] - losses[lo] + np.where(last < 0, -last, 0.0)) / params.rsi_window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+        strength = prices / resistance - 1
+    rsi_vote = np.where(rsi < params.rsi_low, 1, np.where(rsi > params.rsi_high, -1, 0))
+
+    valid = index >= window  # 原逻辑 len(bars) > 20（含当前K线）
+    long_votes = valid & (breakout == 1)
+    long_votes = long_votes.astype(np.int8) + (valid & (rsi_vote == 1))
+    short_votes = (valid & (breakout == -1)).astype(np.int8) + (valid & (rsi_vote == -1))
+    return long_votes, short_votes, np.where(valid, strength, -np.inf), valid
+
+
+def session_labels(times, calendar, names):
+    """每个时间点所在交易时段编号（-1 为休市），用排好序的时段边界 searchsorted"""
+    first = datetime.fromtimestamp(times[0], NY_TZ).date() - timedelta(days=1)
+    last = datetime.fromtimestamp(times[-1], NY_TZ).date() + timedelta(days=1)
+    starts, ends, labels = [], [], []
+    day = first
+    while day <= last:
+        for start, end, session in calendar.intervals(day):
+            starts.append(start)
+            ends.append(end)
+            labels.append(names.setdefault(session, len(names)))
+        day += timedelta(days=1)
+    order = np.argsort(starts)
+    starts, ends, labels = np.array(starts)[order], np.array(ends)[order], np.array(labels)[order]
+    i = np.searchsorted(starts, times, side='right') - 1
+    inside = (i >= 0) & (times < ends[np.maximum(i, 0)])
+    return np.where(inside, labels[np.maximum(i, 0)], -1)
+
+
+def slice_prepared(prepared, start, end):
+    """截取 Backtester.prepare 结果的 [start, end) 时间段（指标已在之前的历史上预热）"""
+    symbols, grid, prices, has_bar, score, strength, labels, names = prepared
+    return (symbols, grid[start:end], prices[:, start:end], has_bar[:, start:end], score[:, start:end],
+            strength[:, start:end], labels[start:end], names)
+
+
+class Backtester:
+    """向量化回测 - 与实盘相同的突破/RSI投票、分时段止盈止损、移动止损与仓位计算，基于本地K线数组"""
+
+    def __init__(self, params=None, calendar=None, bar_size='5 mins'):
+        self.params = params or BacktestParams()
+        self.calendar = calendar or ExchangeCalendar(NY_TZ, path=None)
+        self.bar_size = bar_size
+        self.base_seconds = bar_seconds(bar_size)
+
+    def prepare(self, bars):
+        """对齐到统一时间网格，计算全部标的每根K线的信号矩阵（标的 x 时间）"""
+        params = self.params
+        symbols = list(bars)
+        grid = np.unique(np.concatenate([bars[symbol]['ts'] for symbol in symbols]))
+        shape = (len(symbols), len(grid))
+        prices = np.full(shape, np.nan)
+        has_bar = np.zeros(shape, dtype=bool)
+        score = np.zeros(shape, dtype=np.int8)
+        strength = np.full(shape, -np.inf, dtype=np.float32)
+
+        for i, symbol in enumerate(symbols):
+            columns = bars[symbol]
+            ts = np.asarray(columns['ts'], dtype=np.int64)
+            highs = np.asarray(columns['high'], dtype=float)
+            lows = np.asarray(columns['low'], dtype=float)
+            closes = np.asarray(columns['close'], dtype=float)
+            cols = np.searchsorted(grid, ts)
+            prices[i, cols] = closes
+            has_bar[i, cols] = True
+
+            long_votes = np.zeros(len(ts), dtype=np.int8)
+            short_votes = np.zeros(len(ts), dtype=np.int8)
+            best = np.full(len(ts), -np.inf)
+            for timeframe in params.timeframes:
+                votes = timeframe_votes(ts, highs, lows, closes, bar_seconds(timeframe), params)
+                long_votes += votes[0]
+                short_votes += votes[1]
+                best = np.fmax(best, votes[2])
+            score[i, cols] = long_votes - short_votes
+            strength[i, cols] = best
+
+        # 报价 = 最近一根K线收盘价（前向填充）
+        filled = np.where(has_bar, np.arange(len(grid)), 0)
+        np.maximum.accumulate(filled, axis=1, out=filled)
+        prices = np.take_along_axis(prices, filled, axis=1)
+
+        names = {}
+        labels = session_labels(grid + self.base_seconds, self.calendar, names)  # 决策时刻为K线收盘
+        return symbols, grid, prices, has_bar, score, strength, labels, {v: k for k, v in names.items()}
+
+    def position_size(self, entry_price, stop_loss_price):
+        """与 calculate_position_size 相同"""
+        params = self.params
+        risk_per_share = abs(entry_price - stop_loss_price)
+        if risk_per_share <= 0:
+            return 0
+        shares = params.account_value * params.risk_per_trade / risk_per_share
+        shares = min(shares, params.account_value * 0.1 / entry_price)
+        return int(max(1, shares))
+
+    def simulate_exit(self, path, entry_price, session_params):
+        """向量化出场：path 为入场后到时段结束（含）的价格，返回 (出场序号, 原因)"""
+        params = self.params
+        stop_loss = entry_price * (1 - session_params['stop_loss_pct'])
+        target = entry_price * (1 + session_params['profit_target'])
+        trail = np.where(path >= entry_price * (1 + params.trailing_trigger),
+                         path - entry_price * params.trailing_keep, -np.inf)
+        stops = np.maximum(stop_loss, np.maximum.accumulate(trail))
+        previous_stop = np.concatenate([[stop_loss], stops[:-1]])  # 本根K线检查时使用的止损价
+        hit = (path <= previous_stop) | (path >= target)
+        hit[-1] = True  # 时段结束
+        k = int(np.argmax(hit))
+        if path[k] >= target:
+            reason = '止盈'
+        elif path[k] <= previous_stop[k]:
+            reason = '移动止损' if previous_stop[k] > stop_loss else '止损'
+        else:
+            reason = '时段结束'
+        return k, reason
+
+    def run(self, bars):
+        """回测，返回 (TradeLedger, TradeStats)"""
+        started = time.perf_counter()
+        prepared = self.prepare(bars)
+        ledger, stats = self.simulate(prepared)
+        logger.info(f"回测完成: {len(prepared[0])} 个标的, {len(prepared[1])} 根K线, {stats.count} 笔交易, "
+                    f"耗时 {time.perf_counter() - started:.2f}秒")
+        return ledger, stats
+
+    def simulate(self, prepared):
+        """按 prepare 的信号矩阵撮合入场/出场（只用到仓位与止盈止损参数，信号参数相同时可复用 prepared）"""
+        params = self.params
+        symbols, grid, prices, has_bar, score, strength, labels, names = prepared
+        steps = len(grid)
+
+        # 每个时间点之后的第一个时段切换点（持仓在该点平仓）
+        changes = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        next_change = np.append(changes, steps - 1)[np.searchsorted(changes, np.arange(steps), side='right')]
+
+        candidates = (score > 0) & has_bar & (labels >= 0)
+        ledger = TradeLedger(path=None)
+        stats = TradeStats(params.account_value)
+        open_until = {}  # {标的行号: 出场时间点}
+
+        for j in np.flatnonzero(candidates.any(axis=0)):
+            open_until = {i: k for i, k in open_until.items() if k > j}
+            if len(open_until) >= params.max_positions:
+                continue
+            rows = np.flatnonzero(candidates[:, j])
+            rows = rows[np.lexsort((-strength[rows, j], -score[rows, j]))]
+            rows = [i for i in rows if i not in open_until]
+            if not rows:
+                continue
+            i = rows[0]  # 一次只建立一个新头寸
+
+            session = names[labels[j]]
+            session_params = params.session_params(session)
+            entry_price = prices[i, j] * (1 + params.slippage)
+            quantity = self.position_size(entry_price, entry_price * (1 - session_params['stop_loss_pct']))
+            end = next_change[j]
+            if end <= j:
+                continue
+            k, reason = self.simulate_exit(prices[i, j + 1:end + 1], entry_price, session_params)
+            exit_step = j + 1 + k
+            if exit_step == steps - 1 and reason == '时段结束':
+                reason = '回测结束'
+            exit_price = prices[i, exit_step] * (1 - params.slippage)
+            open_until[i] = exit_step
+
+            entry_ns = int(grid[j] + self.base_seconds) * 10 ** 9
+            exit_ns = int(grid[exit_step] + self.base_seconds) * 10 ** 9
+            pnl = (exit_price - entry_price) * quantity
+            ledger.append(symbols[i], session, reason, quantity, entry_price, exit_price, entry_ns, exit_ns)
+            stats.on_close(symbols[i], session, datetime.fromtimestamp(exit_ns / 1e9, NY_TZ).date(), pnl,
+                           exit_ns - entry_ns)
+        return ledger, stats
+
+
+if __name__ == "__main__":
+    # 自检：随机游走生成一年 5 分钟K线（190 个标的，全时段），测试回测速度
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ledger, stats = Backtester().run(sample_bars(190))
+    print(f"交易: {stats.count}, 胜率: {stats.win_rate:.1f}%, 总盈亏: ${stats.realised:.2f}, "
+          f"最大回撤: ${stats.max_drawdown:.2f}")
+    print(ledger.pnl_by('reason'))
@@ -0,0 +1,129 @@
+import logging
+
+from bar_store import BarStore, duration_seconds
+from clock import WALL_CLOCK
+from pacing import PRIORITY_SCAN
+
+logger = logging.getLogger()
+
+
+class BarManager:
+    """多周期K线管理 - 每个标的/周期只回填一次，之后由 keepUpToDate 推送增量更新"""
+
+    def __init__(self, ib_instance, pacer=None, store=None, duration='2 D', what_to_show='TRADES', use_rth=False,
+                 max_bars=1000, clock=None):
+        self.ib = ib_instance
+        self.clock = clock or WALL_CLOCK
+        self.pacer = pacer  # 历史数据请求调度器，为空时直接请求
+        self.store = store  # 本地K线库，有则只请求缺失的尾部数据
+        self.duration = duration  # 首次回填的时长
+        self.what_to_show = what_to_show
+        self.use_rth = use_rth
+        self.max_bars = max_bars  # 每个序列最多保留的K线数量，防止全天运行内存增长
+        self.series = {}  # {(symbol, bar_size): BarDataList}
+        self.updated_ns = {}  # {symbol: 最近一次K线推送的单调时钟纳秒}
+
+    def request_params(self, bar_size):
+        """keepUpToDate 历史数据请求参数"""
+        return dict(
+            endDateTime='',
+            durationStr=self.duration,
+            barSizeSetting=bar_size,
+            whatToShow=self.what_to_show,
+            useRTH=self.use_rth,
+            formatDate=2,  # UTC 时间，与本地K线库一致
+            keepUpToDate=True
+        )
+
+    def prepare(self, symbol, bar_size):
+        """准备请求参数：有本地K线库时只请求缺失的尾部，返回 (参数, 已存储的K线)"""
+        params = self.request_params(bar_size)
+        if not self.store:
+            return params, []
+
+        now = self.clock.time()
+        lookback = duration_seconds(self.duration)
+        columns = self.store.read(symbol, bar_size, self.what_to_show, start=now - lookback)
+        params['durationStr'] = self.store.missing_duration(symbol, bar_size, self.what_to_show, lookback, now)
+        return params, BarStore.to_bars(columns)
+
+    def register(self, symbol, bar_size, bars, stored=()):
+        """登记K线序列并挂上更新回调，已存储的更早K线拼接到序列前面"""
+        if self.store:
+            self.store.write(symbol, bar_size, self.what_to_show, bars)
+            first_date = bars[0].date if bars else None
+            bars[0:0] = [bar for bar in stored if first_date is None or bar.date < first_date]
+        bars.updateEvent += self.on_bar_update
+        self.series[(symbol, bar_size)] = bars
+        logger.info(f"K线订阅成功: {symbol} {bar_size}, 回填 {len(bars)} 根")
+        return bars
+
+    def subscribe(self, symbol, contract, bar_size, priority=PRIORITY_SCAN):
+        """回填并订阅单个标的/周期的K线"""
+        key = (symbol, bar_size)
+        if key in self.series:
+            return self.series[key]
+
+        try:
+            params, stored = self.prepare(symbol, bar_size)
+            if self.pacer:
+                bars = self.pacer.request(contract, priority, **params)
+            else:
+                bars = self.ib.reqHistoricalData(contract, **params)
+            return self.register(symbol, bar_size, bars, stored)
+        except Exception as e:
+            logger.error(f"K线订阅失败 {symbol} {bar_size}: {e}")
+            return None
+
+    async def subscribe_async(self, symbol, contract, bar_size, priority=PRIORITY_SCAN):
+        """subscribe 的异步版本（reqHistoricalDataAsync）"""
+        key = (symbol, bar_size)
+        if key in self.series:
+            return self.series[key]
+
+        try:
+            params, stored = self.prepare(symbol, bar_size)
+            if self.pacer:
+                bars = await self.pacer.request_async(contract, priority, **params)
+            else:
+                bars = await self.ib.reqHistoricalDataAsync(contract, **params)
+            return self.register(symbol, bar_size, bars, stored)
+        except Exception as e:
+            logger.error(f"K线订阅失败 {symbol} {bar_size}: {e}")
+            return None
+
+    def subscribe_all(self, contracts, bar_sizes):
+        """批量订阅 {symbol: contract} x 周期列表"""
+        for symbol, contract in contracts.items():
+            for bar_size in bar_sizes:
+                self.subscribe(symbol, contract, bar_size)
+
+    def on_bar_update(self, bars, has_new_bar):
+        """keepUpToDate 推送回调：新K线产生时保存刚收盘的K线，并裁剪最旧的数据"""
+        self.updated_ns[bars.contract.symbol] = self.clock.monotonic_ns()
+        if not has_new_bar:
+            return
+        if self.store and len(bars) > 1:
+            self.store.write(bars.contract.symbol, bars.barSizeSetting, bars.whatToShow, bars[-2:-1])
+        if len(bars) > self.max_bars:
+            del bars[:len(bars) - self.max_bars]
+
+    def get_bars(self, symbol, bar_size):
+        """获取最新K线序列（最后一根为尚未收盘的当前K线），未订阅返回空列表"""
+        return self.series.get((symbol, bar_size), [])
+
+    def unsubscribe(self, symbol, bar_size):
+        """取消单个标的/周期的K线订阅"""
+        bars = self.series.pop((symbol, bar_size), None)
+        if bars is None:
+            return
+        bars.updateEvent -= self.on_bar_update
+        try:
+            self.ib.cancelHistoricalData(bars)
+        except Exception as e:
+            logger.error(f"取消K线订阅失败 {symbol} {bar_size}: {e}")
+
+    def unsubscribe_all(self):
+        """取消全部K线订阅"""
+        for symbol, bar_size in list(self.series):
+            self.unsubscribe(symbol, bar_size)
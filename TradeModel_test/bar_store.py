@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from ib_insync import BarData
+
+from clock import WALL_CLOCK
+from pacing import PRIORITY_SCAN
+
+logger = logging.getLogger()
+
+# 列式存储：每列一个 .npy 文件，按 UTC 日期分区，读取时内存映射
+COLUMNS = {
+    'ts': np.int64,  # K线开始时间（UTC 秒）
+    'open': np.float32,
+    'high': np.float32,
+    'low': np.float32,
+    'close': np.float32,
+    'volume': np.int64,
+    'average': np.float32,
+    'bar_count': np.int64
+}
+
+BAR_SIZE_UNITS = {'sec': 1, 'secs': 1, 'min': 60, 'mins': 60, 'hour': 3600, 'hours': 3600,
+                  'day': 86400, 'week': 604800, 'month': 2592000}
+DURATION_UNITS = {'S': 1, 'D': 86400, 'W': 604800, 'M': 2592000, 'Y': 31536000}
+
+
+def bar_seconds(bar_size):
+    """K线周期秒数，如 '5 mins' -> 300"""
+    count, unit = bar_size.split()
+    return int(count) * BAR_SIZE_UNITS[unit]
+
+
+def duration_seconds(duration):
+    """IB 时长字符串秒数，如 '2 D' -> 172800"""
+    count, unit = duration.split()
+    return int(count) * DURATION_UNITS[unit]
+
+
+def to_timestamp(value):
+    """BarData.date -> UTC 秒；日线 date 按当日 00:00 UTC 计"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+
+
+class BarStore:
+    """本地K线库 - 按 标的/周期/数据类型 存储，增量补齐缺失的尾部数据"""
+
+    def __init__(self, root='bar_store', clock=None):
+        self.root = root
+        self.clock = clock or WALL_CLOCK  # 缺省 now 时读取的时钟（回放时为 VirtualClock）
+
+    def series_dir(self, symbol, bar_size, what_to_show):
+        return os.path.join(self.root, symbol, bar_size.replace(' ', ''), what_to_show)
+
+    def partitions(self, symbol, bar_size, what_to_show):
+        """已有的日期分区（升序）"""
+        path = self.series_dir(symbol, bar_size, what_to_show)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if name.isdigit())
+
+    def load_partition(self, path, mmap=True):
+        mode = 'r' if mmap else None
+        return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in COLUMNS}
+
+    def write(self, symbol, bar_size, what_to_show, bars):
+        """合并写入K线（相同时间戳以新数据为准）"""
+        if not bars:
+            return
+        rows = {name: np.array(values, dtype=COLUMNS[name]) for name, values in zip(COLUMNS, zip(*[
+            (to_timestamp(bar.date), bar.open, bar.high, bar.low, bar.close,
+             int(bar.volume) if bar.volume > 0 else 0, bar.average, bar.barCount)
+            for bar in bars
+        ]))}
+
+        days = rows['ts'] // 86400
+        series_dir = self.series_dir(symbol, bar_size, what_to_show)
+        for day in np.unique(days):
+            mask = days == day
+            partition = datetime.fromtimestamp(int(day) * 86400, timezone.utc).strftime('%Y%m%d')
+            path = os.path.join(series_dir, partition)
+            new = {name: column[mask] for name, column in rows.items()}
+            if os.path.isdir(path):
+                old = self.load_partition(path, mmap=False)
+                merged = {name: np.concatenate([old[name], new[name]]) for name in COLUMNS}
+                # 稳定排序后保留每个时间戳的最后一条（即新数据）
+                order = np.argsort(merged['ts'], kind='stable')
+                ts = merged['ts'][order]
+                keep = np.append(ts[1:] != ts[:-1], True)
+                new = {name: column[order][keep] for name, column in merged.items()}
+            self.write_partition(path, new)
+
+    def write_partition(self, path, columns):
+        os.makedirs(path, exist_ok=True)
+        for name, column in columns.items():
+            tmp_path = os.path.join(path, f'{name}.tmp.npy')
+            np.save(tmp_path, column)
+            os.replace(tmp_path, os.path.join(path, f'{name}.npy'))
+
+    def read(self, symbol, bar_size, what_to_show, start=None, end=None):
+        """读取 [start, end) 区间（UTC 秒）的K线列数据"""
+        parts = []
+        series_dir = self.series_dir(symbol, bar_size, what_to_show)
+        for partition in self.partitions(symbol, bar_size, what_to_show):
+            day_start = int(datetime.strptime(partition, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp())
+            if start is not None and day_start + 86400 <= start:
+                continue
+            if end is not None and day_start >= end:
+                break
+            columns = self.load_partition(os.path.join(series_dir, partition))
+            ts = columns['ts']
+            lo = 0 if start is None else np.searchsorted(ts, start)
+            hi = len(ts) if end is None else np.searchsorted(ts, end)
+            parts.append({name: column[lo:hi] for name, column in columns.items()})
+
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def last_timestamp(self, symbol, bar_size, what_to_show):
+        """最后一根已存储K线的时间戳，无数据返回 None"""
+        partitions = self.partitions(symbol, bar_size, what_to_show)
+        if not partitions:
+            return None
+        path = os.path.join(self.series_dir(symbol, bar_size, what_to_show), partitions[-1], 'ts.npy')
+        ts = np.load(path, mmap_mode='r')
+        return int(ts[-1]) if len(ts) else None
+
+    def missing_duration(self, symbol, bar_size, what_to_show, lookback_seconds, now=None):
+        """需要向IB补齐的时长（durationStr），从最后一根已存储K线（含，可能未收盘）到现在"""
+        now = self.clock.time() if now is None else now
+        last_ts = self.last_timestamp(symbol, bar_size, what_to_show)
+        start = now - lookback_seconds
+        if last_ts is not None and last_ts > start:
+            start = last_ts
+        seconds = max(now - start, 2 * bar_seconds(bar_size))
+        if seconds <= 86400 and bar_seconds(bar_size) < 86400:
+            return f'{int(math.ceil(seconds))} S'
+        return f'{int(math.ceil(seconds / 86400)) + 1} D'
+
+    def request_params(self, symbol, bar_size, what_to_show, use_rth, lookback_seconds, now):
+        """补齐缺失尾部的 reqHistoricalData 参数"""
+        return dict(endDateTime='', durationStr=self.missing_duration(symbol, bar_size, what_to_show,
+                                                                      lookback_seconds, now),
+                    barSizeSetting=bar_size, whatToShow=what_to_show, useRTH=use_rth, formatDate=2)
+
+    def sync(self, requester, symbol, contract, bar_size, what_to_show='TRADES', use_rth=False,
+             lookback_seconds=2 * 86400, priority=PRIORITY_SCAN, now=None):
+        """补齐缺失尾部并返回回看区间内的列数据（requester 为 HistoricalPacer）"""
+        now = self.clock.time() if now is None else now
+        try:
+            params = self.request_params(symbol, bar_size, what_to_show, use_rth, lookback_seconds, now)
+            bars = requester.request(contract, priority, **params)
+            self.write(symbol, bar_size, what_to_show, bars)
+        except Exception as e:
+            logger.error(f"补齐K线失败 {symbol} {bar_size}: {e}")
+        return self.read(symbol, bar_size, what_to_show, start=now - lookback_seconds)
+
+    async def sync_async(self, requester, symbol, contract, bar_size, what_to_show='TRADES', use_rth=False,
+                         lookback_seconds=2 * 86400, priority=PRIORITY_SCAN, now=None):
+        """sync 的异步版本（多个标的同时排队，由调度器按优先级与限流发出）"""
+        now = self.clock.time() if now is None else now
+        try:
+            params = self.request_params(symbol, bar_size, what_to_show, use_rth, lookback_seconds, now)
+            bars = await requester.request_async(contract, priority, **params)
+            self.write(symbol, bar_size, what_to_show, bars)
+        except Exception as e:
+            logger.error(f"补齐K线失败 {symbol} {bar_size}: {e}")
+        return self.read(symbol, bar_size, what_to_show, start=now - lookback_seconds)
+
+    @staticmethod
+    def to_bars(columns, daily=False):
+        """列数据 -> BarData 列表（与 reqHistoricalData formatDate=2 的结果格式一致）"""
+        bars = []
+        for ts, o, h, l, c, v, a, n in zip(*(columns[name].tolist() for name in COLUMNS)):
+            moment = datetime.fromtimestamp(ts, timezone.utc)
+            bars.append(BarData(date=moment.date() if daily else moment, open=o, high=h, low=l, close=c,
+                                volume=v, average=a, barCount=n))
+        return bars
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+def required_window(breakout_window=20, rsi_window=14):
+    """批量投票需要的列数：突破取当前K线之前 breakout_window-1 根，RSI 需要 rsi_window+1 个收盘价"""
+    return max(breakout_window, rsi_window) + 1
+
+
+class BarMatrix:
+    """单个周期的对齐K线矩阵（标的 x K线），右对齐，最后一列为未收盘的当前K线"""
+
+    def __init__(self, symbols, window=21):
+        self.symbols = list(symbols)
+        self.window = window
+        shape = (len(self.symbols), window)
+        self.high = np.full(shape, np.nan)
+        self.low = np.full(shape, np.nan)
+        self.close = np.full(shape, np.nan)
+        self.counts = np.zeros(len(self.symbols), dtype=np.int64)  # 每个标的实际K线数量
+        self.last_dates = [None] * len(self.symbols)  # 每行最后一根K线的时间
+
+    def update_row(self, i, bars):
+        """用最新K线序列刷新第 i 行：无新K线时只改最后一列"""
+        n = len(bars)
+        self.counts[i] = n
+        if n == 0:
+            self.high[i] = self.low[i] = self.close[i] = np.nan
+            self.last_dates[i] = None
+            return
+
+        last_bar = bars[-1]
+        if last_bar.date == self.last_dates[i]:
+            self.high[i, -1] = last_bar.high
+            self.low[i, -1] = last_bar.low
+            self.close[i, -1] = last_bar.close
+            return
+
+        tail = bars[-self.window:]
+        k = len(tail)
+        self.high[i, :self.window - k] = np.nan
+        self.low[i, :self.window - k] = np.nan
+        self.close[i, :self.window - k] = np.nan
+        self.high[i, self.window - k:] = [bar.high for bar in tail]
+        self.low[i, self.window - k:] = [bar.low for bar in tail]
+        self.close[i, self.window - k:] = [bar.close for bar in tail]
+        self.last_dates[i] = last_bar.date
+
+    def refresh(self, bar_manager, bar_size):
+        """从 BarManager 刷新全部标的"""
+        for i, symbol in enumerate(self.symbols):
+            self.update_row(i, bar_manager.get_bars(symbol, bar_size))
+
+
+def breakout_votes(matrix, prices, breakout_window=20):
+    """突破投票：价格高于前 breakout_window-1 根K线最高点 +1，低于最低点 -1"""
+    resistance = matrix.high[:, -breakout_window:-1].max(axis=1)
+    support = matrix.low[:, -breakout_window:-1].min(axis=1)
+    votes = np.where(prices > resistance, 1, np.where(prices < support, -1, 0))
+    return votes, resistance
+
+
+def rsi_votes(matrix, rsi_window=14, rsi_low=30, rsi_high=70):
+    """RSI 投票：超卖 +1，超买 -1（最后一根为当前K线的收盘价）"""
+    delta = np.diff(matrix.close[:, -(rsi_window + 1):], axis=1)
+    gain = np.where(delta > 0, delta, 0.0).mean(axis=1)
+    loss = np.where(delta < 0, -delta, 0.0).mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+    rsi[np.isnan(delta).any(axis=1)] = np.nan  # K线不足 rsi_window+1 根，与流式版本一样不投票
+    return np.where(rsi < rsi_low, 1, np.where(rsi > rsi_high, -1, 0))
+
+
+def evaluate_watchlist(matrices, prices, breakout_window=20, rsi_window=14, rsi_low=30, rsi_high=70):
+    """一次向量化计算全部标的的多周期投票，返回按强度排序的候选表
+
+    matrices: {周期: BarMatrix}，所有矩阵的标的顺序一致
+    prices: 与标的顺序一致的当前价格数组（<=0 表示无报价）
+    """
+    prices = np.asarray(prices, dtype=float)
+    first = next(iter(matrices.values()))
+    window = required_window(breakout_window, rsi_window)
+    for matrix in matrices.values():
+        if matrix.window < window:
+            # 列数不足时回看窗口被截断，结果与逐个标的计算不一致
+            raise ValueError(f"BarMatrix 只有 {matrix.window} 列，当前参数需要 {window} 列")
+    long_votes = np.zeros(len(first.symbols), dtype=np.int64)
+    short_votes = np.zeros(len(first.symbols), dtype=np.int64)
+    strength = np.full(len(first.symbols), -np.inf)
+
+    for matrix in matrices.values():
+        valid = matrix.counts > breakout_window  # 原逻辑：len(bars) > 20
+        with np.errstate(invalid='ignore'):
+            votes, resistance = breakout_votes(matrix, prices, breakout_window)
+            rsi_vote = rsi_votes(matrix, rsi_window, rsi_low, rsi_high)
+            strength = np.where(valid, np.fmax(strength, prices / resistance - 1), strength)
+        for vote in (votes, rsi_vote):
+            long_votes += valid & (vote == 1)
+            short_votes += valid & (vote == -1)
+
+    table = pd.DataFrame({
+        'symbol': first.symbols,
+        'price': prices,
+        'long_votes': long_votes,
+        'short_votes': short_votes,
+        'score': long_votes - short_votes,
+        'strength': strength
+    })
+    table = table[(table['price'] > 0) & (table['score'] > 0)]
+    return table.sort_values(['score', 'strength'], ascending=False).reset_index(drop=True)
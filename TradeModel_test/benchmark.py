@@ -0,0 +1,303 @@
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from backtest import NY_TZ
+from ledger import Position
+from sim_broker import SimIB
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger()
+
+# 相对本文件所在目录，与运行时的当前目录无关
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BASE_DIR, 'benchmark_fixtures')
+HISTORY_FILE = os.path.join(BASE_DIR, 'benchmark_history.jsonl')
+SCAN_SIZES = (13, 190, 500)
+# 固定数据不入库，按版本与种子在本地生成；改动生成逻辑时递增版本
+FIXTURE_VERSION = 1
+FIXTURE_SEED = 0
+
+# 前 13 个标的与策略默认监控列表相同，其余为合成代码
+DEFAULT_SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL', 'META', 'TSLA', 'SPY', 'QQQ', 'IWM', 'UVXY', 'SQQQ',
+                   'TQQQ']
+
+
+# ---------- 固定数据 ----------
+
+def generate_fixture(path, n_symbols, history_days=3, replay_days=1, seed=FIXTURE_SEED):
+    """生成并保存 5 分钟K线（随机游走，固定种子）：前 history_days 天只作历史数据，之后 replay_days 天逐根回放"""
+    rng = np.random.default_rng(seed)
+    start = int(NY_TZ.localize(datetime(2025, 3, 4, 4)).timestamp())  # 周二盘前开盘
+    ts = np.arange(start - history_days * 86400, start + replay_days * 86400, 300, dtype=np.int64)
+    symbols = (DEFAULT_SYMBOLS + [f'S{n:03d}' for n in range(len(DEFAULT_SYMBOLS), n_symbols)])[:n_symbols]
+    shape = (n_symbols, len(ts))
+    sigma = rng.uniform(0.001, 0.004, (n_symbols, 1))
+    closes = rng.uniform(10, 500, (n_symbols, 1)) * np.exp(np.cumsum(rng.normal(0, 1, shape) * sigma, axis=1))
+    opens = np.concatenate([closes[:, :1], closes[:, :-1]], axis=1)
+    wick = rng.uniform(0, 1, shape) * sigma * closes
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez(path, version=FIXTURE_VERSION, seed=seed, start=start, symbols=np.array(symbols), ts=ts,
+             open=opens.astype(np.float32), close=closes.astype(np.float32),
+             high=(np.maximum(opens, closes) + wick).astype(np.float32),
+             low=(np.minimum(opens, closes) - wick).astype(np.float32),
+             volume=rng.integers(1, 500, shape) * 100)
+
+
+def load_fixture(n_symbols, fixture_dir=FIXTURE_DIR):
+    """读取固定数据（不存在、版本/种子不符或标的不足时重新生成），返回 (bars, 回放开始时间, 数据摘要)"""
+    path = os.path.join(fixture_dir, 'bars.npz')
+    if os.path.exists(path):
+        with np.load(path) as data:
+            stale = (int(data['version']) != FIXTURE_VERSION or 'seed' not in data.files
+                     or int(data['seed']) != FIXTURE_SEED or len(data['symbols']) < n_symbols)
+    if not os.path.exists(path) or stale:
+        generate_fixture(path, max(n_symbols, max(SCAN_SIZES)))
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    with np.load(path) as data:
+        columns = {name: data[name][:n_symbols] for name in ('open', 'high', 'low', 'close', 'volume')}
+        ts = data['ts']
+        bars = {symbol: dict({name: column[i] for name, column in columns.items()}, ts=ts)
+                for i, symbol in enumerate(data['symbols'][:n_symbols].tolist())}
+        return bars, int(data['start']), digest
+
+
+def build_strategy(bars, start):
+    """模拟券商 + 虚拟时钟上的策略，完成合约验证与行情/K线订阅，返回 (策略, 准备耗时秒)"""
+    strategy_module = importlib.import_module('早盘动量策略')
+    started = time.perf_counter()
+    ib = SimIB(bars, start=start)
+    strategy = strategy_module.AllDayTradingStrategy(ib, clock=ib.clock)
+    strategy.watchlist = list(bars)
+    strategy.setup_contracts()
+    strategy.start_market_data()
+    strategy.clock.sleep(ib.base_seconds)  # 回放一根基础K线，每个标的都有报价
+    return strategy, time.perf_counter() - started
+
+
+# ---------- 计时 ----------
+
+def time_calls(func, number=1000, repeat=7):
+    """调用 func(i) number 次为一轮，返回每次调用的耗时统计（微秒）"""
+    func(0)  # 预热
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for i in range(number):
+            func(i)
+        rounds.append((time.perf_counter_ns() - started) / number / 1000)
+    rounds.sort()
+    return {'median_us': statistics.median(rounds), 'min_us': rounds[0], 'max_us': rounds[-1],
+            'number': number, 'repeat': repeat}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def hot_path_benchmarks(strategy, number=1000, repeat=7):
+    """策略热点：时段判断、仓位计算、信号生成（三周期突破+RSI）、出场检查、状态输出"""
+    symbols = list(strategy.contracts)
+    prices = [strategy.get_current_price(symbol) or 100.0 for symbol in symbols]
+    now = strategy.clock.time()
+    week = [now + i * 613 for i in range(1000)]  # 一周内错开的时间点，覆盖各时段与边界
+
+    results = {
+        'session_current': time_calls(lambda i: strategy.get_current_session(), number, repeat),
+        'session_classify': time_calls(lambda i: strategy.session_engine.current(week[i % len(week)]),
+                                       number, repeat),
+        'position_size': time_calls(lambda i: strategy.calculate_position_size(
+            prices[i % len(prices)], prices[i % len(prices)] * 0.985), number, repeat),
+        'signal_symbol': time_calls(lambda i: strategy.generate_trading_signals(symbols[i % len(symbols)]),
+                                    number, repeat),
+        'signal_scan': time_calls(lambda i: strategy.scan_candidates(), max(number // 100, 1), repeat),
+    }
+
+    # 出场检查与状态输出需要持仓：止盈止损设在远处，检查过程不会触发平仓
+    session = strategy.get_current_session()
+    for symbol, price in zip(symbols[:strategy.max_positions], prices):
+        strategy.positions[symbol] = Position(symbol, price, price * 0.5, 10, strategy.clock.time_ns(), session,
+                                              profit_target=1.0)
+    for n in range(20):
+        strategy.stats.on_close(symbols[n % len(symbols)], session, strategy.get_current_ny_time().date(),
+                                (-1) ** n * 10.0, 600 * 10 ** 9)
+    held = list(strategy.positions)
+    results['exit_check'] = time_calls(lambda i: strategy.get_exit_reason(held[i % len(held)]), number, repeat)
+    results['status_render'] = time_calls(lambda i: strategy.print_status(), max(number // 10, 1), repeat)
+    strategy.positions.clear()
+    return results
+
+
+def scan_benchmark(strategy, scans=30, warmup=3, interval=10, memory_scans=5):
+    """端到端扫描：每轮 scan_once 后虚拟时间前进 interval 秒（回放报价/K线更新），统计单轮耗时与内存"""
+    # 放开持仓上限：持仓满后 find_entry 直接返回，每轮都要完整扫描监控列表才有可比性
+    strategy.max_positions = max(strategy.max_positions, warmup + scans + memory_scans + 1)
+    latencies = []
+    for n in range(warmup + scans):
+        started = time.perf_counter_ns()
+        strategy.scan_once()
+        if n >= warmup:
+            latencies.append((time.perf_counter_ns() - started) / 1e6)
+        strategy.clock.sleep(interval)
+
+    # 内存单独测量（tracemalloc 会拖慢执行，不与耗时混在一起）
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for _ in range(memory_scans):
+        strategy.scan_once()
+        strategy.clock.sleep(interval)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'scan_median_ms': statistics.median(latencies), 'scan_p95_ms': percentile(latencies, 95),
+            'scan_max_ms': max(latencies), 'scans': scans, 'scan_peak_kb': peak / 1024,
+            'traced_kb': current / 1024, 'positions': len(strategy.positions),
+            'orders': len(strategy.ib.sim_trades)}
+
+
+def peak_rss_mb():
+    """进程峰值 RSS（MB）；Windows 没有 resource 模块，装有 psutil 时取峰值工作集，否则为 None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024  # macOS 单位为字节，Linux 为 KB
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+
+
+# ---------- 历史记录与回归检查 ----------
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BASE_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def flatten(record):
+    """一次运行的可比较指标 {名称: 数值}（越小越好）"""
+    metrics = {f'hot.{name}': result['median_us'] for name, result in record['hot_paths'].items()}
+    for size, result in record['scans'].items():
+        for field in ('scan_median_ms', 'scan_p95_ms', 'scan_peak_kb'):
+            metrics[f'scan.{size}.{field}'] = result[field]
+    return metrics
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_regressions(record, history, tolerance=0.2, baseline_runs=5):
+    """与同一主机、同一固定数据最近 baseline_runs 次运行的中位数比较，超过 (1 + tolerance) 倍视为回归"""
+    previous = [item for item in history if item['host'] == record['host'] and item['fixture'] == record['fixture']]
+    previous = previous[-baseline_runs:]
+    if not previous:
+        return []
+    current = flatten(record)
+    regressions = []
+    for name, value in current.items():
+        baseline = [flatten(item)[name] for item in previous if name in flatten(item)]
+        if not baseline:
+            continue
+        reference = statistics.median(baseline)
+        if reference > 0 and value > reference * (1 + tolerance):
+            regressions.append(f"{name}: {value:.2f} > 基线 {reference:.2f} (+{(value / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def run(sizes=SCAN_SIZES, scans=30, number=1000, repeat=7, fixture_dir=FIXTURE_DIR, history=HISTORY_FILE,
+        tolerance=0.2):
+    """运行全部基准并追加到历史文件，返回 (本次记录, 回归列表)"""
+    fixture_dir = os.path.abspath(fixture_dir)
+    history = os.path.abspath(history)
+    level = logger.level
+    cwd = os.getcwd()
+    record = {'time': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+              'host': socket.gethostname(), 'python': platform.python_version(), 'numpy': np.__version__,
+              'fixture_version': FIXTURE_VERSION, 'fixture_seed': FIXTURE_SEED, 'hot_paths': {}, 'scans': {}}
+    try:
+        # 策略会在当前目录写合约/日历缓存、K线库和账本，基准在临时目录中运行
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            bars, start, record['fixture'] = load_fixture(max(sizes), fixture_dir)
+            logger.setLevel(logging.WARNING)
+
+            strategy, _ = build_strategy({symbol: bars[symbol] for symbol in list(bars)[:min(sizes)]}, start)
+            record['hot_paths'] = hot_path_benchmarks(strategy, number, repeat)
+            strategy.shutdown()
+
+            for size in sizes:
+                strategy, setup = build_strategy({symbol: bars[symbol] for symbol in list(bars)[:size]}, start)
+                result = scan_benchmark(strategy, scans)
+                result['setup_s'] = setup
+                record['scans'][str(size)] = result
+                strategy.shutdown()
+            record['max_rss_mb'] = peak_rss_mb()
+    finally:
+        os.chdir(cwd)
+        logger.setLevel(level)
+
+    regressions = check_regressions(record, load_history(history), tolerance)
+    record['regressions'] = regressions
+    with open(history, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record, regressions
+
+
+def report(record):
+    lines = [f"=== 基准测试 {record['time']} ({record['revision'] or '-'}, 数据 v{record['fixture_version']}/种子 {record['fixture_seed']} {record['fixture']}) ==="]
+    for name, result in record['hot_paths'].items():
+        lines.append(f"  {name:<18} 中位 {result['median_us']:9.2f}us  最小 {result['min_us']:9.2f}us")
+    for size, result in record['scans'].items():
+        lines.append(f"  扫描 {size:>4} 个标的   中位 {result['scan_median_ms']:8.2f}ms  "
+                     f"P95 {result['scan_p95_ms']:8.2f}ms  峰值内存 {result['scan_peak_kb']:9.1f}KB  "
+                     f"准备 {result['setup_s']:.1f}秒")
+    if record['max_rss_mb'] is not None:
+        lines.append(f"  进程峰值 RSS {record['max_rss_mb']:.0f}MB")
+    for regression in record['regressions']:
+        lines.append(f"  回归: {regression}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # 部署前运行：python benchmark.py --check，发现回归时退出码为 1
+    parser = argparse.ArgumentParser(description='策略热点与端到端扫描基准')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SCAN_SIZES), help='端到端扫描的标的数量')
+    parser.add_argument('--scans', type=int, default=30, help='每个规模计时的扫描轮数')
+    parser.add_argument('--number', type=int, default=1000, help='热点函数每轮调用次数')
+    parser.add_argument('--history', default=HISTORY_FILE, help='结果历史文件（每行一次运行的 JSON）')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='相对基线变慢/变大超过该比例视为回归')
+    parser.add_argument('--check', action='store_true', help='发现回归时以非零退出码结束')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    result, found = run(args.sizes, args.scans, args.number, history=args.history, tolerance=args.tolerance)
+    print(report(result))
+    if args.check and found:
+        raise SystemExit(1)
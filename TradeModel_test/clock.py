@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from ib_insync import util
+
+logger = logging.getLogger()
+
+
+class WallClock:
+    """实盘时钟 - 系统时间，等待期间事件循环继续运行"""
+
+    def time(self):
+        return time.time()
+
+    def time_ns(self):
+        return time.time_ns()
+
+    def monotonic_ns(self):
+        """单调时钟纳秒，用于计算间隔（不受系统时间调整影响）"""
+        return time.monotonic_ns()
+
+    def sleep(self, secs):
+        """同步等待（与 ib.sleep 相同，不能用 time.sleep 阻塞事件循环）"""
+        util.sleep(secs)
+
+    async def sleep_async(self, secs):
+        await asyncio.sleep(secs)
+
+    async def wait_for(self, awaitable, timeout):
+        return await asyncio.wait_for(awaitable, timeout)
+
+    def run(self, awaitable):
+        """同步运行协程直到完成"""
+        return util.run(awaitable)
+
+    def call_later(self, delay, callback, *args):
+        return util.getLoop().call_later(delay, callback, *args)
+
+
+class TimerHandle:
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """虚拟时钟 - 时间只由定时事件推动，等待时直接跳到下一个事件，不真实等待
+
+    同步等待（sleep/run）逐个执行到期事件，每个事件之后让事件循环处理完已就绪的回调；
+    协程中的等待（sleep_async/wait_for）登记为定时事件，由同步等待推动。
+    """
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+        self.events = []  # 定时事件堆 [(时间, 序号, TimerHandle)]
+        self.sequence = 0
+
+    def time(self):
+        return self.now
+
+    def time_ns(self):
+        return int(self.now * 1e9)
+
+    def monotonic_ns(self):
+        return self.time_ns()  # 虚拟时间只前进不后退
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(max(when, self.now), callback, args)
+        self.sequence += 1
+        heapq.heappush(self.events, (handle.when, self.sequence, handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def next_event(self):
+        """下一个未取消事件的时间，没有返回 None"""
+        while self.events and self.events[0][2].cancelled:
+            heapq.heappop(self.events)
+        return self.events[0][0] if self.events else None
+
+    def step(self):
+        """执行下一个事件（时间跳到该事件），返回是否有事件"""
+        if self.next_event() is None:
+            return False
+        when, _, handle = heapq.heappop(self.events)
+        self.now = max(self.now, when)
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            logger.error(f"定时事件出错: {e}")
+        self.settle()
+        return True
+
+    def settle(self, rounds=100):
+        """让事件循环处理已就绪的回调，直到没有新的就绪回调（协程在当前虚拟时间执行完能执行的部分）
+
+        一个请求往往要经过多轮回调才完成（排队 -> 发出 -> 结果），只处理一轮就跳到下一个事件会让每个请求
+        白白消耗一段虚拟时间；rounds 防止互相唤醒的协程无限循环。
+        """
+        loop = util.getLoop()
+        for _ in range(rounds):
+            util.run(asyncio.sleep(0))
+            if not getattr(loop, '_ready', None):
+                break
+
+    def advance(self, secs):
+        """时间前进 secs 秒，按时间顺序执行到期事件"""
+        target = self.now + secs
+        while True:
+            when = self.next_event()
+            if when is None or when > target:
+                break
+            self.step()
+        self.now = max(self.now, target)
+
+    def sleep(self, secs):
+        self.settle()
+        self.advance(secs)
+
+    async def sleep_async(self, secs):
+        future = asyncio.get_running_loop().create_future()
+        handle = self.call_later(secs, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    async def wait_for(self, awaitable, timeout):
+        """与 asyncio.wait_for 相同，超时按虚拟时间计算"""
+        future = asyncio.ensure_future(awaitable)
+        if timeout is None:
+            return await future
+        expired = []
+
+        def expire():
+            if not future.done():
+                expired.append(True)
+                future.cancel()
+
+        handle = self.call_later(timeout, expire)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if expired:
+                raise asyncio.TimeoutError() from None
+            raise
+        finally:
+            handle.cancel()
+
+    def run(self, awaitable):
+        """同步运行协程：未完成时跳到下一个事件，没有事件可推动时报错
+
+        定时事件抛出中断（如回放结束 ReplayFinished）时取消协程，继续推动时钟让它的 finally 执行完
+        （平仓、账本/追踪落盘）；协程因取消而结束时再把中断抛给调用方，自行处理了取消则正常返回。
+        """
+        future = asyncio.ensure_future(awaitable, loop=util.getLoop())
+        self.settle()
+        interrupt = None
+        while not future.done():
+            try:
+                if not self.step():
+                    future.cancel()
+                    raise RuntimeError("虚拟时钟没有待执行的事件，等待无法完成")
+            except KeyboardInterrupt as e:
+                if interrupt is not None:
+                    raise
+                interrupt = e
+                future.cancel()
+                self.settle()
+        if interrupt is not None and future.cancelled():
+            raise interrupt
+        return future.result()
+
+
+# 默认时钟
+WALL_CLOCK = WallClock()
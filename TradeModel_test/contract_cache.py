@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+
+from ib_insync import Stock, util
+
+from clock import WALL_CLOCK
+
+logger = logging.getLogger()
+
+
+class ContractCache:
+    """合约缓存 - 持久化 conId / 主交易所 / 最小价位 / 交易时间，重启直接复用，过期后台重新验证"""
+
+    def __init__(self, path='contract_cache.json', ttl=7 * 86400, batch_size=50, clock=None):
+        self.path = path
+        self.clock = clock or WALL_CLOCK  # 有效期按该时钟计算（回放时为 VirtualClock）
+        self.ttl = ttl  # 缓存有效期（秒）
+        self.batch_size = batch_size  # 每批并发验证的合约数量
+        self.entries = {}  # {symbol: {conId, primaryExchange, minTick, tradingHours, liquidHours, ...}}
+        self.background = None  # 后台重新验证任务
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            logger.error(f"读取合约缓存失败: {e}")
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_fresh(self, symbol, now=None):
+        entry = self.entries.get(symbol)
+        now = self.clock.time() if now is None else now
+        return entry is not None and now - entry['cached_at'] < self.ttl
+
+    def get(self, symbol):
+        """缓存的合约详情，没有返回 None"""
+        return self.entries.get(symbol)
+
+    def make_contract(self, symbol):
+        """用缓存重建已验证的合约，无需请求TWS"""
+        entry = self.entries[symbol]
+        return Stock(symbol, 'SMART', entry['currency'], primaryExchange=entry['primaryExchange'],
+                     conId=entry['conId'])
+
+    async def fetch(self, ib, symbol, currency='USD'):
+        """向TWS请求合约详情并写入缓存"""
+        try:
+            details = await ib.reqContractDetailsAsync(Stock(symbol, 'SMART', currency))
+        except Exception as e:
+            logger.error(f"设置合约失败 {symbol}: {e}")
+            return False
+        if not details:
+            logger.warning(f"合约验证失败: {symbol}")
+            return False
+        if len(details) > 1:
+            logger.warning(f"合约不唯一 {symbol}: {len(details)} 个，使用第一个")
+
+        detail = details[0]
+        contract = detail.contract
+        self.entries[symbol] = {
+            'conId': contract.conId,
+            'primaryExchange': contract.primaryExchange,
+            'currency': contract.currency,
+            'minTick': detail.minTick,
+            'timeZoneId': detail.timeZoneId,
+            'tradingHours': detail.tradingHours,
+            'liquidHours': detail.liquidHours,
+            'cached_at': self.clock.time()
+        }
+        return True
+
+    async def fetch_all(self, ib, symbols):
+        """分批并发请求合约详情"""
+        for i in range(0, len(symbols), self.batch_size):
+            batch = symbols[i:i + self.batch_size]
+            await asyncio.gather(*[self.fetch(ib, symbol) for symbol in batch])
+        if symbols:
+            self.save()
+
+    async def revalidate(self, ib, symbols):
+        """后台重新验证过期的缓存"""
+        await self.fetch_all(ib, symbols)
+        logger.info(f"合约缓存已更新: {len(symbols)} 个")
+
+    async def qualify_async(self, ib, symbols):
+        """返回 {symbol: contract}：缓存命中直接使用，缺失的批量请求，过期的后台重新验证"""
+        now = self.clock.time()
+        missing = [symbol for symbol in symbols if symbol not in self.entries]
+        stale = [symbol for symbol in symbols if symbol in self.entries and not self.is_fresh(symbol, now)]
+
+        if missing:
+            logger.info(f"验证合约: {len(missing)} 个（缓存命中 {len(symbols) - len(missing)} 个）")
+            await self.fetch_all(ib, missing)
+        if stale and (self.background is None or self.background.done()):
+            self.background = asyncio.ensure_future(self.revalidate(ib, stale))
+
+        return {symbol: self.make_contract(symbol) for symbol in symbols if symbol in self.entries}
+
+    def qualify(self, ib, symbols):
+        """qualify_async 的同步版本"""
+        return util.run(self.qualify_async(ib, symbols))
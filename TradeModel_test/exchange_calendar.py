@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger()
+
+# 美股常规交易日各时段（距当日 0:00 的分钟数，夜盘属于次日交易日：前一天 20:00 - 当天 4:00）
+US_SESSIONS = [(-240, 240, 'night'), (240, 570, 'pre_market'), (570, 960, 'regular'), (960, 1200, 'after_hours')]
+# 半日市：13:00 收盘，盘后到 17:00
+US_HALF_DAY_SESSIONS = [(-240, 240, 'night'), (240, 570, 'pre_market'), (570, 780, 'regular'),
+                        (780, 1020, 'after_hours')]
+
+
+def easter(year):
+    """复活节日期（公历，Anonymous Gregorian 算法）"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """某月第 n 个星期几（n=-1 为最后一个）"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """周六的假日提前到周五，周日的顺延到周一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    """纽交所全天休市日"""
+    holidays = {
+        nth_weekday(year, 1, 0, 3),  # 马丁路德金日
+        nth_weekday(year, 2, 0, 3),  # 总统日
+        easter(year) - timedelta(days=2),  # 耶稣受难日
+        nth_weekday(year, 5, 0, -1),  # 阵亡将士纪念日
+        observed(date(year, 7, 4)),  # 独立日
+        nth_weekday(year, 9, 0, 1),  # 劳动节
+        nth_weekday(year, 11, 3, 4),  # 感恩节
+        observed(date(year, 12, 25))  # 圣诞节
+    }
+    if date(year, 1, 1).weekday() != 5:  # 元旦逢周六不补休（12/31 照常交易）
+        holidays.add(observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # 六月节
+    return holidays
+
+
+def nyse_half_days(year):
+    """纽交所半日市（13:00 收盘）"""
+    half_days = {nth_weekday(year, 11, 3, 4) + timedelta(days=1)}  # 感恩节次日
+    for day in (date(year, 7, 3), date(year, 12, 24)):
+        if day.weekday() < 4:  # 周一到周四（周五时次日假日提前到当天休市）
+            half_days.add(day)
+    return half_days
+
+
+def parse_ib_hours(hours):
+    """解析 IB tradingHours/liquidHours：{date: [(开始分钟, 结束分钟)]}，休市为空列表
+
+    格式如 '20261019:0400-20261019:2000;20261024:CLOSED'，旧格式结束时间不带日期 '20090507:0930-1600'
+    """
+    table = {}
+    for item in filter(None, (hours or '').split(';')):
+        day_text, _, spans = item.partition(':')
+        day = datetime.strptime(day_text, '%Y%m%d').date()
+        ranges = table.setdefault(day, [])
+        if spans == 'CLOSED':
+            continue
+        for span in spans.split(','):
+            start_text, end_text = span.split('-')
+            start = ib_minutes(day, day_text, start_text)
+            end = ib_minutes(day, day_text, end_text)
+            ranges.append((start, end))
+    return table
+
+
+def ib_minutes(day, day_text, text):
+    """'20261019:0400' -> 相对 day 的分钟数"""
+    if ':' not in text:
+        text = f'{day_text}:{text}'
+    moment = datetime.strptime(text, '%Y%m%d:%H%M')
+    return (moment.date() - day).days * 1440 + moment.hour * 60 + moment.minute
+
+
+class ExchangeCalendar:
+    """交易日历 - 按日期保存各时段区间（当地时间分钟数），规则生成一年，用 IB/长桥 数据覆盖，落盘缓存"""
+
+    def __init__(self, tz, path='calendar_cache.json', days_ahead=366):
+        self.tz = tz
+        self.path = path  # None 则不落盘（回测）
+        self.days_ahead = days_ahead
+        self.table = {}  # {'YYYYMMDD': [[开始分钟, 结束分钟, 时段], ...]}，休市为空列表
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.table = json.load(f)
+        except Exception as e:
+            logger.error(f"读取交易日历缓存失败: {e}")
+            self.table = {}
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.table, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def ensure(self, today):
+        """缓存不足一年时按规则补齐（已有日期保留，可能来自 IB/长桥 覆盖）"""
+        last = today + timedelta(days=self.days_ahead)
+        if last.strftime('%Y%m%d') in self.table:
+            return
+        holidays, half_days = {}, {}
+        day = today - timedelta(days=7)
+        while day <= last:
+            key = day.strftime('%Y%m%d')
+            if key not in self.table:
+                if day.year not in holidays:
+                    holidays[day.year] = nyse_holidays(day.year)
+                    half_days[day.year] = nyse_half_days(day.year)
+                if day.weekday() >= 5 or day in holidays[day.year]:
+                    self.table[key] = []
+                elif day in half_days[day.year]:
+                    self.table[key] = [list(session) for session in US_HALF_DAY_SESSIONS]
+                else:
+                    self.table[key] = [list(session) for session in US_SESSIONS]
+            day += timedelta(days=1)
+        self.save()
+        logger.info(f"交易日历已生成至 {last}")
+
+    def overlay_ib(self, trading_hours, liquid_hours):
+        """用合约详情的 tradingHours/liquidHours 覆盖（休市、半日市以 IB 为准，夜盘沿用规则）"""
+        trading = parse_ib_hours(trading_hours)
+        liquid = parse_ib_hours(liquid_hours)
+        for day, ranges in trading.items():
+            key = day.strftime('%Y%m%d')
+            if not ranges or not liquid.get(day):
+                self.table[key] = []
+                continue
+            start, end = ranges[0][0], ranges[-1][1]
+            liquid_start, liquid_end = liquid[day][0][0], liquid[day][-1][1]
+            sessions = [session for session in self.table.get(key, US_SESSIONS) if session[2] == 'night']
+            if start < liquid_start:
+                sessions.append([start, liquid_start, 'pre_market'])
+            sessions.append([liquid_start, liquid_end, 'regular'])
+            if liquid_end < end:
+                sessions.append([liquid_end, end, 'after_hours'])
+            self.table[key] = [list(session) for session in sessions]
+        if trading:
+            self.save()
+
+    def overlay_longbridge(self, quote_ctx, market, begin, end):
+        """用长桥 QuoteContext 的交易日与交易时段覆盖（港股等市场，tz 应为该市场时区）"""
+        from longbridge.openapi import TradeSession  # 可选依赖，只在使用长桥时导入
+
+        names = [(TradeSession.Pre, 'pre_market'), (TradeSession.Post, 'after_hours')]
+        sessions = []
+        for item in quote_ctx.trading_session():
+            if item.market == market:
+                for info in item.trade_sessions:
+                    name = next((name for value, name in names if info.trade_session == value), 'regular')
+                    sessions.append([info.begin_time.hour * 60 + info.begin_time.minute,
+                                     info.end_time.hour * 60 + info.end_time.minute, name])
+        if not sessions:
+            return
+
+        trading_days, half_days = set(), set()
+        chunk_start = begin
+        while chunk_start <= end:  # 每次请求不超过一个月
+            chunk_end = min(chunk_start + timedelta(days=27), end)
+            result = quote_ctx.trading_days(market, chunk_start, chunk_end)
+            trading_days.update(result.trading_days)
+            half_days.update(result.half_trading_days)
+            chunk_start = chunk_end + timedelta(days=1)
+
+        day = begin
+        while day <= end:
+            if day in half_days:
+                # 半日市只保留第一个常规时段（港股上午盘）
+                regular = [session for session in sessions if session[2] == 'regular'][:1]
+                self.table[day.strftime('%Y%m%d')] = [list(session) for session in regular]
+            elif day in trading_days:
+                self.table[day.strftime('%Y%m%d')] = [list(session) for session in sessions]
+            else:
+                self.table[day.strftime('%Y%m%d')] = []
+            day += timedelta(days=1)
+        self.save()
+
+    def is_trading_day(self, day):
+        return bool(self.sessions(day))
+
+    def sessions(self, day):
+        """某交易日的时段 [(开始分钟, 结束分钟, 时段)]，表中没有的日期按规则计算"""
+        sessions = self.table.get(day.strftime('%Y%m%d'))
+        if sessions is None:
+            if day.weekday() >= 5 or day in nyse_holidays(day.year):
+                return []
+            return US_HALF_DAY_SESSIONS if day in nyse_half_days(day.year) else US_SESSIONS
+        return sessions
+
+    def intervals(self, day):
+        """某交易日各时段的 epoch 区间 [(start_ts, end_ts, session)]（含前一天晚上开始的夜盘）"""
+        midnight = datetime.combine(day, datetime.min.time())
+        return [(self.tz.localize(midnight + timedelta(minutes=start)).timestamp(),
+                 self.tz.localize(midnight + timedelta(minutes=end)).timestamp(), session)
+                for start, end, session in self.sessions(day)]
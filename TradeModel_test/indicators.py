@@ -0,0 +1,291 @@
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 流式指标：每根K线 O(1) 更新；批量指标：NumPy 向量化版本，结果与流式版本一致
+
+
+class RollingMax:
+    """滚动最大值（单调队列）"""
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.queue = deque()  # [(序号, 值)]，值单调递减
+
+    def push(self, value):
+        queue = self.queue
+        while queue and queue[-1][1] <= value:
+            queue.pop()
+        queue.append((self.count, value))
+        self.count += 1
+        if queue[0][0] <= self.count - 1 - self.window:
+            queue.popleft()
+
+    @property
+    def value(self):
+        """窗口未填满时返回 NaN"""
+        if self.count < self.window:
+            return math.nan
+        return self.queue[0][1]
+
+
+class RollingMin(RollingMax):
+    """滚动最小值（单调队列）"""
+
+    def push(self, value):
+        queue = self.queue
+        while queue and queue[-1][1] >= value:
+            queue.pop()
+        queue.append((self.count, value))
+        self.count += 1
+        if queue[0][0] <= self.count - 1 - self.window:
+            queue.popleft()
+
+
+def _rsi_from_sums(gain_sum, loss_sum, window):
+    """与 pandas 写法一致：100 - 100 / (1 + gain/loss)，无涨无跌为 NaN，只涨不跌为 100"""
+    gain = max(gain_sum, 0.0) / window
+    loss = max(loss_sum, 0.0) / window
+    if loss == 0:
+        return math.nan if gain == 0 else 100.0
+    return 100 - 100 / (1 + gain / loss)
+
+
+class RollingRSI:
+    """RSI（涨跌幅简单滚动均值，对应 rolling(window).mean() 写法）"""
+
+    def __init__(self, window=14):
+        self.window = window
+        self.changes = deque()  # [(涨幅, 跌幅)]
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.last_close = None
+
+    def _change(self, close):
+        # 第一根K线的 diff 为 NaN，pandas 写法中被 where 替换为0
+        if self.last_close is None:
+            return 0.0, 0.0
+        delta = close - self.last_close
+        return (delta, 0.0) if delta > 0 else (0.0, -delta if delta < 0 else 0.0)
+
+    def push(self, close):
+        """写入一根已收盘K线的收盘价"""
+        gain, loss = self._change(close)
+        if len(self.changes) == self.window:
+            old_gain, old_loss = self.changes.popleft()
+            self.gain_sum -= old_gain
+            self.loss_sum -= old_loss
+        self.changes.append((gain, loss))
+        self.gain_sum += gain
+        self.loss_sum += loss
+        self.last_close = close
+
+    def peek(self, close):
+        """假设追加收盘价 close 后的 RSI，不修改状态（用于未收盘的当前K线）"""
+        if len(self.changes) + 1 < self.window:
+            return math.nan
+        gain, loss = self._change(close)
+        gain_sum = self.gain_sum + gain
+        loss_sum = self.loss_sum + loss
+        if len(self.changes) == self.window:
+            old_gain, old_loss = self.changes[0]
+            gain_sum -= old_gain
+            loss_sum -= old_loss
+        return _rsi_from_sums(gain_sum, loss_sum, self.window)
+
+    @property
+    def value(self):
+        if len(self.changes) < self.window:
+            return math.nan
+        return _rsi_from_sums(self.gain_sum, self.loss_sum, self.window)
+
+
+class EMA:
+    """指数移动平均（对应 ewm(span, adjust=False)，首值为第一个样本）"""
+
+    def __init__(self, span):
+        self.alpha = 2 / (span + 1)
+        self.value = math.nan
+
+    def push(self, value):
+        if math.isnan(self.value):
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class ATR:
+    """平均真实波幅（真实波幅的简单滚动均值）"""
+
+    def __init__(self, window=14):
+        self.window = window
+        self.ranges = deque()
+        self.range_sum = 0.0
+        self.prev_close = None
+
+    def push(self, high, low, close):
+        true_range = high - low
+        if self.prev_close is not None:
+            true_range = max(true_range, abs(high - self.prev_close), abs(low - self.prev_close))
+        if len(self.ranges) == self.window:
+            self.range_sum -= self.ranges.popleft()
+        self.ranges.append(true_range)
+        self.range_sum += true_range
+        self.prev_close = close
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.ranges) < self.window:
+            return math.nan
+        return max(self.range_sum, 0.0) / self.window
+
+
+class VWAP:
+    """成交量加权均价（典型价 (H+L+C)/3），新时段调用 reset()"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pv_sum = 0.0
+        self.volume_sum = 0.0
+
+    def push(self, high, low, close, volume):
+        self.pv_sum += (high + low + close) / 3 * volume
+        self.volume_sum += volume
+        return self.value
+
+    @property
+    def value(self):
+        if self.volume_sum <= 0:
+            return math.nan
+        return self.pv_sum / self.volume_sum
+
+
+# ---------------- 批量版本 ----------------
+
+def _pad_front(values, window):
+    """滚动结果前 window-1 个位置补 NaN"""
+    return np.concatenate([np.full(window - 1, np.nan), values])
+
+
+def rolling_max(values, window):
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    return _pad_front(sliding_window_view(values, window).max(axis=1), window)
+
+
+def rolling_min(values, window):
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    return _pad_front(sliding_window_view(values, window).min(axis=1), window)
+
+
+def _rolling_mean(values, window):
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    return _pad_front(sliding_window_view(values, window).sum(axis=1) / window, window)
+
+
+def rsi(closes, window=14):
+    """批量 RSI，与 RollingRSI 及原 pandas 写法一致"""
+    closes = np.asarray(closes, dtype=float)
+    if len(closes) == 0:
+        return closes
+    delta = np.diff(closes, prepend=closes[0])
+    gain = _rolling_mean(np.where(delta > 0, delta, 0.0), window)
+    loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
+
+
+def ema(values, span):
+    """批量 EMA（递推式无法向量化，按顺序计算）"""
+    values = np.asarray(values, dtype=float)
+    result = np.empty(len(values))
+    state = EMA(span)
+    for i, value in enumerate(values):
+        result[i] = state.push(value)
+    return result
+
+
+def atr(highs, lows, closes, window=14):
+    highs = np.asarray(highs, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    true_range = highs - lows
+    if len(closes) > 1:
+        prev_close = closes[:-1]
+        true_range[1:] = np.maximum.reduce([true_range[1:],
+                                            np.abs(highs[1:] - prev_close),
+                                            np.abs(lows[1:] - prev_close)])
+    return _rolling_mean(true_range, window)
+
+
+def vwap(highs, lows, closes, volumes):
+    highs = np.asarray(highs, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    volumes = np.asarray(volumes, dtype=float)
+    volume_sum = np.cumsum(volumes)
+    pv_sum = np.cumsum((highs + lows + closes) / 3 * volumes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(volume_sum > 0, pv_sum / volume_sum, np.nan)
+
+
+class TimeframeSignal:
+    """单个标的/周期的流式信号状态：突破 + RSI 投票"""
+
+    def __init__(self, breakout_window=20, rsi_window=14, rsi_low=30, rsi_high=70):
+        self.min_bars = breakout_window  # 原逻辑要求 len(bars) > 20
+        # 阻力/支撑取当前K线之前的 breakout_window-1 根已收盘K线
+        self.resistance = RollingMax(breakout_window - 1)
+        self.support = RollingMin(breakout_window - 1)
+        self.rsi = RollingRSI(rsi_window)
+        self.rsi_low = rsi_low
+        self.rsi_high = rsi_high
+        self.last_date = None  # 已写入的最后一根收盘K线时间
+
+    def sync(self, bars):
+        """把新收盘的K线写入状态（bars 最后一根视为未收盘的当前K线）"""
+        new_bars = []
+        for i in range(len(bars) - 2, -1, -1):
+            bar = bars[i]
+            if self.last_date is not None and bar.date <= self.last_date:
+                break
+            new_bars.append(bar)
+        for bar in reversed(new_bars):
+            self.resistance.push(bar.high)
+            self.support.push(bar.low)
+            self.rsi.push(bar.close)
+            self.last_date = bar.date
+
+    def votes(self, bars, current_price):
+        """返回本周期的信号投票列表（1 做多 / -1 做空 / 0 无信号）"""
+        if len(bars) <= self.min_bars:
+            return []
+        self.sync(bars)
+
+        signals = []
+        # 策略1: 突破策略
+        if current_price > self.resistance.value:
+            signals.append(1)
+        elif current_price < self.support.value:
+            signals.append(-1)
+        else:
+            signals.append(0)
+
+        # 策略2: 均值回归（RSI）
+        current_rsi = self.rsi.peek(bars[-1].close)
+        if current_rsi < self.rsi_low:
+            signals.append(1)
+        elif current_rsi > self.rsi_high:
+            signals.append(-1)
+        return signals
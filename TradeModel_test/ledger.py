@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# 成交记录：定长结构化数组，每笔约 51 字节（原 dict + datetime 约 2KB）
+TRADE_DTYPE = np.dtype([
+    ('symbol_id', np.int32),
+    ('session_id', np.int8),
+    ('reason_id', np.int16),
+    ('quantity', np.int32),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('pnl', np.float64),
+    ('entry_ns', np.int64),  # 入场时间（UTC 纳秒）
+    ('exit_ns', np.int64)  # 出场时间（UTC 纳秒）
+])
+
+
+class SymbolTable:
+    """字符串驻留表 - 名称 <-> 整数编号"""
+
+    def __init__(self, names=()):
+        self.ids = {}
+        self.names = []
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        symbol_id = self.ids.get(name)
+        if symbol_id is None:
+            symbol_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol_id
+
+    def name(self, symbol_id):
+        return self.names[symbol_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Position:
+    """持仓记录（__slots__，合约从 strategy.contracts 取）"""
+
+    __slots__ = ('symbol', 'entry_price', 'stop_loss', 'quantity', 'entry_ns', 'session',
+                 'profit_target', 'bracket', 'trailing')
+
+    def __init__(self, symbol, entry_price, stop_loss, quantity, entry_ns, session, profit_target):
+        self.symbol = symbol
+        self.entry_price = entry_price
+        self.stop_loss = stop_loss
+        self.quantity = quantity
+        self.entry_ns = entry_ns
+        self.session = session
+        self.profit_target = profit_target
+        self.bracket = None  # 括号单 {'oca_group', 'take_profit', 'stop'}
+        self.trailing = False  # 移动止损已启动
+
+
+class TradeLedger:
+    """交易账本 - 预分配分块追加，写满的块落盘（内存映射读取），聚合查询向量化"""
+
+    def __init__(self, path=None, chunk_size=4096):
+        self.path = path  # 落盘目录，None 则写满的块留在内存
+        self.chunk_size = chunk_size
+        self.symbols = SymbolTable()
+        self.sessions = SymbolTable()
+        self.reasons = SymbolTable()
+        self.chunk = np.zeros(chunk_size, dtype=TRADE_DTYPE)
+        self.size = 0  # 当前块已用行数
+        self.full_chunks = []  # 写满的块（内存数组或 .npy 路径）
+        self.full_rows = 0
+
+    def __len__(self):
+        return self.full_rows + self.size
+
+    def append(self, symbol, session, reason, quantity, entry_price, exit_price, entry_ns, exit_ns):
+        """追加一笔成交；reason 只保留类别（去掉括号内的盈亏百分比）"""
+        if self.size == self.chunk_size:
+            self.spill()
+        self.chunk[self.size] = (
+            self.symbols.intern(symbol),
+            self.sessions.intern(session),
+            self.reasons.intern(reason.split(' (')[0]),
+            quantity,
+            entry_price,
+            exit_price,
+            (exit_price - entry_price) * quantity,
+            entry_ns,
+            exit_ns
+        )
+        self.size += 1
+
+    def spill(self):
+        """当前块写满：落盘（或留在内存）后换新块"""
+        if self.path is None:
+            self.full_chunks.append(self.chunk)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            chunk_path = os.path.join(self.path, f'chunk_{len(self.full_chunks):06d}.npy')
+            np.save(chunk_path, self.chunk)
+            self.full_chunks.append(chunk_path)
+            self.save_tables()
+        self.full_rows += self.size
+        self.chunk = np.zeros(self.chunk_size, dtype=TRADE_DTYPE)
+        self.size = 0
+
+    def save_tables(self):
+        """保存编号表，落盘的块可独立解读"""
+        tables = {'symbols': self.symbols.names, 'sessions': self.sessions.names, 'reasons': self.reasons.names}
+        tmp_path = os.path.join(self.path, 'tables.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, 'tables.json'))
+
+    def flush(self):
+        """当前块未写满的部分落盘（程序结束时调用）"""
+        if self.path is None or self.size == 0:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            np.save(os.path.join(self.path, 'tail.npy'), self.chunk[:self.size])
+            self.save_tables()
+        except Exception as e:
+            logger.error(f"保存交易账本失败: {e}")
+
+    def records(self, since_ns=None):
+        """全部成交记录（结构化数组），since_ns 只取该时间之后出场的"""
+        parts = [np.load(chunk, mmap_mode='r') if isinstance(chunk, str) else chunk
+                 for chunk in self.full_chunks]
+        parts.append(self.chunk[:self.size])
+        records = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if since_ns is not None:
+            records = records[records['exit_ns'] >= since_ns]
+        return records
+
+    def summary(self, since_ns=None):
+        """交易次数 / 总盈亏 / 盈利笔数 / 胜率"""
+        pnl = self.records(since_ns)['pnl']
+        count = len(pnl)
+        wins = int(np.count_nonzero(pnl > 0))
+        return {
+            'count': count,
+            'pnl': float(pnl.sum()),
+            'wins': wins,
+            'win_rate': wins / count * 100 if count else 0.0
+        }
+
+    def pnl_by(self, field, since_ns=None):
+        """按 symbol / session / reason 汇总盈亏"""
+        table = {'symbol': self.symbols, 'session': self.sessions, 'reason': self.reasons}[field]
+        records = self.records(since_ns)
+        totals = np.bincount(records[f'{field}_id'], weights=records['pnl'], minlength=len(table))
+        return {table.name(i): float(total) for i, total in enumerate(totals)}
+
+    def to_frame(self, tz='America/New_York'):
+        """转为 DataFrame（名称还原、时间转为 tz 时区）"""
+        records = self.records()
+        return pd.DataFrame({
+            'symbol': [self.symbols.name(i) for i in records['symbol_id']],
+            'entry_price': records['entry_price'],
+            'exit_price': records['exit_price'],
+            'quantity': records['quantity'],
+            'pnl': records['pnl'],
+            'pnl_pct': (records['exit_price'] - records['entry_price']) / records['entry_price'] * 100,
+            'entry_time': pd.to_datetime(records['entry_ns'], utc=True).tz_convert(tz),
+            'exit_time': pd.to_datetime(records['exit_ns'], utc=True).tz_convert(tz),
+            'reason': [self.reasons.name(i) for i in records['reason_id']],
+            'session': [self.sessions.name(i) for i in records['session_id']]
+        })
+
+
+class TradeStats:
+    """运行中统计 - 每次成交 O(1) 更新：已实现/未实现盈亏、胜率、按时段/按日汇总、最大回撤、平均持仓时间"""
+
+    def __init__(self, account_value=0.0):
+        self.account_value = account_value
+        self.count = 0
+        self.wins = 0
+        self.realised = 0.0
+        self.hold_ns = 0  # 累计持仓时间
+        self.peak = 0.0  # 已实现盈亏曲线高点
+        self.max_drawdown = 0.0
+        self.sessions = {}  # {session: [次数, 盈亏, 盈利笔数]}
+        self.days = {}  # {date: [次数, 盈亏, 盈利笔数]}
+        self.open_cost = {}  # {symbol: (数量, 成本价)}
+        self.closing = {}  # {symbol: 部分平仓已实现盈亏}
+
+    def on_open(self, symbol, quantity, entry_price):
+        self.open_cost[symbol] = (quantity, entry_price)
+
+    def on_close(self, symbol, session, day, pnl, hold_ns, remaining=0):
+        """平仓成交：更新全部汇总
+
+        部分平仓（remaining > 0）只累计盈亏，持仓全部卖出时才按整笔持仓计一次交易和胜负，与逐笔持仓统计一致。
+        """
+        self.realised += pnl
+        self.peak = max(self.peak, self.realised)
+        self.max_drawdown = max(self.max_drawdown, self.peak - self.realised)
+        position_pnl = self.closing.pop(symbol, 0.0) + pnl
+        if remaining > 0:
+            self.closing[symbol] = position_pnl
+            self.open_cost[symbol] = (remaining, self.open_cost.get(symbol, (0, 0.0))[1])
+            count = win = 0
+        else:
+            self.open_cost.pop(symbol, None)
+            count, win = 1, position_pnl > 0
+            self.count += 1
+            self.wins += win
+            self.hold_ns += hold_ns
+        for buckets, key in ((self.sessions, session), (self.days, day)):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, 0.0, 0]
+            bucket[0] += count
+            bucket[1] += pnl
+            bucket[2] += win
+
+    def unrealised(self, get_price):
+        """未实现盈亏（get_price 读取缓存报价，无报价的持仓不计）"""
+        total = 0.0
+        for symbol, (quantity, entry_price) in self.open_cost.items():
+            price = get_price(symbol)
+            if price > 0:
+                total += (price - entry_price) * quantity
+        return total
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count * 100 if self.count else 0.0
+
+    @property
+    def avg_hold_seconds(self):
+        return self.hold_ns / self.count / 1e9 if self.count else 0.0
+
+    @property
+    def max_drawdown_pct(self):
+        base = self.account_value + self.peak
+        return self.max_drawdown / base * 100 if base > 0 else 0.0
+
+    def day(self, day):
+        """某日 (次数, 盈亏, 盈利笔数)"""
+        return tuple(self.days.get(day, (0, 0.0, 0)))
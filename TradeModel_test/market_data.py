@@ -0,0 +1,77 @@
+import logging
+
+logger = logging.getLogger()
+
+
+class MarketDataRegistry:
+    """行情订阅登记表 - 同一合约只占用一条行情线，按引用计数释放"""
+
+    def __init__(self, ib_instance):
+        self.ib = ib_instance
+        self.subscriptions = {}  # {key: [ticker, 引用计数]}
+        self.total_requests = 0  # 累计发出的 reqMktData 次数
+        self.total_cancels = 0  # 累计发出的 cancelMktData 次数
+
+    @staticmethod
+    def contract_key(contract):
+        """合约唯一键：优先 conId，未验证的合约用代码+类型+交易所+币种"""
+        if contract.conId:
+            return contract.conId
+        return (contract.symbol, contract.secType, contract.exchange, contract.currency)
+
+    def acquire(self, contract, generic_tick_list=''):
+        """获取合约行情，已订阅则只增加引用计数"""
+        key = self.contract_key(contract)
+        entry = self.subscriptions.get(key)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0]
+
+        ticker = self.ib.reqMktData(contract, generic_tick_list, False, False)
+        self.subscriptions[key] = [ticker, 1]
+        self.total_requests += 1
+        return ticker
+
+    def release(self, contract):
+        """释放一次引用，最后一个使用者释放时取消行情线"""
+        key = self.contract_key(contract)
+        entry = self.subscriptions.get(key)
+        if entry is None:
+            return
+
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self.subscriptions[key]
+            try:
+                self.ib.cancelMktData(entry[0].contract)
+                self.total_cancels += 1
+            except Exception as e:
+                logger.error(f"取消行情失败 {contract.symbol}: {e}")
+
+    def release_all(self):
+        """强制取消全部行情线"""
+        for key in list(self.subscriptions):
+            ticker = self.subscriptions.pop(key)[0]
+            try:
+                self.ib.cancelMktData(ticker.contract)
+                self.total_cancels += 1
+            except Exception as e:
+                logger.error(f"取消行情失败 {ticker.contract.symbol}: {e}")
+
+    def refcount(self, contract):
+        """当前引用计数"""
+        entry = self.subscriptions.get(self.contract_key(contract))
+        return entry[1] if entry else 0
+
+    def active_lines(self):
+        """当前占用的行情线数量"""
+        return len(self.subscriptions)
+
+    def stats(self):
+        """订阅统计"""
+        return {
+            'active_lines': len(self.subscriptions),
+            'consumers': sum(entry[1] for entry in self.subscriptions.values()),
+            'total_requests': self.total_requests,
+            'total_cancels': self.total_cancels
+        }
@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# HDR 风格分档：每个二进制量级线性细分 2^(SUB_BITS-1) 档，相对误差 < 1%（相当于两位有效数字）
+SUB_BITS = 8
+HALF = 1 << (SUB_BITS - 1)
+MAX_EXPONENT = 34  # 可分辨到约 2^42 纳秒（73 分钟），更大的值记入最后一档
+LAST_BUCKET = (MAX_EXPONENT + 2) * HALF - 1
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def bucket_index(value):
+    exponent = max(value.bit_length() - SUB_BITS, 0)
+    return (exponent << (SUB_BITS - 1)) + (value >> exponent)
+
+
+def bucket_upper(index):
+    """分档内的最大值（与 HdrHistogram 的 highestEquivalentValue 相同）"""
+    exponent = max(index // HALF - 1, 0)
+    return (((index - exponent * HALF) + 1) << exponent) - 1
+
+
+def format_ns(ns):
+    if ns < 1e3:
+        return f"{ns:.0f}ns"
+    if ns < 1e6:
+        return f"{ns / 1e3:.1f}us"
+    if ns < 1e9:
+        return f"{ns / 1e6:.1f}ms"
+    return f"{ns / 1e9:.2f}s"
+
+
+class Histogram:
+    """纳秒耗时直方图 - 对数分段、段内线性细分，记录 O(1)，内存只随出现过的分档增长，可随时查询任意分位数"""
+
+    def __init__(self):
+        self.counts = {}  # {分档序号: 次数}，只保存出现过的分档
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, ns):
+        ns = max(int(ns), 0)
+        index = min(bucket_index(ns), LAST_BUCKET)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        if not self.count or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.count += 1
+        self.total += ns
+
+    def percentiles(self, qs):
+        """多个分位数（q 取 0-100，升序）一次遍历，返回所在分档的上界，不超过实际最大值"""
+        if not self.count:
+            return [0] * len(qs)
+        targets = [max(1, round(self.count * q / 100)) for q in qs]
+        results = []
+        seen = 0
+        for index, n in sorted(self.counts.items()):
+            seen += n
+            while len(results) < len(targets) and seen >= targets[len(results)]:
+                results.append(min(bucket_upper(index), self.max))
+            if len(results) == len(targets):
+                break
+        return results + [self.max] * (len(targets) - len(results))
+
+    def percentile(self, q):
+        return self.percentiles([q])[0]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """运行指标 - 各阶段耗时直方图、计数器、按需读取的状态值，导出 Prometheus 文本格式"""
+
+    def __init__(self, prefix='strategy'):
+        self.prefix = prefix
+        self.histograms = {}  # {stage: Histogram}
+        self.counters = {}  # {name: 累计值}
+        self.collectors = {}  # {name: (类型, 读取函数)} 导出时读取，如在途订单数
+        self.server = None
+
+    def observe(self, stage, ns):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.record(ns)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter_ns() - started)
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def register(self, name, func, kind='gauge'):
+        """登记导出时读取的值，kind 为 gauge（当前值）或 counter（累计值）"""
+        self.collectors[name] = (kind, func)
+
+    def render(self):
+        """Prometheus 文本格式（耗时为 summary，单位秒）"""
+        prefix = self.prefix
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, histogram in sorted(self.histograms.items()):
+            for q, value in zip(QUANTILES, histogram.percentiles([q * 100 for q in QUANTILES])):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {value / 1e9:.9g}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.total / 1e9:.9g}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        lines.append(f"# TYPE {prefix}_stage_max_seconds gauge")
+        for stage, histogram in sorted(self.histograms.items()):
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{stage}"}} {histogram.max / 1e9:.9g}')
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        for name, (kind, func) in sorted(self.collectors.items()):
+            try:
+                value = func()
+            except Exception as e:
+                logger.error(f"读取指标失败 {name}: {e}")
+                continue
+            metric = f"{prefix}_{name}_total" if kind == 'counter' else f"{prefix}_{name}"
+            lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """状态输出用：每个阶段一行 次数 / 中位 / p99 / 最大"""
+        lines = []
+        for stage, histogram in sorted(self.histograms.items()):
+            median, p99 = histogram.percentiles([50, 99])
+            lines.append(f"  {stage}: {histogram.count}次, 中位 {format_ns(median)}, "
+                         f"p99 {format_ns(p99)}, 最大 {format_ns(histogram.max)}")
+        if self.counters:
+            lines.append("  " + ", ".join(f"{name}: {value}" for name, value in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+    # ---------- HTTP 导出 ----------
+
+    async def start(self, port, host='127.0.0.1'):
+        """在事件循环上启动 /metrics 服务（同步策略在 sleep 等待期间响应抓取）"""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"指标导出: http://{host}:{port}/metrics")
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # 忽略请求头
+            if len(request) >= 2 and request[0] == 'GET' and request[1].split('?')[0] in ('/', '/metrics'):
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def timed(stage):
+    """方法装饰器：调用耗时记入 self.metrics 的 stage 直方图"""
+
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter_ns()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.metrics.observe(stage, time.perf_counter_ns() - started)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,551 @@
+import argparse
+import asyncio
+import logging
+import math
+import random
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+
+from bar_store import bar_seconds, duration_seconds
+from order_manager import DONE_STATES
+
+logger = logging.getLogger()
+
+SERVER_VERSION = 176  # ib_insync 支持的最高协议版本，回复格式按该版本
+
+# 报价类型
+TICK_BID = 1
+TICK_ASK = 2
+TICK_LAST = 4
+
+
+def conid(symbol):
+    """按代码生成固定的 conId"""
+    return zlib.crc32(symbol.encode()) & 0x7fffffff
+
+
+def number(field):
+    """请求中的数值字段，空值（UNSET）为 None"""
+    return float(field) if field else None
+
+
+class MockOrder:
+    __slots__ = ('order_id', 'perm_id', 'symbol', 'currency', 'action', 'quantity', 'order_type', 'lmt_price',
+                 'aux_price', 'trail_stop', 'trailing_percent', 'oca_group', 'parent_id', 'filled', 'avg_price',
+                 'status', 'active')
+
+    def __init__(self, order_id, perm_id, fields):
+        self.order_id = order_id
+        self.perm_id = perm_id
+        self.symbol = fields[3]
+        self.currency = fields[11] or 'USD'
+        self.filled = 0.0
+        self.avg_price = 0.0
+        self.status = 'PendingSubmit'
+        self.active = False  # 已生效、参与撮合
+        self.trail_stop = None
+        self.update(fields)
+
+    def update(self, fields):
+        """placeOrder 字段（非组合合约）：16 方向 17 数量 18 类型 19 限价 20 辅助价 22 OCA 组 27 发送 28 父单"""
+        self.action = fields[16]
+        self.quantity = float(fields[17])
+        self.order_type = fields[18]
+        self.lmt_price = number(fields[19])
+        self.aux_price = number(fields[20])
+        self.oca_group = fields[22]
+        self.parent_id = int(fields[28] or 0)
+        offset = 67 + (8 if fields[65] else 0)  # deltaNeutralOrderType 非空时多 8 个字段
+        trail_stop = number(fields[offset + 2])
+        if trail_stop is not None:
+            self.trail_stop = trail_stop
+        self.trailing_percent = number(fields[offset + 3])
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled
+
+    @property
+    def done(self):
+        return self.status in DONE_STATES
+
+
+class GatewaySession:
+    """单个 API 连接 - 解析请求，按设定延迟回复，推送报价/K线更新/成交"""
+
+    def __init__(self, gateway, reader, writer):
+        self.gateway = gateway
+        self.reader = reader
+        self.writer = writer
+        self.client_id = 0
+        self.quotes = {}  # {symbol: set(reqId)} 行情订阅
+        self.quote_symbols = {}  # {reqId: symbol}
+        self.bars = {}  # {reqId: [symbol, 周期秒数, 开始, open, high, low, close, volume, count]} keepUpToDate
+        self.orders = {}  # {orderId: MockOrder}
+        self.handlers = {
+            1: self.req_mkt_data,
+            2: self.cancel_mkt_data,
+            3: self.place_order,
+            4: self.cancel_order,
+            5: lambda fields: self.reply(0, (53, 1)),  # openOrderEnd
+            6: lambda fields: self.reply(0, (54, 1, fields[3])),  # accountDownloadEnd
+            7: lambda fields: self.reply(0, (55, 1, fields[2])),  # execDetailsEnd
+            8: lambda fields: self.reply(0, (9, 1, self.gateway.next_order_id(self))),
+            9: self.req_contract_details,
+            20: self.req_historical_data,
+            25: lambda fields: self.bars.pop(int(fields[2]), None),
+            49: lambda fields: self.reply(0, (49, 1, int(self.gateway.time()))),
+            61: lambda fields: self.reply(0, (62, 1)),  # positionEnd
+            71: self.start_api,
+            76: lambda fields: self.reply(0, (74, 1, fields[2])),  # accountUpdateMultiEnd
+            99: lambda fields: self.reply(0, (102,)),  # completedOrdersEnd
+        }
+
+    # ---------- 收发 ----------
+
+    async def run(self):
+        try:
+            if await self.reader.readexactly(4) != b'API\0':
+                return
+            await self.read_message()  # 客户端版本范围
+            self.send(SERVER_VERSION, datetime.now().strftime('%Y%m%d %H:%M:%S'))
+            while True:
+                fields = await self.read_message()
+                self.gateway.requests += 1
+                handler = self.handlers.get(int(fields[0]))
+                if handler is None:
+                    continue
+                try:
+                    handler(fields)
+                except Exception as e:
+                    logger.error(f"模拟网关处理请求出错 {fields[:3]}: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.gateway.sessions.discard(self)
+            self.gateway.order_ids.pop(self, None)
+            self.writer.close()
+
+    async def read_message(self):
+        size = struct.unpack('>I', await self.reader.readexactly(4))[0]
+        data = await self.reader.readexactly(size)
+        return data.decode(errors='backslashreplace').split('\0')[:-1]
+
+    def send(self, *fields):
+        if self.writer.is_closing():
+            return
+        text = ''.join(f'{"" if field is None else int(field) if isinstance(field, bool) else field}\0'
+                       for field in fields)
+        data = text.encode()
+        self.writer.write(struct.pack('>I', len(data)) + data)
+        self.gateway.messages += 1
+
+    def reply(self, delay, *messages):
+        """delay 秒后按顺序发送 messages（每条为字段元组）"""
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.send_all, messages)
+        else:
+            self.send_all(messages)
+
+    def send_all(self, messages):
+        for fields in messages:
+            self.send(*fields)
+
+    # ---------- 连接 ----------
+
+    def start_api(self, fields):
+        self.client_id = int(fields[2])
+        self.reply(0, (9, 1, self.gateway.next_order_id(self)), (15, 1, self.gateway.account))
+
+    # ---------- 合约 ----------
+
+    def req_contract_details(self, fields):
+        req_id, symbol, currency = fields[2], fields[4], fields[12] or 'USD'
+        details = (10, req_id, symbol, 'STK', '', '', '', 'SMART', currency, symbol, 'NMS', 'NMS', conid(symbol),
+                   0.01, '', 'LMT,MKT,STP,TRAIL', 'SMART,NASDAQ', 1, 0, symbol, 'NASDAQ', '', '', '', '',
+                   'US/Eastern', '', '', '', '', 0, 1, '', '', '26', '', 'COMMON', 1, 1, 100)
+        self.reply(self.gateway.latency, details, (52, 1, req_id))
+
+    # ---------- 行情 ----------
+
+    def req_mkt_data(self, fields):
+        req_id, symbol = int(fields[2]), fields[4]
+        self.quote_symbols[req_id] = symbol
+        self.quotes.setdefault(symbol, set()).add(req_id)
+        price = self.gateway.price(symbol)
+        self.reply(self.gateway.latency, *self.tick_messages(req_id, price))
+
+    def cancel_mkt_data(self, fields):
+        symbol = self.quote_symbols.pop(int(fields[2]), None)
+        if symbol is not None:
+            self.quotes[symbol].discard(int(fields[2]))
+
+    def tick_messages(self, req_id, price):
+        half = price * self.gateway.spread / 2
+        size = self.gateway.rng.randint(1, 50) * 100
+        return ((1, 6, req_id, TICK_BID, f'{price - half:.2f}', size, 0),
+                (1, 6, req_id, TICK_ASK, f'{price + half:.2f}', size, 0),
+                (1, 6, req_id, TICK_LAST, f'{price:.2f}', 100, 0))
+
+    def on_tick(self, symbol, price, now):
+        """新报价：推送给订阅者，更新未收盘K线，撮合订单"""
+        for req_id in self.quotes.get(symbol, ()):
+            self.send_all(self.tick_messages(req_id, price))
+        for bar in self.bars.values():
+            if bar[0] == symbol:
+                self.update_bar(bar, price, now)
+        for order in list(self.orders.values()):
+            if order.active and order.symbol == symbol:
+                self.match(order, price)
+
+    # ---------- 历史数据 ----------
+
+    def req_historical_data(self, fields):
+        """合成随机游走K线，最后一根收盘价为当前价；formatDate=2 日内K线用 epoch 秒，日线用 YYYYMMDD"""
+        req_id, symbol = int(fields[1]), fields[3]
+        size = bar_seconds(fields[16])
+        count = min(max(duration_seconds(fields[17]) // size, 1), self.gateway.max_bars)
+        keep_up_to_date = fields[21] == '1'
+        now = int(self.gateway.time())
+        end = now - now % size
+        rng = self.gateway.rng
+        closes = [self.gateway.price(symbol)]
+        step = self.gateway.volatility * math.sqrt(size)
+        for _ in range(count - 1):
+            closes.append(closes[-1] * math.exp(rng.gauss(0, step)))
+        closes.reverse()
+
+        message = [17, req_id, '', '', count]
+        bar = None
+        for i, close in enumerate(closes):
+            start = end - (count - 1 - i) * size
+            open_ = closes[i - 1] if i else close
+            high = max(open_, close) * (1 + abs(rng.gauss(0, step / 2)))
+            low = min(open_, close) * (1 - abs(rng.gauss(0, step / 2)))
+            volume = rng.randint(10, 1000) * 100
+            date = datetime.fromtimestamp(start, timezone.utc).strftime('%Y%m%d') if size >= 86400 else start
+            message += [date, f'{open_:.2f}', f'{high:.2f}', f'{low:.2f}', f'{close:.2f}', volume, f'{close:.2f}', 1]
+            bar = [symbol, size, start, open_, high, low, close, volume, 1]
+        if keep_up_to_date and size < 86400:
+            self.bars[req_id] = bar
+        self.reply(self.gateway.latency, message)
+
+    def update_bar(self, bar, price, now):
+        size = bar[1]
+        start = int(now) - int(now) % size
+        if start != bar[2]:
+            bar[2:] = [start, price, price, price, price, 0, 0]
+        else:
+            bar[4] = max(bar[4], price)
+            bar[5] = min(bar[5], price)
+            bar[6] = price
+        bar[7] += 100
+        bar[8] += 1
+
+    def push_bars(self):
+        """推送 keepUpToDate 的未收盘K线（historicalDataUpdate）"""
+        for req_id, (_, _, start, open_, high, low, close, volume, count) in self.bars.items():
+            self.send(90, req_id, count, start, f'{open_:.2f}', f'{close:.2f}', f'{high:.2f}', f'{low:.2f}',
+                      f'{close:.2f}', volume)
+
+    # ---------- 订单 ----------
+
+    def place_order(self, fields):
+        order_id = int(fields[1])
+        order = self.orders.get(order_id)
+        if order is not None:
+            if fields[27] == '0':  # transmit=False：与 TWS 一样只保存修改，不发送到交易所
+                logger.warning(f"修改订单未发送 (transmit=False): {order.symbol} #{order_id}")
+                return
+            order.update(fields)
+            if not order.done:
+                self.reply(self.gateway.order_latency, self.status_message(order))
+            return
+        order = self.orders[order_id] = MockOrder(order_id, self.gateway.next_perm_id(), fields)
+        self.gateway.next_order_id(self, order_id + 1)
+        asyncio.get_running_loop().call_later(self.gateway.order_latency, self.activate, order)
+
+    def activate(self, order):
+        """订单生效：子单等父单成交后才参与撮合"""
+        if order.done:
+            return
+        parent = self.orders.get(order.parent_id)
+        if parent is not None and parent.status != 'Filled':
+            self.set_status(order, 'PreSubmitted')
+            return
+        order.active = True
+        self.set_status(order, 'Submitted')
+        self.match(order, self.gateway.price(order.symbol))
+
+    def cancel_order(self, fields):
+        order = self.orders.get(int(fields[2]))
+        if order is not None:
+            asyncio.get_running_loop().call_later(self.gateway.order_latency, self.cancel, order)
+
+    def cancel(self, order):
+        if order.done:
+            return
+        order.active = False
+        self.set_status(order, 'Cancelled')
+        if order.filled == 0:
+            for child in self.orders.values():
+                if child.parent_id == order.order_id:
+                    self.cancel(child)
+
+    def status_message(self, order):
+        return (3, order.order_id, order.status, order.filled, order.remaining, order.avg_price, order.perm_id,
+                order.parent_id, order.avg_price, self.client_id, '', 0)
+
+    def set_status(self, order, status):
+        order.status = status
+        self.reply(0, self.status_message(order))
+
+    def match(self, order, price):
+        """与 SimIB.match 相同的撮合规则：限价更优才成交，止损/跟踪止损触发后按市价成交"""
+        buy = order.action == 'BUY'
+        half = price * self.gateway.spread / 2
+        market_price = price + half if buy else price - half
+        if order.order_type == 'MKT':
+            fill_price = market_price
+        elif order.order_type == 'LMT':
+            if (buy and market_price > order.lmt_price) or (not buy and market_price < order.lmt_price):
+                return
+            fill_price = min(order.lmt_price, market_price) if buy else max(order.lmt_price, market_price)
+        elif order.order_type in ('STP', 'TRAIL'):
+            stop = order.aux_price if order.order_type == 'STP' else self.trail_stop(order, price)
+            if (buy and price < stop) or (not buy and price > stop):
+                return
+            fill_price = market_price
+        else:
+            order.active = False
+            self.set_status(order, 'Inactive')
+            return
+        quantity = order.remaining
+        if self.gateway.max_fill is not None:
+            quantity = min(quantity, self.gateway.max_fill)
+        if quantity > 0:
+            self.fill(order, quantity, round(fill_price, 2))
+
+    def trail_stop(self, order, price):
+        if order.trailing_percent:
+            amount = price * order.trailing_percent / 100
+        else:
+            amount = order.aux_price
+        stop = price - amount if order.trail_stop is None else max(order.trail_stop, price - amount)
+        order.trail_stop = stop
+        return stop
+
+    def fill(self, order, quantity, price):
+        """成交：execDetails + commissionReport + orderStatus，延迟 fill_latency 发出"""
+        gateway = self.gateway
+        gateway.fills += 1
+        filled = order.filled + quantity
+        order.avg_price = (order.avg_price * order.filled + price * quantity) / filled
+        order.filled = filled
+        exec_id = f'mock.{gateway.fills}'
+        moment = datetime.fromtimestamp(gateway.time(), timezone.utc).strftime('%Y%m%d %H:%M:%S UTC')
+        execution = (11, -1, order.order_id, conid(order.symbol), order.symbol, 'STK', '', '', '', '', 'SMART',
+                     order.currency, order.symbol, 'NMS', exec_id, moment, gateway.account, 'MOCK',
+                     'BOT' if order.action == 'BUY' else 'SLD', quantity, price, order.perm_id, self.client_id,
+                     0, filled, order.avg_price, '', '', '', '', 0)
+        commission = (59, 1, exec_id, round(max(1.0, 0.005 * quantity), 2), 'USD', '', '', '')
+        if order.remaining > 0:
+            order.status = 'Submitted'
+            self.reply(gateway.fill_latency, execution, commission, self.status_message(order))
+            return
+        order.active = False
+        order.status = 'Filled'
+        self.reply(gateway.fill_latency, execution, commission, self.status_message(order))
+
+        for other in self.orders.values():
+            if other is not order and order.oca_group and other.oca_group == order.oca_group and not other.done:
+                self.cancel(other)
+        for child in self.orders.values():
+            if child.parent_id == order.order_id and child.status == 'PreSubmitted':
+                self.activate(child)
+
+
+class MockGateway:
+    """本地模拟 TWS 网关 - 实现 ib_insync 连接所需的 socket 协议子集
+
+    合成报价（tick_rate 为每秒全部订阅合计的报价次数）、历史K线、合约详情与订单成交，
+    latency 为请求回复延迟，order_latency 为下单/撤单生效延迟，fill_latency 为成交回报延迟（秒）；
+    默认端口 7496 与策略 __main__ 连接的端口一致，连接 7497 的测试脚本需以 --port 7497 启动
+    """
+
+    def __init__(self, host='127.0.0.1', port=7496, tick_rate=1000, latency=0.0, order_latency=0.0,
+                 fill_latency=0.0, bar_interval=5.0, volatility=0.0005, spread=0.0002, max_fill=None,
+                 max_bars=2000, account='DU000000', seed=0):
+        self.host = host
+        self.port = port  # 0 则由系统分配，start 后更新
+        self.tick_rate = tick_rate
+        self.latency = latency
+        self.order_latency = order_latency
+        self.fill_latency = fill_latency
+        self.bar_interval = bar_interval  # keepUpToDate K线推送间隔（秒）
+        self.volatility = volatility  # 每秒对数收益标准差，报价与合成K线共用
+        self.spread = spread
+        self.max_fill = max_fill  # 每个报价最多成交股数，None 为全部成交
+        self.max_bars = max_bars  # 单次历史数据请求最多返回的K线数量
+        self.account = account
+        self.rng = random.Random(seed)
+        self.prices = {}  # {symbol: 当前价}
+        self.sessions = set()
+        self.server = None
+        self.tasks = []
+        self.order_ids = {}  # {session: 下一个有效 orderId}
+        self.perm_id = 0
+
+        # 统计
+        self.requests = 0
+        self.messages = 0
+        self.ticks = 0
+        self.fills = 0
+
+    @staticmethod
+    def time():
+        return time.time()
+
+    def price(self, symbol):
+        price = self.prices.get(symbol)
+        if price is None:
+            price = self.prices[symbol] = round(self.rng.uniform(20, 500), 2)
+        return price
+
+    def next_order_id(self, session, at_least=1):
+        order_id = self.order_ids[session] = max(self.order_ids.get(session, 1), at_least)
+        return order_id
+
+    def next_perm_id(self):
+        self.perm_id += 1
+        return self.perm_id
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.on_connect, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.tasks = [asyncio.ensure_future(self.tick_loop()), asyncio.ensure_future(self.bar_loop())]
+        logger.info(f"模拟网关已启动: {self.host}:{self.port}, 报价 {self.tick_rate}/秒")
+        return self
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for session in list(self.sessions):
+            session.writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        await self.server.serve_forever()
+
+    def on_connect(self, reader, writer):
+        session = GatewaySession(self, reader, writer)
+        self.sessions.add(session)
+        asyncio.ensure_future(session.run())
+
+    async def tick_loop(self, interval=0.01):
+        """按 tick_rate 生成报价：每个周期随机选取已订阅的标的做一步随机游走"""
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        carry = 0.0
+        while True:
+            await asyncio.sleep(interval)
+            now = loop.time()
+            carry += (now - last) * self.tick_rate
+            last = now
+            symbols = list({symbol for session in self.sessions for symbol, req_ids in session.quotes.items()
+                            if req_ids})
+            if not symbols:
+                carry = 0.0
+                continue
+            count = int(carry)
+            carry -= count
+            step = self.volatility * math.sqrt(len(symbols) / self.tick_rate)  # 每个标的每秒波动为 volatility
+            wall = self.time()
+            for _ in range(count):
+                symbol = self.rng.choice(symbols)
+                price = self.prices[symbol] = max(round(self.price(symbol) * math.exp(self.rng.gauss(0, step)), 2),
+                                                  0.01)
+                self.ticks += 1
+                for session in self.sessions:
+                    session.on_tick(symbol, price, wall)
+            await asyncio.gather(*[session.writer.drain() for session in self.sessions], return_exceptions=True)
+
+    async def bar_loop(self):
+        while True:
+            await asyncio.sleep(self.bar_interval)
+            for session in self.sessions:
+                session.push_bars()
+
+    def stats(self):
+        return {'sessions': len(self.sessions), 'requests': self.requests, 'messages': self.messages,
+                'ticks': self.ticks, 'fills': self.fills}
+
+
+async def load_test(symbols=200, seconds=10, tick_rate=5000, orders=50):
+    """自检：本进程内启动网关，ib_insync 连接后订阅行情，统计报价吞吐与市价单往返延迟"""
+    from ib_insync import IB, MarketOrder, Stock
+
+    gateway = await MockGateway(port=0, tick_rate=tick_rate).start()
+    ib = IB()
+    try:
+        await ib.connectAsync(gateway.host, gateway.port, clientId=1)
+        contracts = [Stock(f'S{n:03d}', 'SMART', 'USD') for n in range(symbols)]
+        await ib.qualifyContractsAsync(*contracts)
+        received = 0
+
+        def on_pending(tickers):
+            nonlocal received
+            received += len(tickers)
+
+        ib.pendingTickersEvent += on_pending
+        for contract in contracts:
+            ib.reqMktData(contract)
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        elapsed = time.perf_counter() - started
+
+        latencies = []
+        for n in range(orders):
+            sent = time.perf_counter()
+            trade = ib.placeOrder(contracts[n % symbols], MarketOrder('BUY', 100))
+            while not trade.isDone():
+                await asyncio.sleep(0)
+            latencies.append(time.perf_counter() - sent)
+        latencies.sort()
+        print(f"报价: {gateway.ticks / elapsed:.0f}/秒 生成, {received / elapsed:.0f}/秒 客户端更新; "
+              f"市价单往返: 中位 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+              f"最大 {latencies[-1] * 1000:.2f}ms; {gateway.stats()}")
+    finally:
+        ib.disconnect()
+        await gateway.stop()
+
+
+if __name__ == "__main__":
+    # 代替 TWS 运行策略：python mock_gateway.py serve [--port 7496]；自检吞吐：python mock_gateway.py load
+    parser = argparse.ArgumentParser(description='本地模拟 TWS 网关')
+    parser.add_argument('mode', nargs='?', choices=['serve', 'load'], default='serve',
+                        help='serve 持续提供服务，load 在本进程内运行吞吐自检')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=7496, help='监听端口（与策略连接的端口一致）')
+    parser.add_argument('--tick-rate', type=int, default=None, help='每秒报价次数（serve 默认 1000，load 默认 5000）')
+    parser.add_argument('--latency', type=float, default=0.0, help='请求回复延迟（秒）')
+    parser.add_argument('--order-latency', type=float, default=0.0, help='下单/撤单生效延迟（秒）')
+    parser.add_argument('--fill-latency', type=float, default=0.0, help='成交回报延迟（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.mode == 'load':
+        asyncio.run(load_test(tick_rate=args.tick_rate or 5000))
+    else:
+        gateway = MockGateway(args.host, args.port, tick_rate=args.tick_rate or 1000, latency=args.latency,
+                              order_latency=args.order_latency, fill_latency=args.fill_latency, seed=args.seed)
+        try:
+            asyncio.run(gateway.serve_forever())
+        except KeyboardInterrupt:
+            logger.info(f"模拟网关已停止: {gateway.stats()}")
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+from clock import WALL_CLOCK
+
+logger = logging.getLogger()
+
+# 订单终态；Inactive（盘外挂起、保证金不足等）不是终态，IB 可能重新激活，仍按超时撤单
+DONE_STATES = {'Filled', 'Cancelled', 'ApiCancelled'}
+
+
+class OrderManager:
+    """事件驱动订单管理 - 按 orderId/permId 跟踪订单，成交/撤单回调立即处理，支持超时撤单"""
+
+    def __init__(self, ib_instance, clock=None, tracer=None):
+        self.ib = ib_instance
+        self.clock = clock or WALL_CLOCK
+        self.tracer = tracer  # 决策追踪，记录提交/确认/成交/结束
+        self.traces = {}  # {orderId: [trace_id, symbol, action, 是否已确认]}
+        self.by_order_id = {}  # {orderId: Trade}
+        self.by_perm_id = {}  # {permId: Trade}
+        self.callbacks = {}  # {orderId: [完成回调, 超时句柄]}
+        self.waiters = {}  # {orderId: [Future]}
+
+        self.ib.orderStatusEvent += self.on_order_status
+        self.ib.execDetailsEvent += self.on_exec_details
+
+    @staticmethod
+    def is_done(trade):
+        return trade.orderStatus.status in DONE_STATES
+
+    def place(self, contract, order, on_done=None, timeout=None, trace=0):
+        """提交订单；on_done(trade) 在订单结束时回调，timeout 秒未结束则撤单；trace 为决策追踪 ID"""
+        trade = self.ib.placeOrder(contract, order)
+        order_id = trade.order.orderId
+        self.by_order_id[order_id] = trade
+        if trace and self.tracer is not None:
+            self.traces[order_id] = [trace, contract.symbol, order.action, False]
+            self.tracer.span(trace, 'submit', contract.symbol, order.action, value=order.totalQuantity)
+        handle = None
+        if timeout:
+            handle = self.clock.call_later(timeout, self.on_timeout, order_id)
+        self.callbacks[order_id] = [on_done, handle]
+        if self.is_done(trade):
+            self.finish(trade)
+        return trade
+
+    def on_order_status(self, trade):
+        """orderStatusEvent：登记 permId，订单结束时触发回调"""
+        order_id = trade.order.orderId
+        if order_id not in self.by_order_id:
+            return
+        if trade.order.permId:
+            self.by_perm_id[trade.order.permId] = trade
+        traced = self.traces.get(order_id)
+        if traced and not traced[3] and trade.orderStatus.status in ('PreSubmitted', 'Submitted', 'Filled'):
+            traced[3] = True
+            self.tracer.span(traced[0], 'ack', traced[1], traced[2])
+        if trade.orderStatus.status == 'Inactive':
+            logger.warning(f"订单未生效: {trade.contract.symbol} {trade.order.action} {trade.order.orderType}")
+        if self.is_done(trade):
+            self.finish(trade)
+
+    def on_exec_details(self, trade, fill):
+        """execDetailsEvent：记录成交明细"""
+        if trade.order.orderId in self.by_order_id:
+            traced = self.traces.get(trade.order.orderId)
+            if traced:
+                self.tracer.span(traced[0], 'fill', traced[1], traced[2], value=fill.execution.price)
+            logger.info(f"成交回报: {trade.contract.symbol} {fill.execution.side} "
+                        f"{fill.execution.shares} @ {fill.execution.price}")
+
+    def on_timeout(self, order_id):
+        """超时未结束的订单撤单，撤单确认后由 orderStatusEvent 触发完成回调"""
+        trade = self.by_order_id.get(order_id)
+        if trade is None or self.is_done(trade):
+            return
+        logger.warning(f"订单超时撤单: {trade.contract.symbol}, 状态: {trade.orderStatus.status}")
+        try:
+            self.ib.cancelOrder(trade.order)
+        except Exception as e:
+            logger.error(f"撤单失败 {trade.contract.symbol}: {e}")
+
+    def finish(self, trade):
+        """订单结束：执行回调、唤醒等待者并移出在途表"""
+        order_id = trade.order.orderId
+        on_done, handle = self.callbacks.pop(order_id, (None, None))
+        if handle is not None:
+            handle.cancel()
+        for future in self.waiters.pop(order_id, []):
+            if not future.done():
+                future.set_result(trade)
+        self.by_order_id.pop(order_id, None)
+        self.by_perm_id.pop(trade.order.permId, None)
+        traced = self.traces.pop(order_id, None)
+        if traced:
+            self.tracer.span(traced[0], 'done', traced[1], traced[2], value=trade.orderStatus.filled)
+        if on_done is not None:
+            try:
+                on_done(trade)
+            except Exception as e:
+                logger.error(f"订单回调出错 {trade.contract.symbol}: {e}")
+
+    def close(self):
+        """断开订单事件（IB 实例可能被新的策略复用）"""
+        self.ib.orderStatusEvent -= self.on_order_status
+        self.ib.execDetailsEvent -= self.on_exec_details
+
+    def get(self, order_id):
+        return self.by_order_id.get(order_id)
+
+    def get_by_perm_id(self, perm_id):
+        return self.by_perm_id.get(perm_id)
+
+    def in_flight(self):
+        """在途订单数量"""
+        return len(self.by_order_id)
+
+    async def wait_async(self, trade, timeout=None):
+        """等待订单结束，超时返回 False"""
+        if self.is_done(trade) or trade.order.orderId not in self.by_order_id:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(trade.order.orderId, []).append(future)
+        try:
+            await self.clock.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def wait(self, trade, timeout=None):
+        """wait_async 的同步版本（等待期间事件循环继续运行）"""
+        return self.clock.run(self.wait_async(trade, timeout))
+
+    async def wait_all_async(self, timeout=None):
+        """等待全部在途订单结束"""
+        trades = list(self.by_order_id.values())
+        results = await asyncio.gather(*[self.wait_async(trade, timeout) for trade in trades])
+        return all(results)
+
+    def wait_all(self, timeout=None):
+        """wait_all_async 的同步版本"""
+        return self.clock.run(self.wait_all_async(timeout))
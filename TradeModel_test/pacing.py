@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from clock import WALL_CLOCK
+
+logger = logging.getLogger()
+
+# 请求优先级（数值越小越优先）
+PRIORITY_POSITION = 0  # 已有持仓
+PRIORITY_SCAN = 1  # 新开仓扫描
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每个令牌在使用 period 秒后归还（等价于滑动窗口限流，与IB规则一致）"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.used = deque()  # 已使用令牌的时间戳
+
+    def wait_time(self, now):
+        """距离下一个可用令牌的秒数，0 表示可立即使用"""
+        used = self.used
+        while used and now - used[0] >= self.period:
+            used.popleft()
+        if len(used) < self.capacity:
+            return 0.0
+        return used[0] + self.period - now
+
+    def take(self, now):
+        self.used.append(now)
+
+
+class HistoricalPacer:
+    """历史数据请求调度器 - 统一限流、按优先级排队、合并重复请求
+
+    IB 限制：10分钟内最多60次；15秒内不能重复相同请求；同一合约2秒内最多6次
+    """
+
+    def __init__(self, ib_instance, max_requests=60, period=600, contract_requests=6, contract_period=2,
+                 identical_period=15, clock=None, metrics=None):
+        self.ib = ib_instance
+        self.clock = clock or WALL_CLOCK
+        self.metrics = metrics  # 运行指标，记录请求耗时与排队等待
+        self.global_bucket = TokenBucket(max_requests, period)
+        self.contract_capacity = contract_requests
+        self.contract_period = contract_period
+        self.contract_buckets = {}  # {合约键: TokenBucket}
+        self.identical_period = identical_period
+        self.queue = []  # 优先级队列 [(priority, 序号, key)]
+        self.pending = {}  # {key: [contract, params, future, 入队时间, priority, 是否已发出]}
+        self.recent = {}  # {key: (完成时间, bars)} 15秒内的相同请求直接复用结果
+        self.counter = itertools.count()
+        self.worker = None
+        self.wakeup = asyncio.Event()  # 新请求入队时唤醒调度循环
+
+        # 统计
+        self.total_requests = 0
+        self.coalesced = 0
+        self.pacing_waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def contract_key(contract):
+        return contract.conId or (contract.symbol, contract.secType, contract.exchange, contract.currency)
+
+    def request_key(self, contract, params):
+        return (self.contract_key(contract),) + tuple(sorted(params.items()))
+
+    async def request_async(self, contract, priority=PRIORITY_SCAN, **params):
+        """排队请求历史数据，参数与 reqHistoricalData 相同"""
+        key = self.request_key(contract, params)
+        now = self.clock.time()
+
+        # 合并：15秒内已完成的相同请求直接复用
+        recent = self.recent.get(key)
+        if recent and now - recent[0] < self.identical_period:
+            self.coalesced += 1
+            return recent[1]
+
+        # 合并：排队/进行中的相同请求共享结果，并按更高优先级处理
+        entry = self.pending.get(key)
+        if entry is not None:
+            self.coalesced += 1
+            if priority < entry[4] and not entry[5]:
+                entry[4] = priority
+                heapq.heappush(self.queue, (priority, next(self.counter), key))
+            return await asyncio.shield(entry[2])
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = [contract, params, future, now, priority, False]
+        heapq.heappush(self.queue, (priority, next(self.counter), key))
+        self.ensure_worker()
+        return await asyncio.shield(future)
+
+    def request(self, contract, priority=PRIORITY_SCAN, **params):
+        """request_async 的同步版本"""
+        return self.clock.run(self.request_async(contract, priority, **params))
+
+    def ensure_worker(self):
+        self.wakeup.set()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.ensure_future(self.run_queue())
+
+    def next_ready(self, now):
+        """取出最高优先级且合约限流允许的请求，返回 (key, 需等待秒数)"""
+        wait = None
+        skipped = []
+        result = None
+        while self.queue:
+            priority, seq, key = heapq.heappop(self.queue)
+            entry = self.pending.get(key)
+            if entry is None or entry[5] or entry[4] != priority:
+                continue  # 已发出，或已被提升优先级的重复项
+            bucket = self.contract_buckets.get(key[0])
+            contract_wait = bucket.wait_time(now) if bucket else 0.0
+            if contract_wait <= 0:
+                result = key
+                break
+            skipped.append((priority, seq, key))
+            wait = contract_wait if wait is None else min(wait, contract_wait)
+        for item in skipped:
+            heapq.heappush(self.queue, item)
+        return result, wait
+
+    async def run_queue(self):
+        """调度循环：全局与合约令牌都可用时发出请求"""
+        while self.queue:
+            now = self.clock.time()
+            global_wait = self.global_bucket.wait_time(now)
+            key, contract_wait = (None, None) if global_wait > 0 else self.next_ready(now)
+            if key is None:
+                wait = global_wait if global_wait > 0 else contract_wait
+                if wait is None:
+                    break
+                self.pacing_waits += 1
+                self.wakeup.clear()
+                try:
+                    await self.clock.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.take(now)
+            bucket = self.contract_buckets.get(key[0])
+            if bucket is None:
+                bucket = self.contract_buckets[key[0]] = TokenBucket(self.contract_capacity, self.contract_period)
+            bucket.take(now)
+            self.pending[key][5] = True
+            asyncio.ensure_future(self.execute(key, now))
+
+    async def execute(self, key, start):
+        contract, params, future, enqueued = self.pending[key][:4]
+        wait = start - enqueued
+        self.total_requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        started = time.perf_counter_ns()
+        try:
+            bars = await self.ib.reqHistoricalDataAsync(contract, **params)
+            if not params.get('keepUpToDate'):
+                self.recent[key] = (self.clock.time(), bars)
+            future.set_result(bars)
+        except Exception as e:
+            logger.error(f"历史数据请求失败 {contract.symbol}: {e}")
+            future.set_exception(e)
+            if self.metrics is not None:
+                self.metrics.inc('history_errors')
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('history', time.perf_counter_ns() - started)
+                self.metrics.observe('history_wait', wait * 1e9)
+            del self.pending[key]
+            self.prune_recent()
+
+    def prune_recent(self):
+        """清理超过15秒的缓存结果"""
+        now = self.clock.time()
+        for key in [k for k, (t, _) in self.recent.items() if now - t >= self.identical_period]:
+            del self.recent[key]
+
+    def queue_depth(self):
+        """排队中（尚未发出）的请求数量"""
+        return sum(1 for entry in self.pending.values() if not entry[5])
+
+    def stats(self):
+        """调度统计：排队深度、等待时间、合并次数"""
+        depth = self.queue_depth()
+        return {
+            'queue_depth': depth,
+            'in_flight': len(self.pending) - depth,
+            'total_requests': self.total_requests,
+            'coalesced': self.coalesced,
+            'pacing_waits': self.pacing_waits,
+            'avg_wait': self.total_wait / self.total_requests if self.total_requests else 0.0,
+            'max_wait': self.max_wait,
+            'window_used': len(self.global_bucket.used)
+        }
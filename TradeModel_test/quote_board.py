@@ -0,0 +1,94 @@
+import logging
+from clock import WALL_CLOCK
+from market_data import MarketDataRegistry
+
+logger = logging.getLogger()
+
+
+class QuoteBoard:
+    """常驻行情看板 - 每个合约只订阅一次，由 pendingTickersEvent 推送更新"""
+
+    def __init__(self, ib_instance, registry=None, max_age=60, clock=None):
+        self.ib = ib_instance
+        self.clock = clock or WALL_CLOCK
+        self.registry = registry or MarketDataRegistry(ib_instance)  # 行情线由登记表统一管理
+        self.max_age = max_age  # 报价最大允许延迟（秒），超过视为过期
+        self.quotes = {}  # {symbol: [last, bid, ask, 更新时间戳]}
+        self.tickers = {}  # {symbol: Ticker}
+        self.received_ns = {}  # {symbol: 最近一次报价到达的单调时钟纳秒}
+        self.ib.pendingTickersEvent += self.on_pending_tickers
+
+    def subscribe(self, contracts):
+        """订阅合约行情 {symbol: contract}"""
+        for symbol, contract in contracts.items():
+            if symbol in self.tickers:
+                continue
+            try:
+                ticker = self.registry.acquire(contract)
+                self.tickers[symbol] = ticker
+                self.quotes[symbol] = [0.0, 0.0, 0.0, 0.0]
+                self.update_quote(symbol, ticker)
+            except Exception as e:
+                logger.error(f"订阅行情失败 {symbol}: {e}")
+
+    def unsubscribe(self, symbol):
+        """取消单个标的订阅"""
+        ticker = self.tickers.pop(symbol, None)
+        self.quotes.pop(symbol, None)
+        self.received_ns.pop(symbol, None)
+        if ticker is not None:
+            self.registry.release(ticker.contract)
+
+    def unsubscribe_all(self):
+        """取消全部行情订阅"""
+        for symbol in list(self.tickers):
+            self.unsubscribe(symbol)
+        self.ib.pendingTickersEvent -= self.on_pending_tickers
+
+    def on_pending_tickers(self, tickers):
+        """行情推送回调"""
+        for ticker in tickers:
+            symbol = ticker.contract.symbol
+            if symbol in self.quotes:
+                self.update_quote(symbol, ticker)
+
+    def update_quote(self, symbol, ticker):
+        """更新单个标的报价（NaN 和非正数保留上一次的有效值）"""
+        quote = self.quotes[symbol]
+        updated = False
+        if ticker.last > 0:
+            quote[0] = ticker.last
+            updated = True
+        if ticker.bid > 0:
+            quote[1] = ticker.bid
+            updated = True
+        if ticker.ask > 0:
+            quote[2] = ticker.ask
+            updated = True
+        if updated:
+            quote[3] = self.clock.time()
+            self.received_ns[symbol] = self.clock.monotonic_ns()
+
+    def get_quote(self, symbol):
+        """获取最新报价 (last, bid, ask, 时间戳)，无数据返回 None"""
+        quote = self.quotes.get(symbol)
+        if quote is None or quote[3] == 0:
+            return None
+        return tuple(quote)
+
+    def get_price(self, symbol, max_age=None):
+        """获取最新价格，优先最后成交价，否则中间价；过期或无数据返回0"""
+        quote = self.quotes.get(symbol)
+        if quote is None:
+            return 0
+        if max_age is None:
+            max_age = self.max_age
+        if self.clock.time() - quote[3] > max_age:
+            return 0
+
+        last, bid, ask = quote[0], quote[1], quote[2]
+        if last > 0:
+            return last
+        elif bid > 0 and ask > 0:
+            return (bid + ask) / 2
+        return 0
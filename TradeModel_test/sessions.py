@@ -0,0 +1,125 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from eventkit import Event
+
+from clock import WALL_CLOCK
+
+logger = logging.getLogger()
+
+
+class SessionEngine:
+    """交易时段引擎 - 预先计算每天各时段边界（epoch 秒），查询当前时段只需与缓存的下一边界比较"""
+
+    def __init__(self, session_times, tz, calendar=None, clock=None):
+        self.session_times = session_times  # {session: (开始 time, 结束 time)}，结束早于开始表示跨天
+        self.tz = tz
+        self.calendar = calendar  # ExchangeCalendar，提供休市/半日市；None 则每天按 session_times
+        self.clock = clock or WALL_CLOCK
+        self.changeEvent = Event('changeEvent')  # 时段切换 (old_session, new_session)
+        self.session = None
+        self.start_ts = 0.0  # 当前时段开始
+        self.next_boundary = 0.0  # 当前时段结束（下一边界）
+        self.intervals = {}  # {date: [(start_ts, end_ts, session)]}
+        self.offset_from = 0.0  # 缓存的 UTC 偏移有效区间（夏令时切换都在整点）
+        self.offset_until = 0.0
+        self.offset_tz = None
+        self.timer = None
+
+    def ny_time(self, now=None):
+        """当前纽约时间（UTC 偏移按小时缓存）"""
+        now = self.clock.time() if now is None else now
+        if not self.offset_from <= now < self.offset_until:
+            offset = datetime.fromtimestamp(now, self.tz).utcoffset()
+            self.offset_tz = timezone(offset)
+            self.offset_from = now - now % 3600
+            self.offset_until = self.offset_from + 3600
+        return datetime.fromtimestamp(now, self.offset_tz)
+
+    def localize(self, day, moment):
+        return self.tz.localize(datetime.combine(day, moment)).timestamp()
+
+    def day_intervals(self, day):
+        """覆盖 day 前后各一天的时段区间（含前一天跨夜的时段），按开始时间排序"""
+        intervals = self.intervals.get(day)
+        if intervals is None:
+            intervals = []
+            for offset in (-1, 0, 1):
+                intervals.extend(self.trading_day(day + timedelta(days=offset)))
+            intervals.sort()
+            if len(self.intervals) > 7:
+                self.intervals.clear()
+            self.intervals[day] = intervals
+        return intervals
+
+    def trading_day(self, day):
+        """某一天的时段区间 [(start_ts, end_ts, session)]（交易日历按交易日，含前一天晚上开始的夜盘）"""
+        if self.calendar is not None:
+            return self.calendar.intervals(day)
+        intervals = []
+        for session, (start, end) in self.session_times.items():
+            end_day = day if start < end else day + timedelta(days=1)
+            intervals.append((self.localize(day, start), self.localize(end_day, end), session))
+        return intervals
+
+    def next_day_start(self, now=None):
+        """下一个交易日的开盘时间（第一个非夜盘时段，跳过周末/假日），用于按交易日过期的缓存"""
+        now = self.clock.time() if now is None else now
+        day = self.ny_time(now).date()
+        for offset in range(15):
+            starts = [start for start, _, session in self.trading_day(day + timedelta(days=offset))
+                      if session != 'night']
+            if starts and min(starts) > now:
+                return min(starts)
+        return now + 86400
+
+    def locate(self, now):
+        """返回 (session, 开始, 结束)；不在任何时段时为 closed，结束为下一时段开始"""
+        day = self.ny_time(now).date()
+        for offset in range(0, 15, 3):  # 周末/长假向后查找下一个开盘
+            for start, end, session in self.day_intervals(day + timedelta(days=offset)):
+                if start <= now < end:
+                    return session, start, end
+                if start > now:
+                    return 'closed', now, start
+        return 'closed', now, now + 86400
+
+    def current(self, now=None):
+        """当前交易时段；越过边界时重新定位并触发 changeEvent"""
+        now = self.clock.time() if now is None else now
+        if self.start_ts <= now < self.next_boundary:
+            return self.session
+        old_session = self.session
+        self.session, self.start_ts, self.next_boundary = self.locate(now)
+        if old_session is not None and old_session != self.session:
+            self.changeEvent.emit(old_session, self.session)
+        return self.session
+
+    def seconds_until_change(self, now=None):
+        """距下一时段边界的秒数（休市时即距下一次开盘）"""
+        now = self.clock.time() if now is None else now
+        self.current(now)
+        return max(self.next_boundary - now, 0)
+
+    def reset(self):
+        """交易日历更新后清空缓存的时段区间"""
+        self.intervals.clear()
+        self.start_ts = self.next_boundary = 0.0
+
+    def start(self):
+        """在事件循环上按下一边界定时，边界到达时立即触发 changeEvent"""
+        self.current()
+        delay = max(self.next_boundary - self.clock.time(), 0) + 0.001
+        self.timer = self.clock.call_later(delay, self.on_timer)
+
+    def on_timer(self):
+        try:
+            self.current()
+        except Exception as e:
+            logger.error(f"时段切换处理出错: {e}")
+        self.start()
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,413 @@
+import copy
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+from ib_insync import (IB, BarData, BarDataList, CommissionReport, ContractDetails, Execution, Fill,
+                       OrderStatus, Stock, Ticker, Trade, util)
+
+from bar_store import bar_seconds, duration_seconds
+from clock import VirtualClock
+from order_manager import DONE_STATES
+
+logger = logging.getLogger()
+
+# 每根基础K线拆成 4 个报价：开盘 -> 最低/最高 -> 最高/最低 -> 收盘（阳线先低后高，阴线先高后低）
+TICK_FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+
+
+class ReplayFinished(KeyboardInterrupt):
+    """回放数据用完（继承 KeyboardInterrupt，策略按用户中断的流程平仓退出）"""
+
+
+class SimIB(IB):
+    """模拟券商 - 实现策略用到的 IB 接口子集，用历史K线回放报价撮合订单，可设延迟/滑点/部分成交
+
+    bars: {symbol: 列数据}（BarStore.read 的格式），start 之前的K线只作为历史数据，之后的逐根回放；
+    报价回放与订单延迟都是 clock（VirtualClock）上的定时事件，策略使用同一个时钟即可按事件跳跃运行
+    """
+
+    def __init__(self, bars, bar_size='5 mins', start=None, latency=0.05, slippage=0.0, spread=0.0002,
+                 max_fill_per_tick=None, account='SIM', clock=None):
+        IB.__init__(self)
+        self.bar_size = bar_size
+        self.base_seconds = bar_seconds(bar_size)
+        self.latency = latency  # 下单/撤单到生效的延迟（秒）
+        self.slippage = slippage  # 市价/止损成交的滑点比例
+        self.spread = spread  # 买卖价差比例（以成交价为中间价）
+        self.max_fill_per_tick = max_fill_per_tick  # 每个报价最多成交股数，None 为全部成交
+        self.account = account
+
+        self.symbols = list(bars)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.grid = np.unique(np.concatenate([bars[symbol]['ts'] for symbol in self.symbols]))
+        shape = (len(self.symbols), len(self.grid))
+        self.ohlc = {name: np.full(shape, np.nan, dtype=np.float32) for name in ('open', 'high', 'low', 'close')}
+        self.volume = np.zeros(shape, dtype=np.int64)
+        for i, symbol in enumerate(self.symbols):
+            columns = bars[symbol]
+            cols = np.searchsorted(self.grid, columns['ts'])
+            for name, matrix in self.ohlc.items():
+                matrix[i, cols] = columns[name]
+            if 'volume' in columns:
+                self.volume[i, cols] = columns['volume']
+
+        self.step = 0 if start is None else int(np.searchsorted(self.grid, start))  # 下一根回放的K线
+        self.tick = 0  # 下一根回放K线的第几个报价
+        first = float(self.grid[self.step]) if self.step < len(self.grid) else float(self.grid[-1])
+        self.clock = clock or VirtualClock(first)
+        self.finished = False
+        self.schedule_tick()
+
+        self.next_order_id = 1
+        self.client.getReqId = self.next_id  # bracketOrder 等辅助方法取订单号
+        self.sim_trades = {}  # {orderId: Trade}
+        self.working = {}  # {orderId: Order} 已发送到交易所的订单（撮合按此副本，未发送的修改不生效）
+        self.untransmitted = []  # transmit=False 的修改 [(orderId, symbol)]，与 TWS 一样保存但不生效
+        self.active = set()  # 已生效、等待撮合的 orderId
+        self.trail_stops = {}  # {orderId: 当前跟踪止损价}
+        self.exec_count = 0
+        self.sim_tickers = {}  # {symbol: Ticker}
+        self.bar_lists = []  # keepUpToDate 的 BarDataList
+        self.pending = set()
+        self.connected = False
+
+    # ---------- 连接 ----------
+
+    def connect(self, *args, **kwargs):
+        self.connected = True
+        return self
+
+    async def connectAsync(self, *args, **kwargs):
+        return self.connect()
+
+    def disconnect(self):
+        self.connected = False
+
+    def isConnected(self):
+        return self.connected
+
+    def managedAccounts(self):
+        return [self.account]
+
+    def next_id(self):
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        return order_id
+
+    # ---------- 模拟时间 ----------
+
+    @property
+    def now(self):
+        return self.clock.time()
+
+    def timestamp(self):
+        return datetime.fromtimestamp(self.now, timezone.utc)
+
+    def schedule(self, delay, callback):
+        """delay 秒（模拟时间）后执行回调"""
+        self.clock.call_later(delay, callback)
+
+    def schedule_tick(self):
+        """把下一个报价登记为时钟事件；数据用完时登记回放结束"""
+        if self.step >= len(self.grid):
+            self.clock.call_later(0, self.finish)
+            return
+        at = float(self.grid[self.step]) + self.base_seconds * TICK_FRACTIONS[self.tick]
+        self.clock.call_at(at, self.on_tick)
+
+    def on_tick(self):
+        self.replay_tick(self.step, self.tick)
+        self.tick += 1
+        if self.tick == len(TICK_FRACTIONS):
+            self.update_bars(self.step)
+            self.step += 1
+            self.tick = 0
+        self.schedule_tick()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        logger.info("回放结束")
+        raise ReplayFinished()
+
+    def sleep(self, secs=0.02):
+        """模拟时间前进 secs 秒（不真实等待），回放结束时抛出 ReplayFinished"""
+        self.clock.sleep(secs)
+        return True
+
+    # ---------- 行情 ----------
+
+    def reqMktData(self, contract, genericTickList='', snapshot=False, regulatorySnapshot=False,
+                   mktDataOptions=None):
+        ticker = self.sim_tickers.get(contract.symbol)
+        if ticker is None:
+            ticker = self.sim_tickers[contract.symbol] = Ticker(contract=contract)
+        return ticker
+
+    def cancelMktData(self, contract):
+        self.sim_tickers.pop(contract.symbol, None)
+        return True
+
+    def replay_tick(self, step, n):
+        """回放第 step 根K线的第 n 个报价，撮合订单并推送 pendingTickersEvent"""
+        opens, highs, lows, closes = (self.ohlc[name][:, step] for name in ('open', 'high', 'low', 'close'))
+        if n == 0:
+            prices = opens
+        elif n == 3:
+            prices = closes
+        else:
+            rising = closes >= opens
+            first_low = lows if n == 1 else highs
+            first_high = highs if n == 1 else lows
+            prices = np.where(rising, first_low, first_high)
+        rows = np.flatnonzero(~np.isnan(prices))
+        moment = self.timestamp()
+        for i in rows:
+            symbol = self.symbols[i]
+            price = float(prices[i])
+            ticker = self.sim_tickers.get(symbol)
+            if ticker is not None:
+                half = price * self.spread / 2
+                ticker.time = moment
+                ticker.last = price
+                ticker.bid = round(price - half, 4)
+                ticker.ask = round(price + half, 4)
+                self.pending.add(ticker)
+            self.match_orders(symbol, price)
+        if self.pending:
+            tickers, self.pending = self.pending, set()
+            for ticker in tickers:
+                ticker.updateEvent.emit(ticker)
+            self.pendingTickersEvent.emit(tickers)
+
+    # ---------- 历史数据 ----------
+
+    def make_bars(self, symbol, bar_size, end_step, duration=None):
+        """用基础K线合成 bar_size 周期K线（截至 end_step，最后一根可能未收盘）"""
+        i = self.index[symbol]
+        size = bar_seconds(bar_size)
+        start = 0
+        if duration:
+            start = int(np.searchsorted(self.grid, self.grid[max(end_step - 1, 0)] - duration_seconds(duration)))
+        bars = []
+        for step in range(start, end_step):
+            close = self.ohlc['close'][i, step]
+            if np.isnan(close):
+                continue
+            self.merge_bar(bars, i, step, size)
+        return bars
+
+    def merge_bar(self, bars, i, step, size):
+        """把一根基础K线并入周期K线列表，返回是否新开了一根"""
+        ts = int(self.grid[step])
+        bucket = ts - ts % size
+        o, h, l, c = (float(self.ohlc[name][i, step]) for name in ('open', 'high', 'low', 'close'))
+        volume = int(self.volume[i, step])
+        if bars and bars[-1].date == datetime.fromtimestamp(bucket, timezone.utc):
+            bar = bars[-1]
+            bar.high = max(bar.high, h)
+            bar.low = min(bar.low, l)
+            bar.close = c
+            bar.volume += volume
+            return False
+        bars.append(BarData(date=datetime.fromtimestamp(bucket, timezone.utc), open=o, high=h, low=l, close=c,
+                            volume=volume, average=c, barCount=1))
+        return True
+
+    def reqHistoricalData(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='5 mins',
+                          whatToShow='TRADES', useRTH=False, formatDate=2, keepUpToDate=False,
+                          chartOptions=None, timeout=60):
+        bars = BarDataList()
+        bars.contract = contract
+        bars.endDateTime = endDateTime
+        bars.durationStr = durationStr
+        bars.barSizeSetting = barSizeSetting
+        bars.whatToShow = whatToShow
+        bars.useRTH = useRTH
+        bars.formatDate = formatDate
+        bars.keepUpToDate = keepUpToDate
+        bars.chartOptions = chartOptions or []
+        if contract.symbol in self.index:
+            bars.extend(self.make_bars(contract.symbol, barSizeSetting, self.step, durationStr))
+        if keepUpToDate:
+            self.bar_lists.append(bars)
+        return bars
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='5 mins',
+                                     whatToShow='TRADES', useRTH=False, formatDate=2, keepUpToDate=False,
+                                     chartOptions=None, timeout=60):
+        return self.reqHistoricalData(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH,
+                                      formatDate, keepUpToDate, chartOptions, timeout)
+
+    def cancelHistoricalData(self, bars):
+        if bars in self.bar_lists:
+            self.bar_lists.remove(bars)
+
+    def update_bars(self, step):
+        """基础K线收盘：更新 keepUpToDate 的K线并触发 updateEvent(bars, hasNewBar)"""
+        for bars in self.bar_lists:
+            i = self.index.get(bars.contract.symbol)
+            if i is None or np.isnan(self.ohlc['close'][i, step]):
+                continue
+            has_new_bar = self.merge_bar(bars, i, step, bar_seconds(bars.barSizeSetting))
+            bars.updateEvent.emit(bars, has_new_bar)
+
+    async def reqContractDetailsAsync(self, contract):
+        if contract.symbol not in self.index:
+            return []
+        qualified = Stock(contract.symbol, 'SMART', contract.currency or 'USD', primaryExchange='NASDAQ',
+                          conId=self.index[contract.symbol] + 1)
+        return [ContractDetails(contract=qualified, minTick=0.01, timeZoneId='US/Eastern')]
+
+    def reqContractDetails(self, contract):
+        return util.run(self.reqContractDetailsAsync(contract))
+
+    # ---------- 订单 ----------
+
+    def placeOrder(self, contract, order):
+        """新订单延迟 latency 秒生效；已有 orderId 视为修改订单（transmit=False 的修改不生效）"""
+        if not order.orderId:
+            order.orderId = self.next_id()
+        trade = self.sim_trades.get(order.orderId)
+        if trade is not None:
+            if not order.transmit:
+                logger.warning(f"修改订单未发送 (transmit=False): {contract.symbol} #{order.orderId}")
+                self.untransmitted.append((order.orderId, contract.symbol))
+                return trade
+            trade.order = order
+            self.working[order.orderId] = copy.copy(order)
+            trade.modifyEvent.emit(trade)
+            return trade
+
+        order.permId = order.orderId + 1000000
+        order.clientId = 1
+        trade = Trade(contract, order, OrderStatus(orderId=order.orderId, status='PendingSubmit',
+                                                  remaining=order.totalQuantity, permId=order.permId))
+        self.sim_trades[order.orderId] = trade
+        self.working[order.orderId] = copy.copy(order)
+        self.schedule(self.latency, lambda: self.activate(trade))
+        return trade
+
+    def cancelOrder(self, order, manualCancelOrderTime=''):
+        trade = self.sim_trades.get(order.orderId)
+        if trade is not None:
+            self.schedule(self.latency, lambda: self.cancel(trade))
+        return trade
+
+    def set_status(self, trade, status):
+        trade.orderStatus.status = status
+        trade.statusEvent.emit(trade)
+        self.orderStatusEvent.emit(trade)
+
+    def is_done(self, trade):
+        return trade.orderStatus.status in DONE_STATES
+
+    def activate(self, trade):
+        """订单生效：子单等父单成交后才参与撮合"""
+        if self.is_done(trade):
+            return
+        parent = self.sim_trades.get(trade.order.parentId) if trade.order.parentId else None
+        if parent is not None and parent.orderStatus.status != 'Filled':
+            self.set_status(trade, 'PreSubmitted')
+            return
+        self.active.add(trade.order.orderId)
+        self.set_status(trade, 'Submitted')
+        ticker = self.sim_tickers.get(trade.contract.symbol)
+        if ticker is not None and ticker.last > 0:
+            self.match(trade, ticker.last)
+
+    def cancel(self, trade):
+        if self.is_done(trade):
+            return
+        self.active.discard(trade.order.orderId)
+        self.set_status(trade, 'Cancelled')
+        trade.cancelledEvent.emit(trade)
+        # 父单撤销且未成交时子单一并撤销
+        if trade.orderStatus.filled == 0:
+            for child in list(self.sim_trades.values()):
+                if child.order.parentId == trade.order.orderId:
+                    self.cancel(child)
+
+    def match_orders(self, symbol, price):
+        for order_id in list(self.active):
+            trade = self.sim_trades[order_id]
+            if trade.contract.symbol == symbol:
+                self.match(trade, price)
+
+    def match(self, trade, price):
+        """按当前价撮合：限价单价格更优才成交，止损/跟踪止损触发后按市价成交"""
+        order = self.working[trade.order.orderId]
+        buy = order.action == 'BUY'
+        half = price * self.spread / 2
+        market_price = price + half if buy else price - half
+        slipped = market_price * (1 + self.slippage if buy else 1 - self.slippage)
+
+        if order.orderType == 'MKT':
+            fill_price = slipped
+        elif order.orderType == 'LMT':
+            if (buy and market_price > order.lmtPrice) or (not buy and market_price < order.lmtPrice):
+                return
+            fill_price = min(order.lmtPrice, market_price) if buy else max(order.lmtPrice, market_price)
+        elif order.orderType in ('STP', 'TRAIL'):
+            stop = order.auxPrice if order.orderType == 'STP' else self.trail_stop(order, price)
+            if (buy and price < stop) or (not buy and price > stop):
+                return
+            fill_price = slipped
+        else:
+            logger.warning(f"模拟券商不支持的订单类型: {order.orderType}")
+            self.active.discard(order.orderId)
+            self.set_status(trade, 'Inactive')
+            return
+
+        remaining = order.totalQuantity - trade.orderStatus.filled
+        quantity = remaining if self.max_fill_per_tick is None else min(remaining, self.max_fill_per_tick)
+        if quantity > 0:
+            self.fill(trade, quantity, round(fill_price, 4))
+
+    def trail_stop(self, order, price):
+        """跟踪止损价（卖单）：随价格上移，不下移"""
+        if order.trailingPercent and order.trailingPercent != util.UNSET_DOUBLE:
+            amount = price * order.trailingPercent / 100
+        else:
+            amount = order.auxPrice
+        initial = order.trailStopPrice if order.trailStopPrice != util.UNSET_DOUBLE else price - amount
+        stop = max(self.trail_stops.get(order.orderId, initial), price - amount)
+        self.trail_stops[order.orderId] = stop
+        return stop
+
+    def fill(self, trade, quantity, price):
+        """成交：更新订单状态、推送成交明细，全部成交后激活子单并撤销同 OCA 组的其他订单"""
+        order = self.working[trade.order.orderId]
+        status = trade.orderStatus
+        self.exec_count += 1
+        filled = status.filled + quantity
+        status.avgFillPrice = (status.avgFillPrice * status.filled + price * quantity) / filled
+        status.filled = filled
+        status.remaining = order.totalQuantity - filled
+        status.lastFillPrice = price
+        execution = Execution(execId=f'sim.{self.exec_count}', time=self.timestamp(), acctNumber=self.account,
+                              exchange='SIM', side='BOT' if order.action == 'BUY' else 'SLD', shares=quantity,
+                              price=price, permId=order.permId, clientId=order.clientId, orderId=order.orderId,
+                              cumQty=filled, avgPrice=status.avgFillPrice)
+        fill = Fill(trade.contract, execution, CommissionReport(execId=execution.execId), self.timestamp())
+        trade.fills.append(fill)
+        trade.fillEvent.emit(trade, fill)
+        self.execDetailsEvent.emit(trade, fill)
+
+        if order.ocaGroup:
+            for other in list(self.sim_trades.values()):
+                if other is not trade and other.order.ocaGroup == order.ocaGroup and not self.is_done(other):
+                    self.cancel(other)
+
+        if status.remaining > 0:
+            self.set_status(trade, 'Submitted')
+            return
+        self.active.discard(order.orderId)
+        self.trail_stops.pop(order.orderId, None)
+        self.set_status(trade, 'Filled')
+        trade.filledEvent.emit(trade)
+        for child in list(self.sim_trades.values()):
+            if child.order.parentId == order.orderId and child.orderStatus.status == 'PreSubmitted':
+                self.activate(child)
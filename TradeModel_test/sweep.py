@@ -0,0 +1,227 @@
+import csv
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import NY_TZ, Backtester, BacktestParams, sample_bars
+from exchange_calendar import ExchangeCalendar
+
+logger = logging.getLogger()
+
+# 共享内存中的列（价格用 float32，与本地K线库一致）
+SHARED_COLUMNS = (('ts', np.int64), ('high', np.float32), ('low', np.float32), ('close', np.float32))
+
+# 决定信号矩阵的参数：相同时 Backtester.prepare 的结果可复用
+SIGNAL_FIELDS = ('timeframes', 'breakout_window', 'rsi_window', 'rsi_low', 'rsi_high')
+
+# 默认参数空间，分时段参数写作 'session.field'
+DEFAULT_SPACE = {
+    'pre_market.profit_target': [0.01, 0.02, 0.03],
+    'pre_market.stop_loss_pct': [0.01, 0.015, 0.02],
+    'regular.profit_target': [0.01, 0.015, 0.02],
+    'regular.stop_loss_pct': [0.005, 0.01, 0.015],
+    'after_hours.profit_target': [0.015, 0.025, 0.035],
+    'after_hours.stop_loss_pct': [0.01, 0.02, 0.03],
+    'night.profit_target': [0.02, 0.03, 0.04],
+    'night.stop_loss_pct': [0.015, 0.025, 0.035],
+    'risk_per_trade': [0.005, 0.01, 0.02],
+    'max_positions': [1, 3, 5],
+    'breakout_window': [10, 20, 40],
+    'rsi_low': [20, 30],
+    'rsi_high': [70, 80]
+}
+
+METRICS = ('trades', 'win_rate', 'realised', 'max_drawdown', 'max_drawdown_pct', 'avg_hold_minutes')
+
+
+class SharedBars:
+    """K线数组放入共享内存 - 主进程写入一次，工作进程按名称映射，只读零拷贝"""
+
+    def __init__(self, shm, symbols, offsets, owner=False):
+        self.shm = shm
+        self.symbols = symbols
+        self.offsets = offsets  # 每个标的在列中的起止位置，长度 len(symbols) + 1
+        self.owner = owner  # 创建者负责 unlink
+
+    @classmethod
+    def create(cls, bars):
+        """bars: {symbol: 列数据}（BarStore.read 的格式）"""
+        symbols = list(bars)
+        lengths = [len(bars[symbol]['ts']) for symbol in symbols]
+        offsets = [0] + list(itertools.accumulate(lengths))
+        size = sum(np.dtype(dtype).itemsize for _, dtype in SHARED_COLUMNS) * offsets[-1]
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(shm, symbols, offsets, owner=True)
+        columns = shared.columns()
+        for i, symbol in enumerate(symbols):
+            for name, _ in SHARED_COLUMNS:
+                columns[name][offsets[i]:offsets[i + 1]] = bars[symbol][name]
+        del columns  # 释放视图，否则 close 时报 BufferError
+        return shared
+
+    @classmethod
+    def attach(cls, name, symbols, offsets):
+        return cls(shared_memory.SharedMemory(name=name), symbols, offsets)
+
+    def spec(self):
+        """传给工作进程的 (名称, 标的, 偏移)"""
+        return self.shm.name, self.symbols, self.offsets
+
+    def columns(self):
+        """共享内存上的列视图 {name: ndarray}"""
+        columns = {}
+        start = 0
+        total = self.offsets[-1]
+        for name, dtype in SHARED_COLUMNS:
+            columns[name] = np.ndarray(total, dtype=dtype, buffer=self.shm.buf, offset=start)
+            start += np.dtype(dtype).itemsize * total
+        return columns
+
+    def bars(self):
+        """{symbol: 列数据}，每列都是共享内存的切片"""
+        columns = self.columns()
+        return {symbol: {name: column[self.offsets[i]:self.offsets[i + 1]] for name, column in columns.items()}
+                for i, symbol in enumerate(self.symbols)}
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def make_params(combo, base=None):
+    """在 base 参数上应用一组取值（'session.field' 修改分时段参数）"""
+    fields = dict(vars(base or BacktestParams()))
+    sessions = {session: dict(values) for session, values in fields['trading_sessions'].items()}
+    for key, value in combo.items():
+        if '.' in key:
+            session, field = key.split('.', 1)
+            sessions.setdefault(session, {})[field] = value
+        else:
+            fields[key] = value
+    fields['trading_sessions'] = sessions
+    return BacktestParams(**fields)
+
+
+def signal_key(params):
+    return tuple(tuple(value) if isinstance(value, list) else value
+                 for value in (getattr(params, field) for field in SIGNAL_FIELDS))
+
+
+def grid_combos(space):
+    """参数空间的全部组合"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+
+def random_combos(space, n, seed=0):
+    """参数空间中随机抽取 n 个不重复组合（不超过组合总数）"""
+    keys = list(space)
+    n = min(n, math.prod(len(values) for values in space.values()))
+    rng = random.Random(seed)
+    seen = set()
+    combos = []
+    while len(combos) < n:
+        values = tuple(rng.choice(space[key]) for key in keys)
+        if values not in seen:
+            seen.add(values)
+            combos.append(dict(zip(keys, values)))
+    return combos
+
+
+# 工作进程状态：共享内存映射、交易日历、最近一次的信号矩阵
+_worker = {}
+
+
+def init_worker(spec, base):
+    shared = SharedBars.attach(*spec)
+    _worker.update(shared=shared, bars=shared.bars(), base=base, calendar=ExchangeCalendar(NY_TZ, path=None),
+                   key=None, prepared=None)
+
+
+def worker_backtest(combo):
+    """工作进程：返回 (Backtester, 全部历史的信号矩阵)，信号参数与上一组相同时复用信号矩阵"""
+    params = make_params(combo, _worker['base'])
+    backtester = Backtester(params, calendar=_worker['calendar'])
+    key = signal_key(params)
+    if key != _worker['key']:
+        _worker['prepared'] = backtester.prepare(_worker['bars'])
+        _worker['key'] = key
+    return backtester, _worker['prepared']
+
+
+def summarise(stats):
+    """TradeStats -> METRICS 各项"""
+    return dict(trades=stats.count, win_rate=stats.win_rate, realised=stats.realised,
+                max_drawdown=stats.max_drawdown, max_drawdown_pct=stats.max_drawdown_pct,
+                avg_hold_minutes=stats.avg_hold_seconds / 60)
+
+
+def run_chunk(combos):
+    """工作进程：逐个回测一批组合"""
+    rows = []
+    for combo in combos:
+        backtester, prepared = worker_backtest(combo)
+        _, stats = backtester.simulate(prepared)
+        rows.append(dict(combo, **summarise(stats)))
+    return rows
+
+
+class ParameterSweep:
+    """并行参数扫描 - K线放入共享内存一次，进程池按组合分批回测，结果流式汇总到一张表"""
+
+    def __init__(self, bars, base=None, workers=None, chunk_size=None):
+        self.bars = bars
+        self.base = base or BacktestParams()
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size  # 每批组合数，None 则按组合数与进程数自动确定
+
+    def chunks(self, combos):
+        """按信号参数排序后分批，同一批内信号矩阵基本只算一次"""
+        combos = sorted(combos, key=lambda combo: signal_key(make_params(combo, self.base)))
+        size = self.chunk_size or max(1, min(64, math.ceil(len(combos) / (self.workers * 8))))
+        return [combos[i:i + size] for i in range(0, len(combos), size)]
+
+    def run(self, combos, output=None):
+        """回测全部组合，返回按总盈亏排序的 DataFrame；output 为 CSV 路径时每批结果到达即写入"""
+        started = time.perf_counter()
+        chunks = self.chunks(combos)
+        keys = list(dict.fromkeys(key for combo in combos for key in combo))
+        rows = []
+        shared = SharedBars.create(self.bars)
+        f = open(output, 'w', newline='', encoding='utf-8') if output else None
+        try:
+            writer = csv.DictWriter(f, fieldnames=keys + list(METRICS)) if f else None
+            if writer:
+                writer.writeheader()
+            with multiprocessing.Pool(self.workers, initializer=init_worker,
+                                      initargs=(shared.spec(), self.base)) as pool:
+                for chunk_rows in pool.imap_unordered(run_chunk, chunks):
+                    rows.extend(chunk_rows)
+                    if writer:
+                        writer.writerows(chunk_rows)
+                        f.flush()
+        finally:
+            if f:
+                f.close()
+            shared.close()
+
+        logger.info(f"参数扫描完成: {len(rows)} 个组合, {self.workers} 个进程, "
+                    f"耗时 {time.perf_counter() - started:.2f}秒")
+        table = pd.DataFrame(rows, columns=keys + list(METRICS))
+        return table.sort_values('realised', ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    # 自检：随机游走生成一年 5 分钟K线（20 个标的，全时段），随机抽取 1000 组参数
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = ParameterSweep(sample_bars(20)).run(random_combos(DEFAULT_SPACE, 1000))
+    print(results.head(10).to_string())
@@ -0,0 +1,38 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# 模块平铺在 TradeModel_test 下，按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import NY_TZ, sample_bars  # noqa: E402
+
+REPLAY_START = int(NY_TZ.localize(datetime(2025, 3, 4, 4)).timestamp())  # 周二盘前开盘
+
+
+def make_bars(symbols=('AAPL', 'MSFT', 'SPY'), history_days=3, replay_hours=6):
+    """REPLAY_START 之前 history_days 天为历史数据，之后 replay_hours 小时逐根回放"""
+    return sample_bars(symbols, REPLAY_START - history_days * 86400, REPLAY_START + replay_hours * 3600,
+                       trading_days_only=False)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """策略在当前目录写合约/日历缓存、K线库、账本和追踪文件，测试在临时目录中运行"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def replay_strategy(workdir):
+    """模拟券商 + 虚拟时钟上的策略（未启动），返回 strategy；strategy.ib 为 SimIB"""
+    from sim_broker import SimIB
+    from 早盘动量策略 import AllDayTradingStrategy
+
+    ib = SimIB(make_bars(), start=REPLAY_START)
+    strategy = AllDayTradingStrategy(ib, clock=ib.clock)
+    strategy.watchlist = list(ib.symbols)
+    strategy.metrics_port = None
+    return strategy
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backtest import Backtester, BacktestParams, sample_bars, timeframe_votes
+from conftest import REPLAY_START
+from indicators import TimeframeSignal
+
+
+def test_sample_bars():
+    bars = sample_bars(['AAPL', 'MSFT'], REPLAY_START - 7 * 86400, REPLAY_START)
+    columns = bars['AAPL']
+    assert set(columns) == {'ts', 'open', 'high', 'low', 'close', 'volume'}
+    assert len(columns['ts']) == 5 * 288  # 去掉周末两天
+    assert (columns['high'] >= columns['close']).all() and (columns['low'] <= columns['open']).all()
+    again = sample_bars(['AAPL', 'MSFT'], REPLAY_START - 7 * 86400, REPLAY_START)
+    assert np.array_equal(again['MSFT']['close'], bars['MSFT']['close'])  # 固定种子
+    assert list(sample_bars(3, REPLAY_START, REPLAY_START + 3600)) == ['S000', 'S001', 'S002']
+
+
+@pytest.mark.parametrize('timeframe_seconds', [300, 900, 3600])
+def test_timeframe_votes_match_streaming_signal(timeframe_seconds):
+    """每根基础K线收盘时的投票与实盘 TimeframeSignal（keepUpToDate 的当前K线）一致"""
+    columns = sample_bars(['AAPL'], REPLAY_START - 5 * 86400, REPLAY_START, trading_days_only=False)['AAPL']
+    ts = columns['ts']
+    highs, lows, closes = (columns[name].astype(float) for name in ('high', 'low', 'close'))
+    params = BacktestParams()
+    long_votes, short_votes, _, valid = timeframe_votes(ts, highs, lows, closes, timeframe_seconds, params)
+
+    signal = TimeframeSignal()
+    bars = []
+    for k in range(len(ts)):
+        start = ts[k] // timeframe_seconds * timeframe_seconds
+        if bars and bars[-1].date == start:
+            bar = bars[-1]
+            bar.high, bar.low, bar.close = max(bar.high, highs[k]), min(bar.low, lows[k]), closes[k]
+        else:
+            bars.append(SimpleNamespace(date=start, high=highs[k], low=lows[k], close=closes[k]))
+        votes = signal.votes(bars, closes[k])
+        assert valid[k] == bool(votes), k
+        assert (long_votes[k], short_votes[k]) == (votes.count(1), votes.count(-1)), k
+
+
+def test_position_size_matches_strategy():
+    backtester = Backtester(BacktestParams(account_value=10000, risk_per_trade=0.01))
+    assert backtester.position_size(100, 99) == 10  # 最多 10% 资金
+    assert backtester.position_size(100, 50) == 2  # 风险 $100 / 每股 $50
+    assert backtester.position_size(100, 100) == 0
+    assert backtester.position_size(5000, 4000) == 1  # 至少 1 股
+
+
+@pytest.mark.parametrize('path, reason, k', [
+    ([100, 98, 101], '止损', 1),
+    ([100.5, 101, 102.1, 99], '止盈', 2),
+    ([101.5, 101.2, 100.9, 102], '移动止损', 2),  # 盈利 1% 后止损上移到 101.0
+    ([100.2, 100.1, 99.9], '时段结束', 2),
+])
+def test_simulate_exit(path, reason, k):
+    backtester = Backtester()
+    assert backtester.simulate_exit(np.array(path, dtype=float), 100.0,
+                                    {'profit_target': 0.02, 'stop_loss_pct': 0.015}) == (k, reason)
+
+
+def test_run_respects_positions_and_sessions():
+    bars = sample_bars(8, REPLAY_START - 5 * 86400, REPLAY_START + 10 * 86400, seed=3)
+    params = BacktestParams(max_positions=2)
+    backtester = Backtester(params)
+    ledger, stats = backtester.run(bars)
+    records = ledger.records()
+    assert len(records) > 20 and stats.count == len(records)
+    assert stats.realised == pytest.approx(records['pnl'].sum())
+    assert (records['exit_ns'] > records['entry_ns']).all()
+
+    # 同一时刻持仓不超过 max_positions，同一标的不重叠
+    events = sorted([(int(r['entry_ns']), 1) for r in records] + [(int(r['exit_ns']), -1) for r in records])
+    assert max(np.cumsum([delta for _, delta in events])) <= 2
+    for symbol_id in np.unique(records['symbol_id']):
+        rows = np.sort(records[records['symbol_id'] == symbol_id], order='entry_ns')
+        assert (rows['entry_ns'][1:] >= rows['exit_ns'][:-1]).all()
+
+    # 入场都在交易时段内，且使用该时段的止损参数计算仓位
+    for row, frame_row in zip(records, ledger.to_frame().itertuples()):
+        session = params.session_params(frame_row.session)
+        assert frame_row.session in params.trading_sessions
+        assert row['quantity'] == backtester.position_size(row['entry_price'],
+                                                           row['entry_price'] * (1 - session['stop_loss_pct']))
+    assert set(ledger.pnl_by('reason')) <= {'止盈', '止损', '移动止损', '时段结束', '回测结束'}
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from ib_insync import BarData, Stock
+
+from bar_store import BarStore, bar_seconds, duration_seconds, to_timestamp
+from clock import VirtualClock
+
+DAY = 86400
+START = 1_741_000_000 // DAY * DAY  # UTC 零点
+
+
+def make_bar(ts, close, volume=100):
+    return BarData(date=datetime.fromtimestamp(ts, timezone.utc), open=close, high=close + 1, low=close - 1,
+                   close=close, volume=volume, average=close, barCount=10)
+
+
+class FakeRequester:
+    """按 durationStr 返回 now 之前的 5 分钟K线，记录请求参数"""
+
+    def __init__(self, now):
+        self.now = now
+        self.requests = []
+
+    def request(self, contract, priority, **params):
+        self.requests.append(params)
+        seconds = int(params['durationStr'].split()[0])
+        if params['durationStr'].endswith('D'):
+            seconds *= DAY
+        first = (self.now - seconds) // 300 * 300
+        return [make_bar(ts, float(ts % 1000)) for ts in range(first, self.now, 300)]
+
+
+def test_units():
+    assert bar_seconds('5 mins') == 300 and bar_seconds('1 hour') == 3600 and bar_seconds('1 day') == DAY
+    assert duration_seconds('2 D') == 2 * DAY and duration_seconds('30 S') == 30
+    assert to_timestamp(datetime(2025, 3, 4, tzinfo=timezone.utc).date()) == to_timestamp(datetime(2025, 3, 4))
+
+
+def test_write_partitions_and_merge(tmp_path):
+    store = BarStore(str(tmp_path))
+    # 跨两个 UTC 日期
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(START + DAY - 600 + i * 300, 100 + i) for i in range(4)])
+    assert store.partitions('AAPL', '5 mins', 'TRADES') == [
+        datetime.fromtimestamp(START, timezone.utc).strftime('%Y%m%d'),
+        datetime.fromtimestamp(START + DAY, timezone.utc).strftime('%Y%m%d')]
+
+    # 重叠部分以新数据为准，乱序写入后仍按时间排序
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(START + DAY + 600, 200), make_bar(START + DAY - 300, 199)])
+    columns = store.read('AAPL', '5 mins', 'TRADES')
+    assert columns['ts'].tolist() == [START + DAY - 600 + i * 300 for i in range(5)]
+    assert columns['close'].tolist() == [100, 199, 102, 103, 200]
+    assert store.last_timestamp('AAPL', '5 mins', 'TRADES') == START + DAY + 600
+
+    window = store.read('AAPL', '5 mins', 'TRADES', start=START + DAY - 300, end=START + DAY + 300)
+    assert window['ts'].tolist() == [START + DAY - 300, START + DAY]
+    assert len(store.read('MSFT', '5 mins', 'TRADES')['ts']) == 0
+    assert store.last_timestamp('MSFT', '5 mins', 'TRADES') is None
+
+    bars = BarStore.to_bars(window)
+    assert [to_timestamp(bar.date) for bar in bars] == window['ts'].tolist() and bars[0].close == 199
+
+
+def test_missing_duration(tmp_path):
+    store = BarStore(str(tmp_path))
+    now = START + 3 * DAY
+    # 无数据：补齐整个回看区间
+    assert store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * DAY, now=now) == '3 D'
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(now - 3600, 1)])
+    assert store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * DAY, now=now) == '3600 S'
+    # 刚写入最新K线：至少两根K线
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(now - 60, 1)])
+    assert store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * DAY, now=now) == '600 S'
+
+
+def test_sync_fills_only_the_tail(tmp_path):
+    store = BarStore(str(tmp_path))
+    contract = Stock('AAPL', 'SMART', 'USD')
+    now = START + 3 * DAY
+    requester = FakeRequester(now)
+    first = store.sync(requester, 'AAPL', contract, '5 mins', lookback_seconds=DAY, now=now)
+    assert requester.requests[0]['durationStr'] == '86400 S'
+    assert first['ts'][0] == now - DAY and first['ts'][-1] == now - 300
+
+    # 一小时后只请求最后一根已存储K线之后的部分
+    requester.now = now + 3600
+    second = store.sync(requester, 'AAPL', contract, '5 mins', lookback_seconds=DAY, now=now + 3600)
+    assert requester.requests[1]['durationStr'] == '3900 S'
+    assert second['ts'][-1] == now + 3300 and len(second['ts']) == DAY // 300
+    assert np.all(np.diff(second['ts']) == 300)
+
+
+def test_sync_keeps_stored_bars_on_error(tmp_path):
+    store = BarStore(str(tmp_path))
+    now = START + DAY
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(now - 600, 5)])
+
+    class Failing:
+        def request(self, contract, priority, **params):
+            raise TimeoutError('pacing')
+
+    columns = store.sync(Failing(), 'AAPL', Stock('AAPL', 'SMART', 'USD'), '5 mins', now=now)
+    assert columns['close'].tolist() == [5]
+
+
+def test_missing_duration_reads_injected_clock(tmp_path):
+    clock = VirtualClock(START + DAY)
+    store = BarStore(str(tmp_path), clock=clock)
+    store.write('AAPL', '5 mins', 'TRADES', [make_bar(START + DAY - 3600, 1)])
+    assert store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * DAY) == '3600 S'
+    clock.advance(1800)
+    assert store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * DAY) == '5400 S'
+    # now=0 是明确的时间，不当作缺省
+    store.write('MSFT', '5 mins', 'TRADES', [make_bar(0, 1)])
+    assert store.missing_duration('MSFT', '5 mins', 'TRADES', 3600, now=0) == '600 S'
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from batch_signals import BarMatrix, evaluate_watchlist, required_window
+from indicators import TimeframeSignal
+
+TIMEFRAMES = ('5 mins', '15 mins', '1 hour')
+
+
+class FakeBarManager:
+    """按 (symbol, 周期) 返回固定K线序列"""
+
+    def __init__(self, bars):
+        self.bars = bars
+
+    def get_bars(self, symbol, bar_size):
+        return self.bars[(symbol, bar_size)]
+
+
+def random_bars(rng, n):
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    wick = rng.uniform(0, 0.5, n)
+    return [SimpleNamespace(date=i, high=c + w, low=c - w, close=c) for i, (c, w) in enumerate(zip(closes, wick))]
+
+
+@pytest.mark.parametrize('breakout_window', [10, 20, 40])
+def test_batch_votes_match_streaming_votes(breakout_window):
+    rng = np.random.default_rng(breakout_window)
+    symbols = [f'S{i}' for i in range(30)]
+    # 部分标的K线数量不足 breakout_window，不参与投票
+    bars = {(symbol, timeframe): random_bars(rng, int(rng.integers(breakout_window - 5, 80)))
+            for symbol in symbols for timeframe in TIMEFRAMES}
+    manager = FakeBarManager(bars)
+    params = {'breakout_window': breakout_window, 'rsi_window': 14, 'rsi_low': 30, 'rsi_high': 70}
+    window = required_window(breakout_window, 14)
+    matrices = {timeframe: BarMatrix(symbols, window) for timeframe in TIMEFRAMES}
+    for timeframe, matrix in matrices.items():
+        matrix.refresh(manager, timeframe)
+    prices = [bars[(symbol, '5 mins')][-1].close * rng.uniform(0.97, 1.03) for symbol in symbols]
+
+    table = evaluate_watchlist(matrices, prices, **params).set_index('symbol')
+    for symbol, price in zip(symbols, prices):
+        votes = []
+        for timeframe in TIMEFRAMES:
+            votes.extend(TimeframeSignal(**params).votes(bars[(symbol, timeframe)], price))
+        score = votes.count(1) - votes.count(-1)
+        if score > 0:
+            assert table.loc[symbol, 'long_votes'] == votes.count(1), symbol
+            assert table.loc[symbol, 'short_votes'] == votes.count(-1), symbol
+        else:
+            assert symbol not in table.index
+    assert list(table.score) == sorted(table.score, reverse=True)
+
+
+def test_refresh_only_rewrites_current_bar():
+    bars = random_bars(np.random.default_rng(0), 30)
+    matrix = BarMatrix(['AAPL'], 21)
+    matrix.update_row(0, bars)
+    assert matrix.counts[0] == 30 and matrix.close[0, 0] == bars[9].close
+    live = SimpleNamespace(date=bars[-1].date, high=999, low=1, close=500)
+    matrix.update_row(0, bars[:-1] + [live])
+    assert matrix.close[0, -1] == 500 and matrix.close[0, -2] == bars[-2].close
+    matrix.update_row(0, bars[:5])  # 数据变短：左侧补 NaN
+    assert np.isnan(matrix.close[0, :16]).all() and matrix.close[0, -1] == bars[4].close
+
+
+def test_window_too_small_for_parameters():
+    assert required_window(20, 14) == 21
+    assert required_window(10, 14) == 15
+    matrices = {'5 mins': BarMatrix(['AAPL'], 21)}
+    with pytest.raises(ValueError):
+        evaluate_watchlist(matrices, [100.0], breakout_window=30)
+    with pytest.raises(ValueError):
+        evaluate_watchlist(matrices, [100.0], rsi_window=21)
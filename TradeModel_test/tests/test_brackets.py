@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+
+def test_bracket_modifications_are_transmitted(replay_strategy):
+    strategy = replay_strategy
+    strategy.use_bracket_orders = True
+    ib = strategy.ib
+    modified = []
+    place_order = ib.placeOrder
+
+    def record(contract, order):
+        if order.orderId in ib.sim_trades:
+            modified.append(order.orderId)
+        return place_order(contract, order)
+
+    ib.placeOrder = record
+    strategy.run_strategy()
+    assert modified and ib.untransmitted == []
+
+
+def test_shutdown_detaches_event_handlers(replay_strategy):
+    strategy = replay_strategy
+    strategy.use_bracket_orders = True
+    ib = strategy.ib
+    strategy.setup_contracts()
+    strategy.start_market_data()
+    calls = []
+    strategy.update_bracket_stop = lambda symbol, position: calls.append(symbol)
+    strategy.positions['AAPL'] = SimpleNamespace(bracket=object())
+    ticker = strategy.quote_board.tickers['AAPL']
+    ib.pendingTickersEvent.emit({ticker})
+    assert calls == ['AAPL']
+    strategy.positions.clear()
+
+    strategy.shutdown()
+    # 策略、行情看板与订单管理器的回调全部断开，复用 IB 实例时不再调用已停止的策略
+    assert [len(event._slots) for event in (ib.pendingTickersEvent, ib.orderStatusEvent, ib.execDetailsEvent)] \
+        == [0, 0, 0]
+    strategy.positions['AAPL'] = SimpleNamespace(bracket=object())
+    ib.pendingTickersEvent.emit({ticker})
+    assert calls == ['AAPL']
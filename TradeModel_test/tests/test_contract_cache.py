@@ -0,0 +1,87 @@
+import asyncio
+
+from ib_insync import Contract, ContractDetails, util
+
+from clock import VirtualClock
+from contract_cache import ContractCache
+
+
+class FakeIB:
+    """返回固定合约详情，记录请求的代码；UNKNOWN 无结果，BROKEN 抛异常"""
+
+    def __init__(self):
+        self.requested = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def reqContractDetailsAsync(self, contract):
+        symbol = contract.symbol
+        self.requested.append(symbol)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        if symbol == 'BROKEN':
+            raise ConnectionError('lost')
+        if symbol == 'UNKNOWN':
+            return []
+        return [ContractDetails(contract=Contract(secType='STK', conId=len(symbol) * 1000, symbol=symbol,
+                                                  exchange='SMART', primaryExchange='NASDAQ', currency='USD'),
+                                minTick=0.01, timeZoneId='US/Eastern', tradingHours='20250304:0400-20250304:2000',
+                                liquidHours='20250304:0930-20250304:1600')]
+
+
+def test_missing_symbols_are_fetched_in_batches_and_persisted(tmp_path):
+    path = str(tmp_path / 'contracts.json')
+    ib = FakeIB()
+    cache = ContractCache(path, batch_size=2)
+    contracts = cache.qualify(ib, ['AAPL', 'MSFT', 'SPY', 'UNKNOWN', 'BROKEN'])
+
+    assert sorted(contracts) == ['AAPL', 'MSFT', 'SPY']  # 验证失败的不返回
+    assert ib.max_in_flight == 2
+    assert contracts['AAPL'].conId == 4000 and contracts['AAPL'].primaryExchange == 'NASDAQ'
+    assert cache.get('SPY')['minTick'] == 0.01
+
+    # 重启后直接使用磁盘缓存，不再请求
+    restarted = ContractCache(path)
+    ib = FakeIB()
+    contracts = restarted.qualify(ib, ['AAPL', 'MSFT'])
+    assert ib.requested == [] and contracts['MSFT'].conId == 4000
+
+
+def test_stale_entries_are_served_and_revalidated_in_background(tmp_path):
+    path = str(tmp_path / 'contracts.json')
+    cache = ContractCache(path, ttl=100)
+    cache.qualify(FakeIB(), ['AAPL', 'MSFT'])
+    cached_at = cache.get('AAPL')['cached_at']
+    cache.entries['AAPL']['cached_at'] -= 1000  # 过期
+    assert not cache.is_fresh('AAPL') and cache.is_fresh('MSFT')
+
+    ib = FakeIB()
+    contracts = cache.qualify(ib, ['AAPL', 'MSFT'])
+    assert sorted(contracts) == ['AAPL', 'MSFT']  # 过期缓存先照常使用
+    util.run(cache.background)
+    assert ib.requested == ['AAPL']
+    assert cache.get('AAPL')['cached_at'] >= cached_at
+    assert ContractCache(path).is_fresh('AAPL')
+
+
+def test_corrupt_cache_file_starts_empty(tmp_path):
+    path = tmp_path / 'contracts.json'
+    path.write_text('{not json')
+    cache = ContractCache(str(path))
+    assert cache.entries == {}
+    cache.qualify(FakeIB(), ['AAPL'])
+    assert ContractCache(str(path)).get('AAPL')['conId'] == 4000
+
+
+def test_ttl_follows_injected_clock(tmp_path):
+    clock = VirtualClock(1_000_000)
+    cache = ContractCache(str(tmp_path / 'contracts.json'), ttl=100, clock=clock)
+    cache.qualify(FakeIB(), ['AAPL'])
+    assert cache.get('AAPL')['cached_at'] == 1_000_000
+    clock.advance(99)
+    assert cache.is_fresh('AAPL')
+    clock.advance(1)
+    assert not cache.is_fresh('AAPL')
+    assert cache.is_fresh('AAPL', now=0)  # now=0 是明确的时间，不当作缺省
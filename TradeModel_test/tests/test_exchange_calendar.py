@@ -0,0 +1,51 @@
+from datetime import date, datetime
+
+import pytest
+
+from conftest import NY_TZ
+from exchange_calendar import ExchangeCalendar, easter, nyse_half_days, nyse_holidays, parse_ib_hours
+from sessions import SessionEngine
+
+
+def ts(*args):
+    return NY_TZ.localize(datetime(*args)).timestamp()
+
+
+@pytest.fixture
+def engine():
+    return SessionEngine({}, NY_TZ, ExchangeCalendar(NY_TZ, None))
+
+
+def test_holiday_rules():
+    assert easter(2025) == date(2025, 4, 20)
+    holidays = nyse_holidays(2025)
+    for day in (date(2025, 1, 1), date(2025, 4, 18), date(2025, 7, 4), date(2025, 11, 27), date(2025, 12, 25)):
+        assert day in holidays
+    assert date(2026, 7, 3) in nyse_holidays(2026)  # 独立日逢周六提前到周五
+    assert nyse_half_days(2025) == {date(2025, 7, 3), date(2025, 11, 28), date(2025, 12, 24)}
+    assert date(2026, 7, 3) not in nyse_half_days(2026)
+
+
+def test_ib_hours_overlay(engine):
+    calendar = engine.calendar
+    assert parse_ib_hours('20251124:0400-20251124:2000;20251127:CLOSED') == {
+        date(2025, 11, 24): [(240, 1200)], date(2025, 11, 27): []}
+    # IB 报告提前收盘：盘中到 12:00，盘后到 14:00
+    calendar.overlay_ib('20251124:0400-20251124:1400', '20251124:0930-20251124:1200')
+    engine.reset()
+    assert engine.current(ts(2025, 11, 24, 12, 30)) == 'after_hours'
+    assert engine.current(ts(2025, 11, 24, 14, 30)) == 'closed'
+
+
+def test_cache_keeps_overlays(tmp_path):
+    path = str(tmp_path / 'calendar.json')
+    calendar = ExchangeCalendar(NY_TZ, path)
+    calendar.ensure(date(2025, 11, 20))
+    assert calendar.sessions(date(2025, 11, 27)) == [] and calendar.is_trading_day(date(2025, 11, 26))
+    calendar.overlay_ib('20251126:CLOSED', '20251126:CLOSED')
+
+    # 重启后读取缓存：覆盖保留，补齐不改动已有日期
+    reloaded = ExchangeCalendar(NY_TZ, path)
+    reloaded.ensure(date(2025, 11, 21))
+    assert not reloaded.is_trading_day(date(2025, 11, 26))
+    assert reloaded.sessions(date(2025, 11, 28))[-1][1] == 17 * 60  # 半日市盘后到 17:00
@@ -0,0 +1,51 @@
+from ledger import Position
+
+
+def hold_position(strategy, symbol='AAPL'):
+    """完成合约验证与订阅，回放一根基础K线后放入一笔盘前持仓（止盈止损设在远处）"""
+    strategy.setup_contracts()
+    strategy.start_market_data()
+    strategy.clock.sleep(strategy.ib.base_seconds)
+    assert strategy.get_current_session() == 'pre_market'
+    price = strategy.get_current_price(symbol)
+    assert price > 0
+    strategy.positions[symbol] = Position(symbol, price, price * 0.5, 10, strategy.clock.time_ns(),
+                                          'pre_market', profit_target=1.0)
+
+
+def test_stuck_exit_is_cancelled_and_resubmitted(replay_strategy):
+    strategy = replay_strategy
+    hold_position(strategy)
+    ib = strategy.ib
+
+    # 券商不执行卖单（如盘外挂着的市价单），恢复后按重新提交的订单成交
+    match = ib.match
+    stuck = [True]
+    ib.match = lambda trade, p: None if trade.order.action == 'SELL' and stuck[0] else match(trade, p)
+
+    strategy.place_sell_order('AAPL', '测试')
+    first = strategy.pending_orders['AAPL'].order
+    assert first.orderType == 'LMT' and first.outsideRth  # 盘外用可成交的限价单
+    strategy.clock.sleep(strategy.exit_timeout + 1)
+    retry = strategy.pending_orders['AAPL'].order
+    assert retry.orderId != first.orderId and retry.lmtPrice < first.lmtPrice
+    assert ib.sim_trades[first.orderId].orderStatus.status == 'Cancelled'
+
+    stuck[0] = False
+    strategy.clock.sleep(strategy.exit_timeout + 1)
+    assert 'AAPL' not in strategy.positions and 'AAPL' not in strategy.pending_orders
+    assert len(strategy.ledger) == 1 and strategy.ledger.records()['quantity'][0] == 10
+
+
+def test_exit_retries_are_bounded(replay_strategy):
+    strategy = replay_strategy
+    hold_position(strategy)
+    match = strategy.ib.match
+    strategy.ib.match = lambda trade, p: None if trade.order.action == 'SELL' else match(trade, p)
+
+    strategy.place_sell_order('AAPL', '测试')
+    strategy.clock.sleep((strategy.exit_retries + 2) * (strategy.exit_timeout + 1))
+    sells = [t for t in strategy.ib.sim_trades.values() if t.order.action == 'SELL']
+    assert len(sells) == strategy.exit_retries + 1
+    # 重试用完后不再占用在途表，下一轮扫描可以重新检查出场
+    assert 'AAPL' not in strategy.pending_orders and 'AAPL' in strategy.positions
@@ -0,0 +1,126 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import (ATR, EMA, VWAP, RollingMax, RollingMin, RollingRSI, TimeframeSignal, atr, ema,
+                        rolling_max, rolling_min, rsi, vwap)
+
+
+def stream(state, *columns):
+    """逐行写入流式指标，返回每步的 value"""
+    result = []
+    for row in zip(*columns):
+        state.push(*row)
+        result.append(state.value)
+    return np.array(result)
+
+
+def same(left, right):
+    return np.allclose(left, right, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def pandas_rsi(closes, window=14):
+    """原策略中的 pandas 写法"""
+    delta = pd.Series(closes).diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
+    return (100 - (100 / (1 + gain / loss))).to_numpy()
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    n = 500
+    closes = 100 + np.cumsum(rng.normal(0, 0.5, n))
+    closes[50:80] = closes[50]  # 横盘超过一个 RSI 窗口：无涨无跌
+    closes[200:230] = closes[200] + np.arange(30) * 0.25  # 连续上涨超过一个窗口：只涨不跌
+    highs = closes + rng.uniform(0, 0.5, n)
+    lows = closes - rng.uniform(0, 0.5, n)
+    volumes = rng.integers(100, 10000, n).astype(float)
+    volumes[:3] = 0  # 开头无成交量，VWAP 为 NaN
+    return highs, lows, closes, volumes
+
+
+@pytest.mark.parametrize('window', [1, 19, 40])
+def test_rolling_extremes(series, window):
+    highs, lows, _, _ = series
+    expected_max = pd.Series(highs).rolling(window).max().to_numpy()
+    expected_min = pd.Series(lows).rolling(window).min().to_numpy()
+    assert same(stream(RollingMax(window), highs), expected_max)
+    assert same(rolling_max(highs, window), expected_max)
+    assert same(stream(RollingMin(window), lows), expected_min)
+    assert same(rolling_min(lows, window), expected_min)
+    assert np.isnan(rolling_max(highs[:window - 1], window)).all()
+
+
+def test_rsi_matches_pandas(series):
+    closes = series[2]
+    expected = pandas_rsi(closes)
+    streamed = stream(RollingRSI(14), closes)
+    assert same(streamed, expected)
+    assert same(rsi(closes, 14), expected)
+
+    # 横盘段（第 51~79 根无变化）：窗口内无涨无跌为 NaN
+    assert np.isnan(streamed[64:80]).all() and np.isnan(expected[64:80]).all()
+    assert (streamed[214:230] == 100).all() and (expected[214:230] == 100).all()  # 只涨不跌为 100
+
+
+def test_rsi_peek_matches_push(series):
+    closes = series[2]
+    state = RollingRSI(14)
+    for close in closes[:100]:
+        expected = state.peek(close)
+        state.push(close)
+        assert (math.isnan(expected) and math.isnan(state.value)) or expected == pytest.approx(state.value)
+    assert state.peek(closes[100]) == pytest.approx(rsi(closes[:101], 14)[-1], nan_ok=True)
+
+
+def test_ema_atr_vwap(series):
+    highs, lows, closes, volumes = series
+    expected_ema = pd.Series(closes).ewm(span=10, adjust=False).mean().to_numpy()
+    assert same(stream(EMA(10), closes), expected_ema)
+    assert same(ema(closes, 10), expected_ema)
+
+    prev_close = pd.Series(closes).shift()
+    true_range = pd.concat([pd.Series(highs - lows), (pd.Series(highs) - prev_close).abs(),
+                            (pd.Series(lows) - prev_close).abs()], axis=1).max(axis=1)
+    expected_atr = true_range.rolling(14).mean().to_numpy()
+    assert same(stream(ATR(14), highs, lows, closes), expected_atr)
+    assert same(atr(highs, lows, closes, 14), expected_atr)
+
+    typical = (highs + lows + closes) / 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_vwap = (pd.Series(typical * volumes).cumsum() / pd.Series(volumes).cumsum()).to_numpy()
+    assert same(stream(VWAP(), highs, lows, closes, volumes), expected_vwap)
+    assert same(vwap(highs, lows, closes, volumes), expected_vwap)
+    assert np.isnan(vwap(highs, lows, closes, volumes)[:3]).all()
+
+    state = VWAP()
+    state.push(highs[0], lows[0], closes[0], 100)
+    state.reset()
+    assert math.isnan(state.value)
+
+
+def test_timeframe_signal_matches_original_votes(series):
+    """逐根追加K线，流式投票与原 generate_trading_signals 的 pandas 计算一致"""
+    highs, lows, closes, _ = series
+    bars = [SimpleNamespace(date=i, high=h, low=l, close=c) for i, (h, l, c) in enumerate(zip(highs, lows, closes))]
+    signal = TimeframeSignal()
+    for end in range(1, len(bars) + 1):
+        window = bars[:end]
+        current_price = window[-1].close * 1.001
+        expected = []
+        if len(window) > 20:
+            df = pd.DataFrame([{'high': b.high, 'low': b.low, 'close': b.close} for b in window[-40:]])
+            resistance = df['high'].iloc[-20:-1].max()
+            support = df['low'].iloc[-20:-1].min()
+            expected.append(1 if current_price > resistance else -1 if current_price < support else 0)
+            current_rsi = pandas_rsi(df['close'].to_numpy())[-1]
+            if current_rsi < 30:
+                expected.append(1)
+            elif current_rsi > 70:
+                expected.append(-1)
+        assert signal.votes(window, current_price) == expected, end
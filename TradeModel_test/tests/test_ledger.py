@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ledger import TRADE_DTYPE, SymbolTable, TradeLedger
+
+NS = 10 ** 9
+
+
+def fill(ledger, n):
+    """追加 n 笔成交：三个标的轮流，盈亏正负交替"""
+    for i in range(n):
+        symbol = ('AAPL', 'MSFT', 'SPY')[i % 3]
+        exit_price = 100 + (1 if i % 2 == 0 else -0.5)
+        ledger.append(symbol, 'regular' if i % 4 else 'pre_market', f'止盈 ({i}%)', 10, 100.0, exit_price,
+                      i * NS, (i + 1) * NS)
+
+
+def test_symbol_table():
+    table = SymbolTable(['AAPL', 'MSFT'])
+    assert table.intern('MSFT') == 1 and table.intern('SPY') == 2
+    assert table.name(2) == 'SPY' and len(table) == 3
+
+
+def test_spill_flush_and_reload(tmp_path):
+    path = str(tmp_path / 'ledger')
+    ledger = TradeLedger(path, chunk_size=4)
+    fill(ledger, 10)
+    assert len(ledger) == 10 and ledger.size == 2
+    assert sorted(os.listdir(path)) == ['chunk_000000.npy', 'chunk_000001.npy', 'tables.json']  # 写满的块落盘
+
+    ledger.flush()
+    parts = [np.load(os.path.join(path, name)) for name in ('chunk_000000.npy', 'chunk_000001.npy', 'tail.npy')]
+    on_disk = np.concatenate(parts)
+    assert on_disk.dtype == TRADE_DTYPE
+    assert np.array_equal(on_disk, ledger.records())
+    with open(os.path.join(path, 'tables.json'), encoding='utf-8') as f:
+        tables = json.load(f)
+    assert tables['symbols'] == ['AAPL', 'MSFT', 'SPY'] and tables['reasons'] == ['止盈']  # 原因去掉百分比
+
+
+def test_aggregates_match_records():
+    ledger = TradeLedger(None, chunk_size=4)
+    fill(ledger, 10)
+    records = ledger.records()
+    assert records['pnl'].tolist() == [10.0 if i % 2 == 0 else -5.0 for i in range(10)]
+
+    summary = ledger.summary()
+    assert summary == {'count': 10, 'pnl': 25.0, 'wins': 5, 'win_rate': 50.0}
+    assert ledger.summary(since_ns=8 * NS)['count'] == 3
+    assert ledger.pnl_by('symbol') == {'AAPL': 10.0, 'MSFT': 0.0, 'SPY': 15.0}
+    assert ledger.pnl_by('session') == {'pre_market': 30.0, 'regular': -5.0}
+    assert TradeLedger().summary() == {'count': 0, 'pnl': 0.0, 'wins': 0, 'win_rate': 0.0}
+
+    frame = ledger.to_frame()
+    assert list(frame.symbol[:3]) == ['AAPL', 'MSFT', 'SPY']
+    assert frame.pnl_pct.iloc[0] == pytest.approx(1.0)
+    assert str(frame.exit_time.dt.tz) == 'America/New_York'
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from metrics import HALF, Histogram, Metrics, bucket_index, bucket_upper, timed
+
+QS = [50, 90, 99, 99.9]
+
+
+def test_bucket_bounds():
+    values = np.unique(np.concatenate([np.arange(1000), np.geomspace(1000, 2 ** 40, 5000).astype(np.int64)]))
+    previous = -1
+    for value in values.tolist():
+        index = bucket_index(value)
+        upper = bucket_upper(index)
+        assert index >= previous  # 分档随数值单调
+        assert value <= upper <= value + max(value / HALF, 1)  # 分档宽度不超过 1/128
+        previous = index
+
+
+@pytest.mark.parametrize('sigma', [0.5, 2.0])
+def test_percentiles_within_one_percent_of_numpy(sigma):
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(np.log(50_000), sigma, 200_000).astype(np.int64) + 1
+    histogram = Histogram()
+    for value in values.tolist():
+        histogram.record(value)
+
+    expected = np.percentile(values, QS, method='nearest')
+    for q, got, exact in zip(QS, histogram.percentiles(QS), expected):
+        assert got >= exact, q  # 返回分档上界，不低于真实值
+        assert got <= exact * 1.01, q
+    assert histogram.count == len(values)
+    assert histogram.max == values.max() and histogram.min == values.min()
+    assert histogram.mean == pytest.approx(values.mean())
+
+
+def test_small_and_empty_histograms():
+    assert Histogram().percentiles(QS) == [0] * len(QS)
+    histogram = Histogram()
+    for value in (5, 7, 1_000_000):
+        histogram.record(value)
+    assert histogram.percentile(50) == 7
+    assert histogram.percentile(100) == 1_000_000
+    assert histogram.percentile(99.9) <= histogram.max
+
+
+def test_render_and_timed():
+    class Worker:
+        def __init__(self):
+            self.metrics = Metrics(prefix='test')
+
+        @timed('work')
+        def work(self):
+            return 42
+
+    worker = Worker()
+    assert worker.work() == 42
+    metrics = worker.metrics
+    metrics.observe('work', 2_000_000)
+    metrics.inc('errors')
+    metrics.register('depth', lambda: 3)
+    text = metrics.render()
+
+    samples = dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+    assert samples['test_stage_seconds_count{stage="work"}'] == '2'
+    assert float(samples['test_stage_max_seconds{stage="work"}']) == pytest.approx(0.002)
+    assert samples['test_errors_total'] == '1' and samples['test_depth'] == '3'
+    assert '# TYPE test_stage_seconds summary' in text
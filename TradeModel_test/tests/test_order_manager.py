@@ -0,0 +1,99 @@
+import pytest
+from ib_insync import LimitOrder, Order, Stock
+
+from conftest import REPLAY_START, make_bars
+from order_manager import OrderManager
+from sim_broker import SimIB
+
+
+@pytest.fixture
+def broker():
+    """模拟券商（已订阅 AAPL 报价）与订单管理器，先回放一个报价"""
+    ib = SimIB(make_bars(('AAPL',)), start=REPLAY_START, latency=0.05)
+    contract = Stock('AAPL', 'SMART', 'USD')
+    ticker = ib.reqMktData(contract)
+    ib.clock.sleep(80)
+    return ib, OrderManager(ib, ib.clock), contract, ticker.last
+
+
+def test_fill_finishes_once(broker):
+    ib, manager, contract, price = broker
+    done = []
+    trade = manager.place(contract, LimitOrder('BUY', 10, round(price * 1.05, 2)), on_done=done.append, timeout=10)
+    assert manager.in_flight() == 1 and not done
+
+    ib.clock.sleep(1)
+    assert [t.orderStatus.status for t in done] == ['Filled']
+    assert trade.orderStatus.filled == 10 and manager.in_flight() == 0
+    ib.clock.sleep(20)  # 成交后超时句柄已取消，不会撤单或重复回调
+    assert len(done) == 1 and trade.orderStatus.status == 'Filled'
+
+
+def test_timeout_cancels_unfilled_order(broker):
+    ib, manager, contract, price = broker
+    done = []
+    started = ib.clock.time()
+    trade = manager.place(contract, LimitOrder('BUY', 10, round(price * 0.5, 2)), on_done=done.append, timeout=10)
+
+    ib.clock.sleep(9)
+    assert not done and trade.orderStatus.status == 'Submitted'
+    ib.clock.sleep(2)
+    assert [t.orderStatus.status for t in done] == ['Cancelled']
+    assert ib.clock.time() - started >= 10 and manager.in_flight() == 0
+
+
+def test_partial_fill_then_timeout_reports_filled_quantity(broker):
+    ib, manager, contract, price = broker
+    ib.max_fill_per_tick = 3
+    done = []
+    manager.place(contract, LimitOrder('BUY', 10, round(price * 1.05, 2)), on_done=done.append, timeout=10)
+
+    ib.clock.sleep(11)
+    assert len(done) == 1
+    status = done[0].orderStatus
+    assert status.status == 'Cancelled' and status.filled == 3
+
+
+def test_wait_returns_false_on_timeout(broker):
+    ib, manager, contract, price = broker
+    trade = manager.place(contract, LimitOrder('BUY', 10, round(price * 0.5, 2)))
+    assert manager.wait(trade, timeout=5) is False
+    ib.cancelOrder(trade.order)
+    assert manager.wait(trade, timeout=5) is True
+    assert trade.orderStatus.status == 'Cancelled' and manager.in_flight() == 0
+
+
+
+def test_inactive_order_stays_in_flight_until_timeout(broker):
+    ib, manager, contract, price = broker
+    done = []
+    # 模拟券商不支持的订单类型置为 Inactive（如 IB 盘外挂起）：不是终态，超时后撤单
+    trade = manager.place(contract, Order(action='BUY', totalQuantity=10, orderType='MOC'), on_done=done.append,
+                          timeout=10)
+    ib.clock.sleep(1)
+    assert trade.orderStatus.status == 'Inactive'
+    assert not done and manager.get(trade.order.orderId) is trade
+    assert manager.wait(trade, timeout=5) is False
+
+    ib.clock.sleep(10)
+    assert [t.orderStatus.status for t in done] == ['Cancelled'] and manager.in_flight() == 0
+
+
+def test_untransmitted_modification_is_not_applied(broker):
+    ib, manager, contract, price = broker
+    order = LimitOrder('BUY', 10, round(price * 0.5, 2))
+    trade = manager.place(contract, order)
+    ib.clock.sleep(1)
+
+    # transmit=False 的修改与 TWS 一样只保存不生效：仍按原限价撮合，不成交
+    order.lmtPrice = round(price * 1.05, 2)
+    order.transmit = False
+    ib.placeOrder(contract, order)
+    ib.clock.sleep(80)
+    assert ib.untransmitted == [(order.orderId, 'AAPL')]
+    assert trade.orderStatus.filled == 0
+
+    order.transmit = True
+    ib.placeOrder(contract, order)
+    ib.clock.sleep(80)
+    assert trade.orderStatus.status == 'Filled'
@@ -0,0 +1,86 @@
+import asyncio
+
+from ib_insync import Stock
+
+from clock import VirtualClock
+from pacing import PRIORITY_POSITION, PRIORITY_SCAN, HistoricalPacer, TokenBucket
+
+
+class FakeIB:
+    """只记录历史数据请求的发出时间"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.issued = []  # [(时间, symbol, durationStr)]
+
+    async def reqHistoricalDataAsync(self, contract, **params):
+        self.issued.append((self.clock.time(), contract.symbol, params['durationStr']))
+        return contract.symbol
+
+
+def request_all(pacer, clock, requests):
+    """同时排队 [(symbol, priority, duration)]，返回结果列表"""
+    return clock.run(asyncio.gather(*[
+        pacer.request_async(Stock(symbol, 'SMART', 'USD'), priority, durationStr=duration)
+        for symbol, priority, duration in requests
+    ]))
+
+
+def test_token_bucket_returns_tokens_after_period():
+    bucket = TokenBucket(capacity=2, period=10)
+    assert bucket.wait_time(0) == 0
+    bucket.take(0)
+    bucket.take(3)
+    assert bucket.wait_time(5) == 5  # 第一个令牌 t=10 归还
+    assert bucket.wait_time(10) == 0
+    bucket.take(10)
+    assert bucket.wait_time(12) == 1  # t=3 的令牌 t=13 归还
+
+
+def test_global_budget_is_enforced():
+    clock = VirtualClock(1000)
+    ib = FakeIB(clock)
+    pacer = HistoricalPacer(ib, max_requests=4, period=600, clock=clock)
+    results = request_all(pacer, clock, [(f'S{n}', PRIORITY_SCAN, f'{n + 1} D') for n in range(10)])
+
+    assert results == [f'S{n}' for n in range(10)]
+    times = [t for t, _, _ in ib.issued]
+    assert times == [1000] * 4 + [1600] * 4 + [2200] * 2
+    # 任意 600 秒窗口内不超过 4 次
+    assert all(sum(1 for other in times if t <= other < t + 600) <= 4 for t in times)
+    assert pacer.stats()['total_requests'] == 10 and pacer.queue_depth() == 0
+
+
+def test_per_contract_budget_is_enforced():
+    clock = VirtualClock(0)
+    ib = FakeIB(clock)
+    pacer = HistoricalPacer(ib, contract_requests=2, contract_period=2, clock=clock)
+    request_all(pacer, clock, [('AAPL', PRIORITY_SCAN, f'{n + 1} D') for n in range(5)])
+    assert [t for t, _, _ in ib.issued] == [0, 0, 2, 2, 4]
+
+
+def test_positions_are_issued_first():
+    clock = VirtualClock(0)
+    ib = FakeIB(clock)
+    pacer = HistoricalPacer(ib, max_requests=2, period=600, clock=clock)
+    request_all(pacer, clock, [('A', PRIORITY_SCAN, '1 D'), ('B', PRIORITY_SCAN, '1 D'),
+                               ('C', PRIORITY_POSITION, '1 D'), ('D', PRIORITY_POSITION, '1 D')])
+    assert [symbol for _, symbol, _ in ib.issued] == ['C', 'D', 'A', 'B']
+    assert [t for t, _, _ in ib.issued] == [0, 0, 600, 600]
+
+
+def test_identical_requests_are_coalesced():
+    clock = VirtualClock(0)
+    ib = FakeIB(clock)
+    pacer = HistoricalPacer(ib, clock=clock)
+    results = request_all(pacer, clock, [('AAPL', PRIORITY_SCAN, '1 D')] * 3)
+    assert results == ['AAPL'] * 3
+    assert len(ib.issued) == 1 and pacer.coalesced == 2
+
+    # 15 秒内的相同请求复用结果，之后重新发出
+    clock.advance(10)
+    request_all(pacer, clock, [('AAPL', PRIORITY_SCAN, '1 D')])
+    assert len(ib.issued) == 1
+    clock.advance(10)
+    request_all(pacer, clock, [('AAPL', PRIORITY_SCAN, '1 D')])
+    assert len(ib.issued) == 2
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from async_runner import AsyncStrategyRunner
+from ledger import TRADE_DTYPE
+from sim_broker import ReplayFinished
+from tracing import read_traces
+
+
+def check_flushed(strategy):
+    """回放结束：持仓已平、账本与追踪文件已落盘且与内存一致"""
+    assert strategy.positions == {} and strategy.pending_orders == {}
+    assert len(strategy.ledger) > 0
+    records = np.load(os.path.join(strategy.ledger.path, 'tail.npy'))
+    assert records.dtype == TRADE_DTYPE and len(records) == len(strategy.ledger)
+    assert os.path.exists(os.path.join(strategy.ledger.path, 'tables.json'))
+
+    frame = read_traces([strategy.tracer.path])
+    assert strategy.tracer.size == 0
+    decisions = frame.groupby('trace_id').stage.apply(set)
+    sides = frame.groupby('trace_id').side.first()
+    assert (sides == 'SELL').sum() == len(strategy.ledger)
+    assert all('done' in stages for stages in decisions)  # 每个决策的订单都已结束
+
+
+def test_sync_replay_flushes_ledger_and_traces(replay_strategy):
+    replay_strategy.run_strategy()
+    check_flushed(replay_strategy)
+
+
+def test_async_replay_flushes_ledger_and_traces(replay_strategy):
+    runner = AsyncStrategyRunner(replay_strategy)
+    replay_strategy.clock.run(runner.run())  # 回放结束时取消 run，finally 平仓并落盘后正常返回
+    check_flushed(replay_strategy)
+
+
+def test_interrupt_propagates_when_coroutine_does_not_handle_it(replay_strategy):
+    clock = replay_strategy.clock
+    finished = []
+
+    async def wait_forever():
+        try:
+            await clock.sleep_async(10 ** 9)
+        finally:
+            await clock.sleep_async(1)  # finally 中的等待仍由虚拟时钟推动
+            finished.append(clock.time())
+
+    with pytest.raises(ReplayFinished):
+        clock.run(wait_forever())
+    assert finished
+
+
+
+def test_caches_run_on_the_replay_clock(replay_strategy):
+    strategy = replay_strategy
+    strategy.setup_contracts()
+    strategy.start_market_data()
+    now = strategy.clock.time()
+    assert strategy.bar_store.clock is strategy.clock and strategy.contract_cache.clock is strategy.clock
+    assert all(entry['cached_at'] <= now for entry in strategy.contract_cache.entries.values())
+    assert strategy.contract_cache.is_fresh('AAPL')
+    # 回放时间的缺口按虚拟时间计算，而不是按真实时间补齐到今天
+    assert strategy.bar_store.missing_duration('AAPL', '5 mins', 'TRADES', 2 * 86400).endswith(' S')
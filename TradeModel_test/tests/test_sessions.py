@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from clock import VirtualClock
+from conftest import NY_TZ
+from exchange_calendar import ExchangeCalendar
+from sessions import SessionEngine
+
+
+def ts(*args):
+    return NY_TZ.localize(datetime(*args)).timestamp()
+
+
+@pytest.fixture
+def engine():
+    return SessionEngine({}, NY_TZ, ExchangeCalendar(NY_TZ, None))
+
+
+
+@pytest.mark.parametrize('moment, session, boundary', [
+    ((2025, 11, 26, 19, 59), 'after_hours', (2025, 11, 26, 20, 0)),
+    ((2025, 11, 26, 20, 0), 'closed', (2025, 11, 27, 20, 0)),  # 感恩节休市，当晚夜盘属于次日
+    ((2025, 11, 27, 20, 30), 'night', (2025, 11, 28, 4, 0)),
+    ((2025, 11, 28, 12, 59), 'regular', (2025, 11, 28, 13, 0)),  # 半日市 13:00 收盘
+    ((2025, 11, 28, 13, 0), 'after_hours', (2025, 11, 28, 17, 0)),
+    ((2025, 11, 28, 17, 0), 'closed', (2025, 11, 30, 20, 0)),  # 周末后周一的夜盘
+])
+def test_sessions_across_holiday_and_half_day(engine, moment, session, boundary):
+    now = ts(*moment)
+    assert engine.current(now) == session
+    assert engine.seconds_until_change(now) == ts(*boundary) - now
+
+
+def test_change_event_fires_at_boundary():
+    clock = VirtualClock(ts(2025, 11, 28, 12, 0))
+    engine = SessionEngine({}, NY_TZ, ExchangeCalendar(NY_TZ, None), clock)
+    changes = []
+    engine.changeEvent += lambda old, new: changes.append((old, new, clock.time()))
+    engine.start()
+    clock.advance(6 * 3600)
+    engine.stop()
+    assert [(old, new) for old, new, _ in changes] == [('regular', 'after_hours'), ('after_hours', 'closed')]
+    assert changes[0][2] == pytest.approx(ts(2025, 11, 28, 13, 0), abs=0.01)
+
+
+def test_dst_switch(engine):
+    # 2025-03-09 夏令时开始：周一盘前开盘仍是纽约时间 4:00
+    assert engine.current(ts(2025, 3, 10, 3, 59)) == 'night'
+    assert engine.current(ts(2025, 3, 10, 4, 0)) == 'pre_market'
+    assert engine.ny_time(ts(2025, 3, 10, 9, 30)).hour == 9
+
+
+def test_next_day_start_skips_holidays_and_weekends(engine):
+    assert engine.next_day_start(ts(2025, 11, 26, 18)) == ts(2025, 11, 28, 4)
+    assert engine.next_day_start(ts(2025, 11, 28, 5)) == ts(2025, 12, 1, 4)
+    assert engine.next_day_start(ts(2026, 4, 2, 21)) == ts(2026, 4, 6, 4)  # 耶稣受难日
+    assert engine.next_day_start(ts(2025, 3, 4, 3)) == ts(2025, 3, 4, 4)
@@ -0,0 +1,65 @@
+import csv
+
+import numpy as np
+import pytest
+
+from backtest import Backtester, sample_bars
+from conftest import REPLAY_START
+from sweep import (DEFAULT_SPACE, METRICS, ParameterSweep, SharedBars, grid_combos, make_params, random_combos,
+                   signal_key, summarise)
+
+
+@pytest.fixture(scope='module')
+def bars():
+    return sample_bars(4, REPLAY_START - 5 * 86400, REPLAY_START + 5 * 86400, seed=1)
+
+
+def test_make_params_and_signal_key():
+    params = make_params({'regular.profit_target': 0.03, 'max_positions': 5, 'breakout_window': 40})
+    assert params.trading_sessions['regular'] == {'profit_target': 0.03, 'stop_loss_pct': 0.01}
+    assert params.trading_sessions['night']['profit_target'] == 0.03  # 其它时段不变
+    assert params.max_positions == 5
+    assert signal_key(params) != signal_key(make_params({}))
+    assert signal_key(make_params({'max_positions': 1})) == signal_key(make_params({}))  # 仓位参数不影响信号
+
+
+def test_combos():
+    space = {'a': [1, 2], 'b': [3, 4, 5]}
+    assert len(grid_combos(space)) == 6
+    combos = random_combos(DEFAULT_SPACE, 50)
+    assert len({tuple(combo.values()) for combo in combos}) == 50
+    assert random_combos(DEFAULT_SPACE, 50) == combos  # 固定种子
+    assert len(random_combos(space, 100)) == 6  # 不超过组合总数
+
+
+def test_shared_bars_round_trip(bars):
+    shared = SharedBars.create(bars)
+    try:
+        attached = SharedBars.attach(*shared.spec())
+        view = attached.bars()
+        for symbol, columns in bars.items():
+            for name in ('ts', 'high', 'low', 'close'):
+                assert np.array_equal(view[symbol][name], columns[name])
+        del view
+        attached.close()
+    finally:
+        shared.close()
+
+
+def test_parallel_results_match_sequential_backtests(bars, tmp_path):
+    space = {'regular.profit_target': [0.01, 0.02], 'breakout_window': [10, 20], 'max_positions': [1, 3]}
+    combos = grid_combos(space)
+    output = tmp_path / 'sweep.csv'
+    table = ParameterSweep(bars, workers=2, chunk_size=3).run(combos, output=str(output))
+
+    assert len(table) == len(combos)
+    assert list(table.realised) == sorted(table.realised, reverse=True)
+    for combo in combos:
+        _, stats = Backtester(make_params(combo)).run(bars)
+        row = table[(table[list(space)] == list(combo.values())).all(axis=1)].iloc[0]
+        for metric, value in summarise(stats).items():
+            assert row[metric] == pytest.approx(value), (combo, metric)
+
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(combos) and list(rows[0]) == list(space) + list(METRICS)
@@ -0,0 +1,62 @@
+import pytest
+from ib_insync import LimitOrder, Stock
+
+from clock import VirtualClock
+from conftest import REPLAY_START, make_bars
+from order_manager import OrderManager
+from sim_broker import SimIB
+from tracing import TRACE_DTYPE, Tracer, breakdown, read_traces
+
+
+def test_round_trip(tmp_path):
+    clock = VirtualClock(1000)
+    path = tmp_path / 'a.trace'
+    tracer = Tracer(str(path), clock=clock, buffer_size=4)
+    buy, sell = tracer.begin(), tracer.begin()
+    assert buy != sell and buy >> 32 == 1000
+
+    for stage, delay in (('tick', 0), ('signal', 0.001), ('sizing', 0.002), ('submit', 0.003), ('ack', 0.010),
+                         ('fill', 0.020), ('done', 0.021)):
+        tracer.span(buy, stage, 'AAPL', 'BUY', ns=clock.time_ns() + int(delay * 1e9), value=delay)
+    assert path.stat().st_size == 7 * TRACE_DTYPE.itemsize  # 写满缓冲与 done 时落盘
+    tracer.span(sell, 'bar', 'LONGSYMBOL', 'SELL', ns=clock.time_ns(), value=1.5)
+    tracer.span(sell, 'signal', 'LONGSYMBOL', 'SELL', ns=clock.time_ns() + 5_000_000)
+    tracer.close()
+
+    frame = read_traces([str(path)])
+    assert len(frame) == 9
+    first = frame.iloc[0]
+    assert (first.trace_id, first.stage, first.side, first.symbol) == (buy, 'tick', 'BUY', 'AAPL')
+    assert frame.iloc[7].symbol == 'LONGSYMB'  # 代码截断为 8 字节
+    assert list(frame[frame.trace_id == buy].stage) == ['tick', 'signal', 'sizing', 'submit', 'ack', 'fill', 'done']
+
+    table = breakdown(frame, 'buy')
+    assert table.loc['ack', 'p50_ms'] == pytest.approx(7.0)
+    assert table.loc['total', 'max_ms'] == pytest.approx(20.0)
+    assert breakdown(frame, 'sell').loc['signal', 'count'] == 1
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    tracer = Tracer(None, clock=VirtualClock(0))
+    assert tracer.begin() == 0
+    tracer.span(0, 'tick', 'AAPL', 'BUY')
+    tracer.close()
+    assert tracer.size == 0 and not list(tmp_path.iterdir())
+
+
+def test_order_manager_spans(tmp_path):
+    ib = SimIB(make_bars(('AAPL',)), start=REPLAY_START, latency=0.05)
+    contract = Stock('AAPL', 'SMART', 'USD')
+    ticker = ib.reqMktData(contract)
+    ib.clock.sleep(80)
+    tracer = Tracer(str(tmp_path / 'orders.trace'), clock=ib.clock)
+    manager = OrderManager(ib, ib.clock, tracer=tracer)
+
+    trace = tracer.begin()
+    manager.place(contract, LimitOrder('BUY', 10, round(ticker.last * 1.05, 2)), trace=trace)
+    ib.clock.sleep(1)
+    frame = read_traces([tracer.path])
+    assert list(frame.stage) == ['submit', 'ack', 'fill', 'done']
+    assert frame.iloc[-1].value == 10  # done 记录成交数量
+    times = frame.set_index('stage').ns
+    assert times['ack'] - times['submit'] == pytest.approx(50_000_000, abs=1000)  # 券商延迟 0.05 秒
@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+from ledger import TradeStats
+
+DAY = date(2025, 3, 4)
+MINUTE = 60 * 10 ** 9
+
+
+def test_win_rate_drawdown_and_buckets():
+    stats = TradeStats(account_value=1000)
+    for symbol, pnl in (('AAPL', 30.0), ('MSFT', -50.0), ('SPY', 10.0), ('AAPL', -5.0)):
+        stats.on_open(symbol, 10, 100.0)
+        stats.on_close(symbol, 'regular', DAY, pnl, 10 * MINUTE)
+    assert stats.count == 4 and stats.wins == 2 and stats.win_rate == 50.0
+    assert stats.realised == pytest.approx(-15.0)
+    assert stats.max_drawdown == pytest.approx(50.0)
+    assert stats.max_drawdown_pct == pytest.approx(50.0 / 1030 * 100)
+    assert stats.avg_hold_seconds == 600
+    assert stats.sessions == {'regular': [4, -15.0, 2]}
+    assert stats.day(DAY) == (4, -15.0, 2) and stats.day(date(2025, 3, 5)) == (0, 0.0, 0)
+    assert stats.open_cost == {}
+
+
+def test_partial_exits_count_as_one_trade():
+    """分三次卖出的一笔持仓只计一次交易，胜负按整笔盈亏"""
+    stats = TradeStats()
+    stats.on_open('AAPL', 30, 100.0)
+    stats.on_close('AAPL', 'regular', DAY, 20.0, 5 * MINUTE, remaining=20)
+    assert stats.count == 0 and stats.open_cost == {'AAPL': (20, 100.0)}
+    assert stats.unrealised(lambda symbol: 101.0) == pytest.approx(20.0)
+    stats.on_close('AAPL', 'regular', DAY, -15.0, 8 * MINUTE, remaining=10)
+    stats.on_close('AAPL', 'regular', DAY, -10.0, 10 * MINUTE)
+
+    assert stats.count == 1 and stats.wins == 0  # 整笔 -5
+    assert stats.realised == pytest.approx(-5.0)
+    assert stats.max_drawdown == pytest.approx(25.0)  # 已实现盈亏曲线按每次成交更新
+    assert stats.avg_hold_seconds == 600
+    assert stats.sessions == {'regular': [1, -5.0, 0]}
+    assert stats.open_cost == {} and stats.closing == {}
+
+    # 与 on_close 整笔记录一次结果一致
+    whole = TradeStats()
+    whole.on_close('AAPL', 'regular', DAY, -5.0, 10 * MINUTE)
+    assert (whole.count, whole.wins, whole.realised, whole.sessions) == \
+        (stats.count, stats.wins, stats.realised, stats.sessions)
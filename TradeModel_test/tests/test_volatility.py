@@ -0,0 +1,30 @@
+from pacing import HistoricalPacer
+
+
+def test_background_refresh_puts_positions_first(replay_strategy):
+    strategy = replay_strategy
+    strategy.setup_contracts()
+    clock = strategy.clock
+    # 10 分钟 2 次：3 个标的需要两个窗口
+    strategy.volatility.pacer = HistoricalPacer(strategy.ib, max_requests=2, period=600, clock=clock)
+    issued = []
+    request = strategy.ib.reqHistoricalDataAsync
+
+    async def record(contract, **params):
+        issued.append((clock.time(), contract.symbol))
+        return await request(contract, **params)
+
+    strategy.ib.reqHistoricalDataAsync = record
+    strategy.positions['SPY'] = None
+    started = clock.time()
+
+    assert strategy.get_historical_volatility('AAPL') == 0.3  # 不阻塞，计算完成前返回默认值
+    assert clock.time() == started
+    clock.sleep(700)
+
+    assert [symbol for _, symbol in issued] == ['SPY', 'AAPL', 'MSFT']
+    assert issued[-1][0] - issued[0][0] >= 600
+    assert not strategy.volatility.is_stale()
+    assert strategy.get_historical_volatility('AAPL') != 0.3
+    assert strategy.volatility.valid_until == strategy.session_engine.next_day_start(started)
+    assert strategy.volatility.pacer.queue_depth() == 0
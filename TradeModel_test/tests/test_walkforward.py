@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import walkforward
+from backtest import Backtester, sample_bars, slice_prepared
+from conftest import REPLAY_START
+from sweep import grid_combos, make_params, summarise
+
+DAY = 86400
+
+
+def test_make_windows():
+    grid = np.arange(0, 10 * DAY, 3600)
+    windows = walkforward.make_windows(grid, train_days=4, test_days=2)
+    assert [tuple(int(grid[i]) // DAY if i < len(grid) else 10 for i in window) for window in windows] == \
+        [(0, 4, 6), (2, 6, 8), (4, 8, 10)]
+    assert walkforward.make_windows(grid, train_days=20, test_days=2) == []
+
+
+def test_walk_forward_selects_best_training_combo_and_tests_it_out_of_sample():
+    bars = sample_bars(4, REPLAY_START - 2 * DAY, REPLAY_START + 16 * DAY, seed=2)
+    combos = grid_combos({'regular.profit_target': [0.01, 0.02], 'breakout_window': [10, 20],
+                          'max_positions': [1, 3]})
+    runner = walkforward.WalkForward(bars, train_days=6, test_days=3, workers=2, min_trades=1)
+    table, trades, equity = runner.run(combos)
+
+    grid = np.unique(np.concatenate([columns['ts'] for columns in bars.values()]))
+    windows = walkforward.make_windows(grid, 6, 3)
+    assert list(table.window) == list(range(len(windows))) and len(windows) >= 3
+
+    # 与顺序计算一致：训练窗口上按总盈亏选出最优组合，测试窗口为样本外结果
+    prepared = [Backtester(make_params(combo)).prepare(bars) for combo in combos]
+    for row in table.to_dict('records'):
+        train_start, test_start, test_end = windows[row['window']]
+        train = [summarise(Backtester(make_params(combo)).simulate(
+            slice_prepared(prepared[i], train_start, test_start))[1]) for i, combo in enumerate(combos)]
+        assert row['train_realised'] == pytest.approx(max(metrics['realised'] for metrics in train))
+        chosen = next(i for i, combo in enumerate(combos) if all(row[key] == value for key, value in combo.items()))
+        assert train[chosen]['realised'] == pytest.approx(row['train_realised'])
+        _, stats = Backtester(make_params(combos[chosen])).simulate(
+            slice_prepared(prepared[chosen], test_start, test_end))
+        assert row['test_trades'] == stats.count and row['test_realised'] == pytest.approx(stats.realised)
+
+    # 样本外成交都在测试窗口内，权益曲线终值等于总盈亏
+    first_test = grid[windows[0][1]]
+    assert (trades.entry_time.astype('int64') // 10 ** 9 >= first_test).all()
+    assert len(trades) == table.test_trades.sum()
+    assert equity.total.iloc[-1] == pytest.approx(trades.pnl.sum())
+    assert set(equity.columns) - {'total'} == set(trades.session)
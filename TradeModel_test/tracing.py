@@ -0,0 +1,139 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from clock import WALL_CLOCK
+
+logger = logging.getLogger()
+
+# 追踪记录：定长 34 字节，追加写入（numpy 结构化数组的原始字节，无文件头，可直接 np.fromfile 读取）
+TRACE_DTYPE = np.dtype([
+    ('trace_id', np.uint64),
+    ('ns', np.int64),  # 单调时钟纳秒（进程内可比，不是 UTC 时间）
+    ('stage', np.uint8),
+    ('side', np.uint8),
+    ('symbol', 'S8'),
+    ('value', np.float64)  # 触发/成交价格，仓位/订单/成交数量
+])
+
+# 阶段按发生顺序编号：触发行情（报价或K线）-> 信号 -> 仓位 -> 提交 -> 券商确认 -> 成交 -> 订单结束
+STAGES = {'tick': 1, 'bar': 2, 'signal': 3, 'sizing': 4, 'submit': 5, 'ack': 6, 'fill': 7, 'done': 8}
+STAGE_NAMES = {code: name for name, code in STAGES.items()}
+SIDES = {'BUY': 1, 'SELL': 2}
+
+
+class Tracer:
+    """交易决策追踪 - 每个决策一个 trace_id，各阶段一条记录（阶段即 span），缓冲后追加写入二进制文件"""
+
+    def __init__(self, path=None, clock=None, buffer_size=256):
+        self.path = path  # 追踪文件，None 不记录
+        self.clock = clock or WALL_CLOCK
+        self.buffer = np.zeros(buffer_size, dtype=TRACE_DTYPE)
+        self.size = 0
+        self.file = None
+        self.next_id = int(self.clock.time()) << 32  # 高 32 位为启动时间，重启后 ID 不重复
+
+    def now(self):
+        return self.clock.monotonic_ns()
+
+    def begin(self):
+        """新建追踪，返回 trace_id（不记录时返回 0，之后的 span 直接忽略）"""
+        if self.path is None:
+            return 0
+        self.next_id += 1
+        return self.next_id
+
+    def span(self, trace_id, stage, symbol, side, ns=None, value=0.0):
+        """记录一个阶段；ns 为空取当前时间，订单结束时立即落盘"""
+        if not trace_id:
+            return
+        self.buffer[self.size] = (trace_id, self.now() if ns is None else ns, STAGES[stage], SIDES.get(side, 0),
+                                  symbol.encode()[:8], value)
+        self.size += 1
+        if self.size == len(self.buffer) or stage == 'done':
+            self.flush()
+
+    def flush(self):
+        if self.size == 0 or self.path is None:
+            return
+        try:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self.file = open(self.path, 'ab')
+            self.file.write(self.buffer[:self.size].tobytes())
+            self.file.flush()
+        except Exception as e:
+            logger.error(f"写入追踪记录失败: {e}")
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# ---------- 查询 ----------
+
+def read_traces(paths):
+    """读取一个或多个追踪文件，返回 DataFrame（stage/side 为名称）"""
+    records = np.concatenate([np.fromfile(path, dtype=TRACE_DTYPE) for path in paths])
+    frame = pd.DataFrame({
+        'trace_id': records['trace_id'],
+        'ns': records['ns'],
+        'stage': [STAGE_NAMES.get(code, str(code)) for code in records['stage']],
+        'side': np.where(records['side'] == SIDES['SELL'], 'SELL', 'BUY'),
+        'symbol': np.char.decode(records['symbol']),
+        'value': records['value']
+    })
+    return frame
+
+
+def stage_times(frame):
+    """每个追踪各阶段的首次时间（行：trace_id，列：阶段），触发行情合并为 trigger 列"""
+    times = frame.pivot_table(index='trace_id', columns='stage', values='ns', aggfunc='min')
+    trigger = times.reindex(columns=['tick', 'bar']).min(axis=1)
+    order = ['signal', 'sizing', 'submit', 'ack', 'fill', 'done']
+    times = times.reindex(columns=order)
+    times.insert(0, 'trigger', trigger)
+    return times
+
+
+def breakdown(frame, side=None):
+    """各阶段耗时分位数（毫秒）：每一段为相邻两个已记录阶段的间隔，total 为触发到首次成交"""
+    if side:
+        frame = frame[frame['side'] == side.upper()]
+    times = stage_times(frame)
+    rows = {}
+    previous = times['trigger']
+    for stage in times.columns[1:]:
+        current = times[stage]
+        rows[stage] = (current - previous) / 1e6
+        previous = current.fillna(previous)
+    rows['total'] = (times['fill'] - times['trigger']) / 1e6
+    table = {}
+    for stage, delays in rows.items():
+        delays = delays.dropna().to_numpy()
+        if len(delays) == 0:
+            continue
+        p50, p90, p99 = np.percentile(delays, [50, 90, 99])
+        table[stage] = {'count': len(delays), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+                        'max_ms': delays.max()}
+    return pd.DataFrame.from_dict(table, orient='index')
+
+
+if __name__ == "__main__":
+    # 查询：python tracing.py traces/*.trace [--side buy]
+    parser = argparse.ArgumentParser(description='交易决策追踪：各阶段耗时分位数')
+    parser.add_argument('paths', nargs='+', help='追踪文件')
+    parser.add_argument('--side', choices=['buy', 'sell'], help='只统计买入或卖出决策')
+    args = parser.parse_args()
+
+    traces = read_traces(args.paths)
+    if args.side:
+        traces = traces[traces['side'] == args.side.upper()]
+    print(f"{traces['trace_id'].nunique()} 个决策, {len(traces)} 条记录")
+    print(breakdown(traces).to_string(float_format=lambda value: f"{value:.3f}"))
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+from ib_insync import util
+
+from clock import WALL_CLOCK
+from pacing import PRIORITY_SCAN
+
+logger = logging.getLogger()
+
+TRADING_DAYS = 252
+NY_TZ = pytz.timezone('America/New_York')
+
+
+def next_session_start(now, hour=4):
+    """下一个 4:00（美东盘前开盘）的时间戳，不考虑周末/假日（没有时段引擎时使用）"""
+    ny_now = datetime.fromtimestamp(now, NY_TZ)
+    start = NY_TZ.localize(datetime(ny_now.year, ny_now.month, ny_now.day, hour))
+    if start.timestamp() <= now:
+        next_day = ny_now.date() + timedelta(days=1)
+        start = NY_TZ.localize(datetime(next_day.year, next_day.month, next_day.day, hour))
+    return start.timestamp()
+
+
+def close_to_close(closes):
+    """收盘价收益率标准差年化（closes: 标的 x 日，右对齐，缺失为 NaN）"""
+    returns = np.diff(closes, axis=1) / closes[:, :-1]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 无数据的行结果为 NaN
+        return np.nanstd(returns, axis=1) * np.sqrt(TRADING_DAYS)
+
+
+def parkinson(highs, lows):
+    """Parkinson 波动率：基于最高/最低价"""
+    log_hl = np.log(highs / lows)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.sqrt(np.nanmean(log_hl ** 2, axis=1) / (4 * np.log(2)) * TRADING_DAYS)
+
+
+def garman_klass(opens, highs, lows, closes):
+    """Garman-Klass 波动率：基于开高低收"""
+    log_hl = np.log(highs / lows)
+    log_co = np.log(closes / opens)
+    variance = 0.5 * log_hl ** 2 - (2 * np.log(2) - 1) * log_co ** 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.sqrt(np.maximum(np.nanmean(variance, axis=1), 0) * TRADING_DAYS)
+
+
+class VolatilityService:
+    """每日波动率服务 - 每个交易日加载一次全部标的日线，向量化计算后缓存到下一个交易日"""
+
+    def __init__(self, bar_store, pacer, days=20, default=0.3, clock=None, sessions=None):
+        self.bar_store = bar_store
+        self.pacer = pacer
+        self.days = days  # 使用最近 days 根日线
+        self.default = default  # 数据不足时的默认波动率
+        self.index = {}  # {symbol: 行号}
+        self.estimates = {}  # {'close': 数组, 'parkinson': 数组, 'garman_klass': 数组}
+        self.valid_until = 0.0
+        self.clock = clock or WALL_CLOCK
+        self.task = None  # 后台刷新任务
+        self.sessions = sessions  # SessionEngine，按交易日历确定下一个交易日开盘；None 则按每天 4:00
+
+    def is_stale(self, now=None):
+        return (self.clock.time() if now is None else now) >= self.valid_until
+
+    async def load_matrix_async(self, contracts, now=None, priorities=None):
+        """读取全部标的最近 days 根日线，返回 (symbols, opens, highs, lows, closes) 矩阵
+
+        缺失的日线同时排队补齐，priorities {symbol: 优先级} 未列出的按扫描优先级（持仓标的先发出）
+        """
+        symbols = list(contracts)
+        priorities = priorities or {}
+        results = await asyncio.gather(*[
+            self.bar_store.sync_async(self.pacer, symbol, contracts[symbol], '1 day',
+                                      lookback_seconds=self.days * 2 * 86400,
+                                      priority=priorities.get(symbol, PRIORITY_SCAN), now=now)
+            for symbol in symbols
+        ])
+        shape = (len(symbols), self.days)
+        matrices = {name: np.full(shape, np.nan) for name in ('open', 'high', 'low', 'close')}
+        for i, columns in enumerate(results):
+            n = min(len(columns['close']), self.days)
+            if n == 0:
+                continue
+            for name, matrix in matrices.items():
+                matrix[i, self.days - n:] = columns[name][-n:]
+        return symbols, matrices['open'], matrices['high'], matrices['low'], matrices['close']
+
+    async def refresh_async(self, contracts, now=None, priorities=None):
+        """重新加载日线并计算全部波动率，缓存到下一个交易日开始"""
+        now = self.clock.time() if now is None else now
+        try:
+            symbols, opens, highs, lows, closes = await self.load_matrix_async(contracts, now, priorities)
+            self.index = {symbol: i for i, symbol in enumerate(symbols)}
+            enough = np.sum(~np.isnan(closes), axis=1) > 1
+            self.estimates = {
+                'close': np.where(enough, close_to_close(closes), np.nan),
+                'parkinson': np.where(enough, parkinson(highs, lows), np.nan),
+                'garman_klass': np.where(enough, garman_klass(opens, highs, lows, closes), np.nan)
+            }
+            if self.sessions is not None:
+                self.valid_until = self.sessions.next_day_start(now)
+            else:
+                self.valid_until = next_session_start(now)
+            logger.info(f"波动率已更新: {len(symbols)} 个标的")
+        except Exception as e:
+            logger.error(f"更新波动率失败: {e}")
+
+    def refresh(self, contracts, now=None, priorities=None):
+        """refresh_async 的同步版本（等待全部日线补齐）"""
+        return self.clock.run(self.refresh_async(contracts, now, priorities))
+
+    def refresh_background(self, contracts, priorities=None):
+        """在事件循环上后台刷新（刷新中不重复发起），完成前 get 返回上一次的结果或默认值"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.refresh_async(contracts, priorities=priorities),
+                                              loop=util.getLoop())
+        return self.task
+
+    def get(self, symbol, kind='close'):
+        """查询年化波动率，kind 可选 close / parkinson / garman_klass"""
+        i = self.index.get(symbol)
+        if i is None:
+            return self.default
+        value = self.estimates[kind][i]
+        return self.default if np.isnan(value) else float(value)
@@ -0,0 +1,146 @@
+import logging
+import math
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from backtest import NY_TZ, BacktestParams, sample_bars, slice_prepared
+from sweep import (DEFAULT_SPACE, METRICS, SharedBars, init_worker, make_params, random_combos, signal_key,
+                   summarise, worker_backtest)
+
+logger = logging.getLogger()
+
+
+def make_windows(grid, train_days, test_days, step_days=None):
+    """滚动窗口 [(训练开始, 训练结束即测试开始, 测试结束)]，均为 grid 序号；最后一个测试窗口可能不足 test_days"""
+    step = (step_days or test_days) * 86400
+    windows = []
+    start = grid[0]
+    while True:
+        test_start = start + train_days * 86400
+        if test_start > grid[-1]:
+            break
+        test_end = test_start + test_days * 86400
+        bounds = np.searchsorted(grid, [start, test_start, test_end])
+        windows.append(tuple(int(i) for i in bounds))
+        if test_end > grid[-1]:
+            break
+        start += step
+    return windows
+
+
+def score_chunk(task):
+    """工作进程：一批组合在每个训练窗口上的表现（信号矩阵在全部历史上只算一次，各窗口截取复用）"""
+    combos, windows = task
+    rows = []
+    for combo_id, combo in combos:
+        backtester, prepared = worker_backtest(combo)
+        for window, (train_start, test_start, _) in enumerate(windows):
+            _, stats = backtester.simulate(slice_prepared(prepared, train_start, test_start))
+            rows.append(dict(summarise(stats), window=window, combo_id=combo_id))
+    return rows
+
+
+def test_window(task):
+    """工作进程：选中的组合在测试窗口上的样本外结果，返回 (窗口, 指标, 成交表)"""
+    window, combo, (_, test_start, test_end) = task
+    backtester, prepared = worker_backtest(combo)
+    ledger, stats = backtester.simulate(slice_prepared(prepared, test_start, test_end))
+    trades = ledger.to_frame()
+    trades['window'] = window
+    return window, summarise(stats), trades
+
+
+class WalkForward:
+    """滚动前推优化 - 每个训练窗口选出最优参数，在随后的测试窗口上样本外评估，拼接样本外权益曲线"""
+
+    def __init__(self, bars, train_days=28, test_days=7, step_days=None, base=None, workers=None,
+                 objective='realised', min_trades=10):
+        self.bars = bars
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days  # 窗口前推步长，默认等于 test_days（测试窗口首尾相接）
+        self.base = base or BacktestParams()
+        self.workers = workers or os.cpu_count() or 1
+        self.objective = objective  # 训练窗口的优化目标（METRICS 之一，越大越好）
+        self.min_trades = min_trades  # 训练窗口交易次数少于该值的组合不参与选择
+
+    def select(self, scores):
+        """每个窗口按优化目标选出最优组合 {window: (combo_id, 训练指标)}"""
+        chosen = {}
+        for window, group in scores.groupby('window'):
+            eligible = group[group['trades'] >= self.min_trades]
+            if eligible.empty:
+                eligible = group
+            best = eligible.loc[eligible[self.objective].idxmax()]
+            chosen[window] = (int(best['combo_id']), {metric: best[metric] for metric in METRICS})
+        return chosen
+
+    def run(self, combos):
+        """返回 (窗口表, 样本外成交表, 样本外权益曲线)"""
+        started = time.perf_counter()
+        grid = np.unique(np.concatenate([self.bars[symbol]['ts'] for symbol in self.bars]))
+        windows = make_windows(grid, self.train_days, self.test_days, self.step_days)
+        if not windows:
+            raise ValueError(f"历史数据不足 {self.train_days + self.test_days} 天，无法划分窗口")
+
+        indexed = sorted(enumerate(combos), key=lambda item: signal_key(make_params(item[1], self.base)))
+        size = max(1, min(64, math.ceil(len(indexed) / (self.workers * 8))))
+        tasks = [(indexed[i:i + size], windows) for i in range(0, len(indexed), size)]
+
+        shared = SharedBars.create(self.bars)
+        try:
+            with multiprocessing.Pool(self.workers, initializer=init_worker,
+                                      initargs=(shared.spec(), self.base)) as pool:
+                rows = [row for chunk_rows in pool.imap_unordered(score_chunk, tasks) for row in chunk_rows]
+                chosen = self.select(pd.DataFrame(rows))
+                test_tasks = sorted(((window, combos[combo_id], windows[window])
+                                     for window, (combo_id, _) in chosen.items()),
+                                    key=lambda task: signal_key(make_params(task[1], self.base)))
+                results = pool.map(test_window, test_tasks, chunksize=1)
+        finally:
+            shared.close()
+
+        table = []
+        for window, test_metrics, _ in sorted(results, key=lambda result: result[0]):
+            train_start, test_start, test_end = windows[window]
+            combo_id, train_metrics = chosen[window]
+            row = {
+                'window': window,
+                'train_start': datetime.fromtimestamp(grid[train_start], NY_TZ),
+                'test_start': datetime.fromtimestamp(grid[test_start], NY_TZ),
+                'test_end': datetime.fromtimestamp(grid[test_end - 1], NY_TZ),
+            }
+            row.update(combos[combo_id])
+            row.update({f'train_{metric}': value for metric, value in train_metrics.items()})
+            row.update({f'test_{metric}': value for metric, value in test_metrics.items()})
+            table.append(row)
+
+        trades = pd.concat([result[2] for result in results], ignore_index=True)
+        trades = trades.sort_values('exit_time', ignore_index=True)
+        logger.info(f"滚动前推完成: {len(windows)} 个窗口 x {len(combos)} 个组合, "
+                    f"样本外 {len(trades)} 笔交易, 耗时 {time.perf_counter() - started:.2f}秒")
+        return pd.DataFrame(table), trades, self.equity_curves(trades)
+
+    @staticmethod
+    def equity_curves(trades):
+        """样本外累计盈亏：total 为全部，其余列按时段"""
+        if trades.empty:
+            return pd.DataFrame(columns=['total'])
+        by_session = trades.pivot_table(index='exit_time', columns='session', values='pnl', aggfunc='sum')
+        equity = by_session.fillna(0.0).cumsum()
+        equity.columns.name = None
+        equity.insert(0, 'total', equity.sum(axis=1))
+        return equity
+
+
+if __name__ == "__main__":
+    # 自检：随机游走生成一年 5 分钟K线（20 个标的，全时段），4 周训练 / 1 周测试，每窗口 200 组参数
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    windows, trades, equity = WalkForward(sample_bars(20)).run(random_combos(DEFAULT_SPACE, 200))
+    print(windows[['window', 'test_start', 'train_realised', 'test_realised', 'test_trades']].to_string())
+    print(equity.iloc[-1])
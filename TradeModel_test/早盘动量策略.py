@@ -1,9 +1,25 @@
 from ib_insync import *
 import pandas as pd
-import time
+import os
 from datetime import datetime, time as dt_time, timedelta
 import logging
 import pytz
+from quote_board import QuoteBoard
+from market_data import MarketDataRegistry
+from bar_manager import BarManager
+from indicators import TimeframeSignal
+from batch_signals import BarMatrix, evaluate_watchlist, required_window
+from pacing import HistoricalPacer, PRIORITY_POSITION
+from bar_store import BarStore
+from volatility import VolatilityService
+from contract_cache import ContractCache
+from order_manager import OrderManager
+from ledger import Position, TradeLedger, TradeStats
+from sessions import SessionEngine
+from exchange_calendar import ExchangeCalendar
+from clock import WALL_CLOCK
+from metrics import Metrics, timed
+from tracing import Tracer
 
 # 设置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,12 +27,26 @@ logger = logging.getLogger()
 
 
 class AllDayTradingStrategy:
-    def __init__(self, ib_instance, account_value=10000):
+    def __init__(self, ib_instance, account_value=10000, watchlist_file=None, clock=None):
         self.ib = ib_instance
+        # 时钟 - 读取时间与等待都经过时钟；实盘为系统时间，回放时传入 VirtualClock 按事件跳跃运行
+        self.clock = clock or WALL_CLOCK
         self.account_value = account_value
         self.risk_per_trade = 0.01  # 单笔风险1%
         self.max_positions = 3  # 最大持仓数量
-        self.positions = {}  # 当前持仓 {symbol: {entry_price, stop_loss, quantity, contract}}
+        self.positions = {}  # 当前持仓 {symbol: Position}
+        self.pending_orders = {}  # 在途订单 {symbol: Trade}
+        self.order_timeout = 10  # 买入限价单超时撤单（秒）
+        self.exit_timeout = 15  # 平仓单超时撤单后按剩余数量重新提交（秒）
+        self.exit_retries = 3  # 连续重新提交次数，用完后由下一轮扫描重新检查出场
+        self.exit_limit_offset = 0.002  # 盘外平仓限价低于现价的比例，每次重新提交再让一次
+        # 决策追踪 - 触发行情 -> 信号 -> 仓位 -> 提交 -> 确认 -> 成交，共享 trace_id，追加写入二进制文件
+        self.tracer = Tracer(os.path.join('traces', datetime.now().strftime('%Y%m%d_%H%M%S') + '.trace'),
+                             clock=self.clock)
+        self.order_manager = OrderManager(self.ib, self.clock, tracer=self.tracer)
+        # 括号单：入场限价单附带交易所端止盈限价单 + 止损单（OCA），出场不再依赖轮询
+        self.use_bracket_orders = False
+        self.bracket_stop_type = 'STP'  # 'STP' 行情推送时修改止损价（移动止损）/ 'TRAIL' 交易所跟踪止损
 
         # 交易参数 - 根据不同时段调整
         self.trading_sessions = {
@@ -37,6 +67,13 @@ class AllDayTradingStrategy:
         # 时区设置
         self.ny_tz = pytz.timezone('America/New_York')
         self.local_tz = pytz.timezone('Asia/Shanghai')  # 根据您的位置调整
+        # 交易日历 - 周末/假日/半日市，缓存一年，合约交易时间覆盖
+        self.calendar = ExchangeCalendar(self.ny_tz, 'calendar_cache.json')
+        self.calendar.ensure(datetime.fromtimestamp(self.clock.time(), self.ny_tz).date())
+        # 时段引擎 - 预计算时段边界，边界到达时回调（持仓时段结束立即平仓）
+        self.session_engine = SessionEngine(self.session_times, self.ny_tz, self.calendar, self.clock)
+        self.session_engine.changeEvent += self.on_session_change
+        self.session_engine.start()
 
         # 监控列表 - 包含不同波动性的标的
         self.watchlist = [
@@ -44,30 +81,88 @@ class AllDayTradingStrategy:
             'SPY', 'QQQ', 'IWM',  # ETF
             'UVXY', 'SQQQ', 'TQQQ'  # 高波动ETF
         ]
+        if watchlist_file:
+            self.watchlist = self.load_watchlist(watchlist_file)
         self.contracts = {}
+        # 合约缓存 - conId/主交易所/最小价位/交易时间持久化，过期后台重新验证
+        self.contract_cache = ContractCache('contract_cache.json', ttl=7 * 86400, clock=self.clock)
+
+        # 行情订阅登记表 - 去重并按引用计数释放行情线
+        self.market_data = MarketDataRegistry(self.ib)
+        # 行情看板 - 常驻订阅，报价超过60秒未更新视为过期
+        self.quote_board = QuoteBoard(self.ib, self.market_data, max_age=60, clock=self.clock)
+
+        # 运行指标 - 各阶段耗时直方图与计数器，Prometheus 格式导出（metrics_port 为 None 不启动）
+        self.metrics = Metrics()
+        self.metrics_port = 9108
+
+        # 历史数据请求统一经过调度器限流（IB pacing 规则）
+        self.pacer = HistoricalPacer(self.ib, clock=self.clock, metrics=self.metrics)
+        # 本地K线库 - 重启后只补齐缺失的尾部数据
+        self.bar_store = BarStore('bar_store', clock=self.clock)
+        # 日波动率 - 每个交易日向量化计算一次全部标的，按交易日历在下一个交易日开盘时过期
+        self.volatility = VolatilityService(self.bar_store, self.pacer, days=20, clock=self.clock,
+                                            sessions=self.session_engine)
+
+        # 多周期K线 - 回填一次后由 keepUpToDate 增量更新
+        self.timeframes = ['5 mins', '15 mins', '1 hour']
+        self.bar_manager = BarManager(self.ib, self.pacer, self.bar_store, duration='2 D', clock=self.clock)
+        # 信号参数 - 逐个标的的流式指标与批量扫描共用
+        self.signal_params = {'breakout_window': 20, 'rsi_window': 14, 'rsi_low': 30, 'rsi_high': 70}
+        self.signal_states = {}  # {(symbol, timeframe): TimeframeSignal} 流式指标状态
+        self.bar_matrices = {}  # {timeframe: BarMatrix} 全部标的对齐K线矩阵，用于批量扫描
+
+        # 性能统计 - 成交记录写入结构化数组账本，写满的块落盘
+        self.ledger = TradeLedger(os.path.join('ledger', datetime.now().strftime('%Y%m%d_%H%M%S')))
+        # 运行中统计 - 每次成交增量更新，状态输出直接读取
+        self.stats = TradeStats(account_value)
+
+        # 行情推送时调整括号单的移动止损
+        self.ib.pendingTickersEvent += self.on_pending_tickers
+        self.register_metrics()
+
+    def register_metrics(self):
+        """导出时读取的状态值：订阅数量、在途订单、历史请求限流"""
+        register = self.metrics.register
+        register('market_data_lines', self.market_data.active_lines)
+        register('bar_subscriptions', lambda: len(self.bar_manager.series))
+        register('orders_in_flight', self.order_manager.in_flight)
+        register('positions', lambda: len(self.positions))
+        register('pacing_queue_depth', self.pacer.queue_depth)
+        register('pacing_waits', lambda: self.pacer.pacing_waits, kind='counter')
+        register('history_requests', lambda: self.pacer.total_requests, kind='counter')
+        register('history_coalesced', lambda: self.pacer.coalesced, kind='counter')
+        register('market_data_requests', lambda: self.market_data.total_requests, kind='counter')
+
+    def start_metrics_server(self):
+        """启动 Prometheus 指标导出（失败不影响交易）"""
+        if self.metrics_port is None:
+            return
+        try:
+            self.clock.run(self.metrics.start(self.metrics_port))
+        except Exception as e:
+            logger.error(f"启动指标导出失败: {e}")
 
-        # 性能统计
-        self.trade_history = []
+    @staticmethod
+    def load_watchlist(csv_path):
+        """从CSV读取监控列表（Symbol 列，去重保序）"""
+        symbols = pd.read_csv(csv_path)['Symbol'].dropna().astype(str).str.strip()
+        return list(dict.fromkeys(symbols))
 
     def get_current_ny_time(self):
-        """获取当前纽约时间"""
-        utc_now = pytz.utc.localize(datetime.utcnow())
-        ny_time = utc_now.astimezone(self.ny_tz)
-        return ny_time
+        """获取当前纽约时间（UTC 偏移缓存）"""
+        return self.session_engine.ny_time()
 
     def get_current_session(self):
-        """获取当前交易时段"""
-        ny_time = self.get_current_ny_time()
-        current_time = ny_time.time()
-
-        for session, (start, end) in self.session_times.items():
-            if session != 'night':
-                if start <= current_time < end:
-                    return session
-            else:  # 夜盘特殊处理（跨天）
-                if current_time >= start or current_time < end:
-                    return session
-        return 'closed'
+        """获取当前交易时段（与缓存的下一时段边界比较）"""
+        return self.session_engine.current()
+
+    def on_session_change(self, old_session, new_session):
+        """时段切换回调：上一时段的持仓立即平仓"""
+        logger.info(f"交易时段切换: {old_session} -> {new_session}")
+        for symbol, position in list(self.positions.items()):
+            if position.session != new_session:
+                self.place_sell_order(symbol, f"时段结束 ({position.session} -> {new_session})")
 
     def is_trading_hours(self):
         """检查是否在交易时间内"""
@@ -80,20 +175,44 @@ class AllDayTradingStrategy:
         return self.trading_sessions.get(session, {'profit_target': 0.02, 'stop_loss_pct': 0.015})
 
     def setup_contracts(self):
-        """设置合约详情"""
+        """设置合约详情（缓存命中直接使用，缺失的分批并发验证）"""
         logger.info("设置合约...")
+        try:
+            self.contracts = self.contract_cache.qualify(self.ib, self.watchlist)
+        except Exception as e:
+            logger.error(f"设置合约失败: {e}")
         for symbol in self.watchlist:
-            try:
-                contract = Stock(symbol, 'SMART', 'USD')
-                # 验证合约
-                details = self.ib.reqContractDetails(contract)
-                if details:
-                    self.contracts[symbol] = contract
-                    logger.info(f"合约验证成功: {symbol}")
-                else:
-                    logger.warning(f"合约验证失败: {symbol}")
-            except Exception as e:
-                logger.error(f"设置合约失败 {symbol}: {e}")
+            if symbol not in self.contracts:
+                logger.warning(f"合约验证失败: {symbol}")
+        logger.info(f"合约验证成功: {len(self.contracts)}/{len(self.watchlist)}")
+        self.update_calendar()
+
+    def update_calendar(self, reference='SPY'):
+        """用参考合约的 tradingHours/liquidHours 覆盖交易日历（IB 提供未来约一周）"""
+        entry = self.contract_cache.get(reference)
+        if entry is None and self.contracts:
+            entry = self.contract_cache.get(next(iter(self.contracts)))
+        if not entry or not entry.get('tradingHours'):
+            return
+        try:
+            self.calendar.overlay_ib(entry['tradingHours'], entry['liquidHours'])
+            self.session_engine.reset()
+        except Exception as e:
+            logger.error(f"更新交易日历失败: {e}")
+
+    def start_market_data(self):
+        """订阅行情与多周期K线"""
+        # 一次性订阅全部合约行情，之后由事件推送更新
+        self.quote_board.subscribe(self.contracts)
+        # 回填并订阅多周期K线，扫描时不再请求历史数据
+        self.bar_manager.subscribe_all(self.contracts, self.timeframes)
+        self.build_bar_matrices()
+        self.clock.sleep(2)  # 等待首批报价
+
+    def build_bar_matrices(self):
+        """按已验证合约建立批量扫描用的K线矩阵"""
+        window = required_window(self.signal_params['breakout_window'], self.signal_params['rsi_window'])
+        self.bar_matrices = {timeframe: BarMatrix(self.contracts, window) for timeframe in self.timeframes}
 
     def calculate_position_size(self, entry_price, stop_loss_price):
         """根据风险计算仓位大小"""
@@ -115,55 +234,32 @@ class AllDayTradingStrategy:
             logger.error(f"计算仓位失败: {e}")
             return 0
 
+    @timed('quote')
     def get_current_price(self, symbol):
-        """获取当前价格"""
+        """获取当前价格（读取行情看板缓存，不阻塞）"""
         try:
-            if symbol in self.contracts:
-                contract = self.contracts[symbol]
-                ticker = self.ib.reqMktData(contract, '', False, False)
-                self.ib.sleep(1)  # 等待数据更新
-
-                # 优先使用最后成交价，如果没有则使用中间价
-                if ticker.last > 0:
-                    return ticker.last
-                elif ticker.bid > 0 and ticker.ask > 0:
-                    return (ticker.bid + ticker.ask) / 2
-                else:
-                    return 0
+            price = self.quote_board.get_price(symbol)
+            if price <= 0:
+                self.metrics.inc('quote_misses')  # 无报价或报价过期
+            return price
         except Exception as e:
             logger.error(f"获取价格失败 {symbol}: {e}")
         return 0
 
-    def get_historical_volatility(self, symbol, days=20):
-        """计算历史波动率"""
+    def get_historical_volatility(self, symbol, kind='close'):
+        """获取年化波动率（每个交易日后台批量计算一次，之后直接查表；计算完成前返回上一次结果或默认值）"""
         try:
-            contract = self.contracts[symbol]
-            bars = self.ib.reqHistoricalData(
-                contract,
-                endDateTime='',
-                durationStr=f'{days} D',
-                barSizeSetting='1 day',
-                whatToShow='TRADES',
-                useRTH=False,
-                formatDate=1
-            )
-
-            if len(bars) > 1:
-                closes = [bar.close for bar in bars]
-                returns = []
-                for i in range(1, len(closes)):
-                    daily_return = (closes[i] - closes[i - 1]) / closes[i - 1]
-                    returns.append(daily_return)
-
-                import numpy as np
-                volatility = np.std(returns) * np.sqrt(252)  # 年化波动率
-                return volatility
-
+            if self.volatility.is_stale():
+                # 持仓标的的日线优先补齐
+                priorities = {held: PRIORITY_POSITION for held in self.positions}
+                self.volatility.refresh_background(self.contracts, priorities)
+            return self.volatility.get(symbol, kind)
         except Exception as e:
             logger.error(f"计算波动率失败 {symbol}: {e}")
 
         return 0.3  # 默认波动率
 
+    @timed('signal')
     def generate_trading_signals(self, symbol):
         """生成交易信号 - 多策略组合"""
         try:
@@ -171,49 +267,17 @@ class AllDayTradingStrategy:
             if current_price <= 0:
                 return False, 0, 0
 
-            # 获取不同时间周期的数据
-            timeframes = ['5 mins', '15 mins', '1 hour']
+            # 获取不同时间周期的数据（本地实时K线，无网络请求）
             signals = []
 
-            for timeframe in timeframes:
-                contract = self.contracts[symbol]
-                bars = self.ib.reqHistoricalData(
-                    contract,
-                    endDateTime='',
-                    durationStr='2 D',
-                    barSizeSetting=timeframe,
-                    whatToShow='TRADES',
-                    useRTH=False,
-                    formatDate=1
-                )
-
-                if len(bars) > 20:
-                    df = util.df(bars)
-
-                    # 策略1: 突破策略
-                    resistance = df['high'].iloc[-20:-1].max()
-                    support = df['low'].iloc[-20:-1].min()
-
-                    if current_price > resistance:
-                        signals.append(1)  # 做多信号
-                    elif current_price < support:
-                        signals.append(-1)  # 做空信号
-                    else:
-                        signals.append(0)  # 无信号
-
-                    # 策略2: 均值回归（RSI）
-                    if len(df) > 14:
-                        delta = df['close'].diff()
-                        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-                        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-                        rs = gain / loss
-                        rsi = 100 - (100 / (1 + rs))
-
-                        current_rsi = rsi.iloc[-1]
-                        if current_rsi < 30:
-                            signals.append(1)  # 超卖，做多
-                        elif current_rsi > 70:
-                            signals.append(-1)  # 超买，做空
+            for timeframe in self.timeframes:
+                bars = self.bar_manager.get_bars(symbol, timeframe)
+
+                # 策略1: 突破策略（前19根K线高低点）+ 策略2: 均值回归（RSI）
+                state = self.signal_states.get((symbol, timeframe))
+                if state is None:
+                    state = self.signal_states[(symbol, timeframe)] = TimeframeSignal(**self.signal_params)
+                signals.extend(state.votes(bars, current_price))
 
             # 综合信号
             if signals.count(1) > signals.count(-1):
@@ -226,8 +290,26 @@ class AllDayTradingStrategy:
 
         return False, 0, 0
 
-    def place_buy_order(self, symbol, quantity, price):
-        """下买入订单"""
+    @timed('scan')
+    def scan_candidates(self):
+        """向量化扫描全部监控标的，返回按信号强度排序的候选表"""
+        for timeframe, matrix in self.bar_matrices.items():
+            matrix.refresh(self.bar_manager, timeframe)
+        symbols = next(iter(self.bar_matrices.values())).symbols
+        prices = [self.get_current_price(symbol) for symbol in symbols]
+        return evaluate_watchlist(self.bar_matrices, prices, **self.signal_params)
+
+    def round_price(self, symbol, price):
+        """按合约最小价位取整（缓存无 minTick 时按 0.01）"""
+        entry = self.contract_cache.get(symbol) or {}
+        tick = entry.get('minTick') or 0.01
+        return round(round(price / tick) * tick, 8)
+
+    @timed('buy_order')
+    def place_buy_order(self, symbol, quantity, price, trace=0):
+        """下买入订单（不阻塞：成交/超时撤单由订单管理器回调 on_buy_done）"""
+        if self.use_bracket_orders:
+            return self.place_bracket_order(symbol, quantity, price, trace)
         try:
             contract = self.contracts[symbol]
             current_session = self.get_current_session()
@@ -240,57 +322,208 @@ class AllDayTradingStrategy:
 
             order.transmit = True
 
-            trade = self.ib.placeOrder(contract, order)
+            trade = self.order_manager.place(
+                contract, order,
+                on_done=lambda trade: self.on_buy_done(symbol, trade, current_session),
+                timeout=self.order_timeout,
+                trace=trace
+            )
+            if not self.order_manager.is_done(trade):
+                self.pending_orders[symbol] = trade
             logger.info(f"提交订单: {symbol}, 数量: {quantity}, 价格: {order.lmtPrice}")
+            return True
 
-            # 等待订单状态更新
-            for i in range(10):
-                if trade.orderStatus.status in ['Filled', 'Cancelled', 'ApiCancelled']:
-                    break
-                self.ib.sleep(1)
+        except Exception as e:
+            logger.error(f"下单失败 {symbol}: {e}")
+            return False
 
-            if trade.orderStatus.status == 'Filled':
-                fill_price = float(trade.orderStatus.avgFillPrice)
-                session_params = self.get_session_params()
-                stop_loss_price = fill_price * (1 - session_params['stop_loss_pct'])
-
-                # 记录持仓
-                self.positions[symbol] = {
-                    'entry_price': fill_price,
-                    'stop_loss': stop_loss_price,
-                    'quantity': quantity,
-                    'contract': contract,
-                    'entry_time': self.get_current_ny_time(),
-                    'session': current_session,
-                    'profit_target': session_params['profit_target']
-                }
-
-                logger.info(f"订单成交: {symbol}, 数量: {quantity}, 价格: {fill_price:.2f}")
-                return True
-            else:
-                self.ib.cancelOrder(order)
-                logger.warning(f"订单未成交: {symbol}, 状态: {trade.orderStatus.status}")
-                return False
+    def place_bracket_order(self, symbol, quantity, price, trace=0):
+        """下括号单：入场限价单 + 止盈限价单 + 止损单，止盈/止损同一 OCA 组，由交易所端执行"""
+        try:
+            contract = self.contracts[symbol]
+            current_session = self.get_current_session()
+            session_params = self.get_session_params()
+
+            markup = 1.001 if current_session == 'regular' else 1.002
+            limit_price = self.round_price(symbol, price * markup)
+            take_profit = self.round_price(symbol, limit_price * (1 + session_params['profit_target']))
+            stop_loss = self.round_price(symbol, limit_price * (1 - session_params['stop_loss_pct']))
+
+            parent, take_profit_order, stop_order = self.ib.bracketOrder(
+                'BUY', quantity, limit_price, take_profit, stop_loss)
+            oca_group = f"bracket_{symbol}_{parent.orderId}"
+            for child in (take_profit_order, stop_order):
+                child.ocaGroup = oca_group
+                child.ocaType = 1  # 一单成交，其余撤单
+            if self.bracket_stop_type == 'TRAIL':
+                stop_order.orderType = 'TRAIL'
+                stop_order.auxPrice = util.UNSET_DOUBLE
+                stop_order.trailingPercent = session_params['stop_loss_pct'] * 100
+                stop_order.trailStopPrice = stop_loss
+            for order in (parent, take_profit_order, stop_order):
+                order.outsideRth = current_session != 'regular'  # 非主流时段止盈止损也要触发
+
+            # 子单交易在父单成交回调时填入持仓
+            bracket = {'oca_group': oca_group, 'take_profit': None, 'stop': None}
+            trade = self.order_manager.place(
+                contract, parent,
+                on_done=lambda trade: self.on_buy_done(symbol, trade, current_session, bracket),
+                timeout=self.order_timeout,
+                trace=trace
+            )
+            # 父单超时撤单时 IB 会一并撤销子单
+            bracket['take_profit'] = self.order_manager.place(
+                contract, take_profit_order,
+                on_done=lambda trade: self.on_bracket_exit(symbol, trade, '止盈'))
+            bracket['stop'] = self.order_manager.place(
+                contract, stop_order,
+                on_done=lambda trade: self.on_bracket_exit(symbol, trade, '止损'))
+            if not self.order_manager.is_done(trade):
+                self.pending_orders[symbol] = trade
+            logger.info(f"提交括号单: {symbol}, 数量: {quantity}, 价格: {limit_price}, "
+                        f"止盈: {take_profit}, 止损: {stop_loss}")
+            return True
 
         except Exception as e:
             logger.error(f"下单失败 {symbol}: {e}")
             return False
 
-    def check_exit_conditions(self, symbol):
-        """检查出场条件"""
-        if symbol not in self.positions:
+    def on_buy_done(self, symbol, trade, current_session, bracket=None):
+        """买入订单结束回调：成交（含超时撤单前的部分成交）记录持仓"""
+        self.pending_orders.pop(symbol, None)
+        filled = int(trade.orderStatus.filled)
+        if filled <= 0:
+            logger.warning(f"订单未成交: {symbol}, 状态: {trade.orderStatus.status}")
             return
 
+        fill_price = float(trade.orderStatus.avgFillPrice)
+        session_params = self.get_session_params()
+        stop_loss_price = fill_price * (1 - session_params['stop_loss_pct'])
+
+        # 记录持仓
+        self.positions[symbol] = Position(symbol, fill_price, stop_loss_price, filled, self.clock.time_ns(),
+                                          current_session, session_params['profit_target'])
+        if bracket is not None:
+            self.positions[symbol].bracket = bracket
+            self.adjust_bracket(symbol, fill_price, filled)
+        self.stats.on_open(symbol, filled, fill_price)
+
+        logger.info(f"订单成交: {symbol}, 数量: {filled}, 价格: {fill_price:.2f}")
+
+    def adjust_bracket(self, symbol, fill_price, filled):
+        """按实际成交价/成交量修改括号单子单（部分成交时缩减子单数量）"""
         position = self.positions[symbol]
-        current_price = self.get_current_price(symbol)
+        bracket = position.bracket
+        if not self.check_bracket_alive(symbol):
+            return
+        take_profit = self.round_price(symbol, fill_price * (1 + position.profit_target))
+        stop_loss = self.round_price(symbol, position.stop_loss)
+        position.stop_loss = stop_loss
+
+        take_profit_trade = bracket['take_profit']
+        if not self.order_manager.is_done(take_profit_trade):
+            order = take_profit_trade.order
+            if order.lmtPrice != take_profit or order.totalQuantity != filled:
+                order.lmtPrice = take_profit
+                order.totalQuantity = filled
+                self.modify_order(symbol, order)
+
+        stop_trade = bracket['stop']
+        if not self.order_manager.is_done(stop_trade):
+            order = stop_trade.order
+            changed = order.totalQuantity != filled
+            order.totalQuantity = filled
+            if order.orderType == 'STP' and order.auxPrice != stop_loss:
+                order.auxPrice = stop_loss
+                changed = True
+            if changed:
+                self.modify_order(symbol, order)
+
+    def modify_order(self, symbol, order):
+        """修改已提交的订单：括号单子单创建时 transmit=False，不改为 True 时 TWS 只保存修改、不发送到交易所"""
+        order.transmit = True
+        self.ib.placeOrder(self.contracts[symbol], order)
+
+    def on_pending_tickers(self, tickers):
+        """行情推送：括号单持仓盈利1%后上移止损单（修改订单，交易所端执行）"""
+        if not self.use_bracket_orders or self.bracket_stop_type != 'STP':
+            return
+        for ticker in tickers:
+            symbol = ticker.contract.symbol
+            position = self.positions.get(symbol)
+            if position is None or position.bracket is None:
+                continue
+            try:
+                self.update_bracket_stop(symbol, position)
+            except Exception as e:
+                logger.error(f"修改止损单失败 {symbol}: {e}")
 
+    def update_bracket_stop(self, symbol, position):
+        """移动止损：盈利超过1%后止损价上移到保留0.5%利润，只在提高至少一个价位时修改订单"""
+        current_price = self.get_current_price(symbol)
         if current_price <= 0:
             return
+        entry_price = position.entry_price
+        current_pnl_pct = (current_price - entry_price) / entry_price
+        if current_pnl_pct < 0.01:
+            return
+
+        new_stop = self.round_price(symbol, entry_price * (1 + current_pnl_pct - 0.005))
+        if new_stop <= position.stop_loss:
+            return
+        stop_trade = position.bracket['stop']
+        if self.order_manager.is_done(stop_trade):
+            return
+        position.stop_loss = new_stop
+        position.trailing = True
+        stop_trade.order.auxPrice = new_stop
+        self.modify_order(symbol, stop_trade.order)
+
+    def check_bracket_alive(self, symbol):
+        """子单均已撤销/拒绝且未成交时（如父单部分成交后撤单），持仓改回客户端监控出场"""
+        position = self.positions[symbol]
+        children = (position.bracket['take_profit'], position.bracket['stop'])
+        if all(self.order_manager.is_done(child) and child.orderStatus.status != 'Filled'
+               for child in children):
+            position.bracket = None
+            logger.warning(f"括号单子单已失效，改为客户端监控出场: {symbol}")
+            return False
+        return True
+
+    def on_bracket_exit(self, symbol, trade, reason):
+        """括号单子单结束回调：成交即平仓（同组另一子单由 OCA 撤销，撤单忽略）"""
+        if symbol not in self.positions or self.positions[symbol].bracket is None:
+            return
+        if trade.orderStatus.status != 'Filled':
+            self.check_bracket_alive(symbol)
+            return
+        position = self.positions[symbol]
+        if reason == '止损' and position.trailing:
+            reason = '移动止损'
+        entry_price = position.entry_price
+        pnl_pct = (float(trade.orderStatus.avgFillPrice) - entry_price) / entry_price
+        self.on_sell_done(symbol, trade, f"{reason} ({pnl_pct * 100:.1f}%)")
+
+    def get_exit_reason(self, symbol):
+        """检查出场条件，返回出场原因（无需出场返回 None），同时更新移动止损"""
+        if symbol not in self.positions:
+            return None
+
+        position = self.positions[symbol]
 
-        entry_price = position['entry_price']
+        # 括号单持仓的止盈/止损/移动止损在交易所端执行，这里只检查时段结束
+        if position.bracket is not None:
+            return self.get_session_exit_reason(position)
+
+        current_price = self.get_current_price(symbol)
+
+        if current_price <= 0:
+            return None
+
+        entry_price = position.entry_price
         current_pnl_pct = (current_price - entry_price) / entry_price
-        stop_loss_price = position['stop_loss']
-        profit_target = position['profit_target']
+        stop_loss_price = position.stop_loss
+        profit_target = position.profit_target
 
         exit_reason = None
 
@@ -306,71 +539,124 @@ class AllDayTradingStrategy:
         elif current_pnl_pct >= 0.01:  # 盈利1%后启动移动止损
             new_stop = entry_price * (1 + current_pnl_pct - 0.005)  # 保留0.5%利润
             if new_stop > stop_loss_price:
-                position['stop_loss'] = new_stop
+                position.stop_loss = new_stop
 
         # 条件4: 时段结束平仓（特别是盘前盘后）
+        return self.get_session_exit_reason(position) or exit_reason
+
+    def get_session_exit_reason(self, position):
+        """持仓所在时段已结束时返回出场原因"""
         current_session = self.get_current_session()
-        if position['session'] != current_session:
-            exit_reason = f"时段结束 ({position['session']} -> {current_session})"
+        if position.session != current_session:
+            return f"时段结束 ({position.session} -> {current_session})"
+        return None
+
+    def check_exit_conditions(self, symbol):
+        """检查出场条件"""
+        if symbol in self.pending_orders:
+            return  # 平仓单在途
+
+        exit_reason = self.get_exit_reason(symbol)
 
         # 执行出场
         if exit_reason:
             self.place_sell_order(symbol, exit_reason)
 
-    def place_sell_order(self, symbol, reason):
-        """下卖出订单"""
+    @timed('sell_order')
+    def place_sell_order(self, symbol, reason, attempt=0):
+        """下卖出订单（不阻塞：结束后由订单管理器回调 on_sell_done）
+
+        盘中用市价单；盘外 IB 不执行市价单，改用可立即成交的限价单。exit_timeout 秒未结束则撤单重新提交
+        """
+        if symbol in self.pending_orders:
+            return
         try:
             position = self.positions[symbol]
-            contract = position['contract']
-            quantity = position['quantity']
-
             current_price = self.get_current_price(symbol)
-            if current_price <= 0:
-                current_price = position['entry_price']  # 使用入场价作为保底
+            trace = self.trace_decision(symbol, 'SELL', self.tracer.now(), current_price)
 
-            # 使用市价单确保成交
-            order = MarketOrder('SELL', quantity)
+            if self.get_current_session() == 'regular' or current_price <= 0:
+                order = MarketOrder('SELL', position.quantity)
+            else:
+                # 低于现价挂单确保成交，每次重新提交再让一次
+                discount = self.exit_limit_offset * (attempt + 1)
+                order = LimitOrder('SELL', position.quantity, self.round_price(symbol, current_price * (1 - discount)))
+                order.outsideRth = True
             order.transmit = True
-
-            trade = self.ib.placeOrder(contract, order)
-
-            # 等待成交
-            for i in range(10):
-                if trade.orderStatus.status in ['Filled', 'Cancelled', 'ApiCancelled']:
-                    break
-                self.ib.sleep(1)
-
-            if trade.orderStatus.status == 'Filled':
-                fill_price = float(trade.orderStatus.avgFillPrice)
-                entry_price = position['entry_price']
-                pnl = (fill_price - entry_price) * quantity
-                pnl_pct = (fill_price - entry_price) / entry_price * 100
-
-                # 记录交易历史
-                trade_record = {
-                    'symbol': symbol,
-                    'entry_price': entry_price,
-                    'exit_price': fill_price,
-                    'quantity': quantity,
-                    'pnl': pnl,
-                    'pnl_pct': pnl_pct,
-                    'entry_time': position['entry_time'],
-                    'exit_time': self.get_current_ny_time(),
-                    'reason': reason,
-                    'session': position['session']
-                }
-                self.trade_history.append(trade_record)
-
-                logger.info(f"平仓 {symbol} | 原因: {reason} | "
-                            f"入场: {entry_price:.2f} | 出场: {fill_price:.2f} | "
-                            f"盈亏: ${pnl:.2f} ({pnl_pct:.2f}%)")
-
-                # 移除持仓
-                del self.positions[symbol]
+            if position.bracket is not None and self.check_bracket_alive(symbol):
+                # 加入括号单的 OCA 组：平仓单成交后 IB 撤销止盈/止损子单，子单先成交则撤销平仓单
+                order.ocaGroup = position.bracket['oca_group']
+                order.ocaType = 1
+
+            trade = self.order_manager.place(
+                self.contracts[symbol], order,
+                on_done=lambda trade: self.on_sell_done(symbol, trade, reason, attempt),
+                timeout=self.exit_timeout,
+                trace=trace
+            )
+            if not self.order_manager.is_done(trade):
+                self.pending_orders[symbol] = trade
 
         except Exception as e:
             logger.error(f"平仓失败 {symbol}: {e}")
 
+    def on_sell_done(self, symbol, trade, reason, attempt=None):
+        """卖出订单结束回调：成交部分记录交易历史并减少持仓；平仓单未全部成交（超时撤单/拒绝）时重新提交剩余数量
+
+        attempt 为 None 表示括号单子单，不重新提交
+        """
+        self.pending_orders.pop(symbol, None)
+        if symbol not in self.positions:
+            return  # 已由括号单子单平仓
+        filled = int(trade.orderStatus.filled)
+        if filled > 0:
+            self.record_exit(symbol, filled, float(trade.orderStatus.avgFillPrice), reason)
+        if symbol not in self.positions:
+            return
+
+        logger.warning(f"平仓未成交: {symbol}, 状态: {trade.orderStatus.status}, "
+                       f"剩余: {self.positions[symbol].quantity}")
+        if attempt is None or self.bracket_filled(symbol):
+            return
+        if attempt < self.exit_retries:
+            self.place_sell_order(symbol, reason, attempt + 1)
+        else:
+            logger.error(f"平仓重试次数用完: {symbol}，下一轮扫描重新检查")
+
+    def bracket_filled(self, symbol):
+        """括号单子单已有成交（平仓单因 OCA 被撤销），由子单回调平仓"""
+        bracket = self.positions[symbol].bracket
+        return bracket is not None and any(
+            child is not None and child.orderStatus.filled > 0 for child in (bracket['take_profit'], bracket['stop']))
+
+    def record_exit(self, symbol, quantity, fill_price, reason):
+        """记录平仓成交（可为部分数量），全部卖出后移除持仓"""
+        position = self.positions[symbol]
+        quantity = min(quantity, position.quantity)
+        entry_price = position.entry_price
+        pnl = (fill_price - entry_price) * quantity
+        pnl_pct = (fill_price - entry_price) / entry_price * 100
+
+        # 记录交易历史
+        exit_ns = self.clock.time_ns()
+        self.ledger.append(symbol, position.session, reason, quantity, entry_price, fill_price,
+                           position.entry_ns, exit_ns)
+        position.quantity -= quantity
+        self.stats.on_close(symbol, position.session, self.get_current_ny_time().date(), pnl,
+                            exit_ns - position.entry_ns, remaining=position.quantity)
+
+        logger.info(f"平仓 {symbol} | 原因: {reason} | 数量: {quantity} | "
+                    f"入场: {entry_price:.2f} | 出场: {fill_price:.2f} | "
+                    f"盈亏: ${pnl:.2f} ({pnl_pct:.2f}%)")
+
+        if position.quantity <= 0:
+            del self.positions[symbol]
+
+    def close_all_positions(self, reason):
+        """全部持仓提交平仓单"""
+        for symbol in list(self.positions.keys()):
+            self.place_sell_order(symbol, reason)
+
     def print_status(self):
         """打印当前状态"""
         current_ny_time = self.get_current_ny_time()
@@ -380,31 +666,119 @@ class AllDayTradingStrategy:
         status_msg += f"纽约时间: {current_ny_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
         status_msg += f"交易时段: {current_session}\n"
         status_msg += f"当前持仓: {len(self.positions)}/{self.max_positions}\n"
-
+        status_msg += f"行情线: {self.market_data.active_lines()}, 在途订单: {self.order_manager.in_flight()}\n"
+        pacing = self.pacer.stats()
+        status_msg += (f"历史请求: {pacing['total_requests']}次, 排队: {pacing['queue_depth']}, "
+                       f"平均等待: {pacing['avg_wait']:.1f}秒, 合并: {pacing['coalesced']}\n")
+        if self.metrics.histograms:
+            status_msg += f"阶段耗时:\n{self.metrics.summary()}\n"
+
+        # 持仓盈亏只读行情看板缓存，不阻塞交易循环
         if self.positions:
             status_msg += "持仓详情:\n"
-            total_pnl = 0
             for symbol, position in self.positions.items():
                 current_price = self.get_current_price(symbol)
                 if current_price > 0:
-                    pnl = (current_price - position['entry_price']) * position['quantity']
-                    pnl_pct = (current_price - position['entry_price']) / position['entry_price'] * 100
-                    total_pnl += pnl
-                    status_msg += f"  {symbol}: {position['quantity']}股, 成本: {position['entry_price']:.2f}, 现价: {current_price:.2f}, 盈亏: ${pnl:.2f} ({pnl_pct:.2f}%)\n"
-
-        if self.trade_history:
-            today_trades = [t for t in self.trade_history
-                            if t['exit_time'].date() == current_ny_time.date()]
-            if today_trades:
-                today_pnl = sum(t['pnl'] for t in today_trades)
-                status_msg += f"今日交易: {len(today_trades)}笔, 总盈亏: ${today_pnl:.2f}\n"
+                    pnl = (current_price - position.entry_price) * position.quantity
+                    pnl_pct = (current_price - position.entry_price) / position.entry_price * 100
+                    status_msg += f"  {symbol}: {position.quantity}股, 成本: {position.entry_price:.2f}, 现价: {current_price:.2f}, 盈亏: ${pnl:.2f} ({pnl_pct:.2f}%)\n"
+            status_msg += f"未实现盈亏: ${self.stats.unrealised(self.get_current_price):.2f}\n"
+
+        stats = self.stats
+        if stats.count:
+            today_count, today_pnl, _ = stats.day(current_ny_time.date())
+            if today_count:
+                status_msg += f"今日交易: {today_count}笔, 总盈亏: ${today_pnl:.2f}\n"
+            status_msg += (f"已实现盈亏: ${stats.realised:.2f}, 胜率: {stats.win_rate:.1f}%, "
+                           f"最大回撤: ${stats.max_drawdown:.2f}, 平均持仓: {stats.avg_hold_seconds / 60:.1f}分钟\n")
 
         logger.info(status_msg)
 
+    def find_entry(self):
+        """选出本轮扫描排名最高的新开仓机会，返回 (symbol, quantity, entry_price, trace_id) 或 None"""
+        open_symbols = self.positions.keys() | self.pending_orders.keys()  # 持仓 + 在途买单
+        if len(open_symbols) >= self.max_positions or not self.bar_matrices:
+            return None
+
+        candidates = self.scan_candidates()
+        signal_ns = self.tracer.now()
+        for candidate in candidates.itertuples():
+            symbol = candidate.symbol
+            if symbol in open_symbols:
+                continue
+
+            entry_price = candidate.price
+            session_params = self.get_session_params()
+            stop_loss_price = entry_price * (1 - session_params['stop_loss_pct'])
+            logger.info(f"发现交易信号: {symbol} | 建议入场: {entry_price:.2f} | "
+                        f"投票: +{candidate.long_votes}/-{candidate.short_votes}")
+
+            quantity = self.calculate_position_size(entry_price, stop_loss_price)
+            if quantity > 0:
+                trace = self.trace_decision(symbol, 'BUY', signal_ns, entry_price)
+                self.tracer.span(trace, 'sizing', symbol, 'BUY', value=quantity)
+                return symbol, quantity, entry_price, trace
+            return None  # 一次只建立一个新头寸
+        return None
+
+    @timed('iteration')
+    def scan_once(self):
+        """一轮扫描：检查现有持仓的出场条件，再寻找新交易机会"""
+        for symbol in list(self.positions.keys()):
+            self.check_exit_conditions(symbol)
+
+        # 寻找新交易机会（整个监控列表一次向量化计算）
+        entry = self.find_entry()
+        if entry:
+            self.place_buy_order(*entry)
+
+    def trace_decision(self, symbol, side, signal_ns, price):
+        """新建决策追踪：记录触发行情（最近到达的报价或K线推送）与信号时间，返回 trace_id"""
+        trace = self.tracer.begin()
+        if trace:
+            tick_ns = self.quote_board.received_ns.get(symbol)
+            bar_ns = self.bar_manager.updated_ns.get(symbol)
+            if bar_ns is not None and (tick_ns is None or bar_ns > tick_ns):
+                self.tracer.span(trace, 'bar', symbol, side, ns=bar_ns, value=price)
+            elif tick_ns is not None:
+                self.tracer.span(trace, 'tick', symbol, side, ns=tick_ns, value=price)
+            self.tracer.span(trace, 'signal', symbol, side, ns=signal_ns, value=price)
+        return trace
+
+    def shutdown(self):
+        """释放行情/K线订阅并打印最终统计"""
+        self.session_engine.stop()
+        self.metrics.stop()
+        self.quote_board.unsubscribe_all()
+        self.bar_manager.unsubscribe_all()
+        self.market_data.release_all()
+        # 断开事件回调，复用的 IB 实例不再调用已停止的策略
+        self.ib.pendingTickersEvent -= self.on_pending_tickers
+        self.order_manager.close()
+
+        # 打印最终统计
+        self.ledger.flush()
+        self.tracer.close()
+        stats = self.stats
+        if stats.count:
+            sessions = "".join(f"  {session}: {count}笔, 盈亏: ${pnl:.2f}, 胜率: {wins / count * 100:.1f}%\n"
+                               for session, (count, pnl, wins) in stats.sessions.items())
+
+            logger.info(f"\n=== 最终统计 ===\n"
+                        f"总交易次数: {stats.count}\n"
+                        f"胜率: {stats.win_rate:.1f}%\n"
+                        f"总盈亏: ${stats.realised:.2f}\n"
+                        f"最大回撤: ${stats.max_drawdown:.2f} ({stats.max_drawdown_pct:.2f}%)\n"
+                        f"平均持仓: {stats.avg_hold_seconds / 60:.1f}分钟\n"
+                        f"分时段:\n{sessions}"
+                        f"最终账户: ${self.account_value + stats.realised:.2f}")
+
     def run_strategy(self):
         """运行主策略"""
         logger.info("启动全时段交易策略...")
         self.setup_contracts()
+        self.start_market_data()
+        self.start_metrics_server()
 
         status_counter = 0
 
@@ -415,10 +789,11 @@ class AllDayTradingStrategy:
                 if not self.is_trading_hours():
                     if self.positions:
                         logger.info("非交易时间，平仓所有头寸")
-                        for symbol in list(self.positions.keys()):
-                            self.place_sell_order(symbol, "非交易时间平仓")
-                    logger.info(f"市场关闭，当前时段: {current_session}，等待...")
-                    time.sleep(60)
+                        self.close_all_positions("非交易时间平仓")
+                    # 休市（含周末/假日）直接等到下一次开盘
+                    wait = self.session_engine.seconds_until_change()
+                    logger.info(f"市场关闭，当前时段: {current_session}，等待 {wait / 3600:.1f} 小时至下一次开盘...")
+                    self.clock.sleep(wait)
                     continue
 
                 # 每30秒打印一次状态
@@ -427,29 +802,10 @@ class AllDayTradingStrategy:
                     self.print_status()
                     status_counter = 0
 
-                # 检查现有持仓的出场条件
-                for symbol in list(self.positions.keys()):
-                    self.check_exit_conditions(symbol)
+                self.scan_once()
 
-                # 寻找新交易机会
-                if len(self.positions) < self.max_positions:
-                    for symbol in self.watchlist:
-                        if symbol not in self.positions:
-                            has_signal, entry_price, stop_loss_price = self.generate_trading_signals(symbol)
-
-                            if has_signal:
-                                logger.info(f"发现交易信号: {symbol} | 建议入场: {entry_price:.2f}")
-
-                                quantity = self.calculate_position_size(entry_price, stop_loss_price)
-
-                                if quantity > 0:
-                                    success = self.place_buy_order(symbol, quantity, entry_price)
-                                    if success:
-                                        time.sleep(2)  # 等待订单处理
-                                break  # 一次只建立一个新头寸
-
-                # 等待一段时间再扫描
-                time.sleep(10)
+                # 等待一段时间再扫描（等待期间事件循环继续处理行情推送）
+                self.clock.sleep(10)
 
         except KeyboardInterrupt:
             logger.info("策略被用户中断")
@@ -459,20 +815,11 @@ class AllDayTradingStrategy:
             # 平仓所有头寸
             if self.positions:
                 logger.info("平仓所有头寸...")
-                for symbol in list(self.positions.keys()):
-                    self.place_sell_order(symbol, "策略结束")
-
-            # 打印最终统计
-            if self.trade_history:
-                total_pnl = sum(t['pnl'] for t in self.trade_history)
-                win_trades = [t for t in self.trade_history if t['pnl'] > 0]
-                win_rate = len(win_trades) / len(self.trade_history) * 100 if self.trade_history else 0
-
-                logger.info(f"\n=== 最终统计 ===\n"
-                            f"总交易次数: {len(self.trade_history)}\n"
-                            f"胜率: {win_rate:.1f}%\n"
-                            f"总盈亏: ${total_pnl:.2f}\n"
-                            f"最终账户: ${self.account_value + total_pnl:.2f}")
+                self.close_all_positions("策略结束")
+            # 等待在途订单结束（买单超时撤单、平仓单成交）
+            self.order_manager.wait_all(timeout=30)
+
+            self.shutdown()
 
             logger.info("策略停止")
 